@@ -0,0 +1,90 @@
+// Decodificador de los formatos compactos de conexionMQTT (ver Codigos/Python/ConexionDB/codificador.py)
+// Para usarse en un nodo "function" de Node-RED conectado a los temas capstone_energia/datosPotencia y capstone_energia/datosEnergia.
+// Convierte el mensaje al mismo arreglo de objetos {"x","y"} del formato JSON, que es el que reciben las graficas.
+// Para el formato BINARIO_Z agregar el modulo "zlib" en la pestana "Setup" del nodo (Node-RED >= 1.3).
+// Por Fernando Daniel Ramirez
+
+// Las fechas se envian en segundos contados desde 1970-01-01 con la hora local de la base de datos,
+// por eso se formatean con los metodos UTC: asi el texto coincide con la fecha guardada
+function fechaTexto(segundos) {
+    return new Date(segundos * 1000).toISOString().substring(0, 19).replace("T", " ");
+}
+
+// Reconstruye las fechas a partir de la fecha inicial y el paso fijo o las diferencias
+function fechas(t0, paso, dt, n) {
+    var lista = [];
+    var t = t0;
+    for (var i = 0; i < n; i++) {
+        if (i > 0) {
+            t += (paso !== null) ? paso : dt[i - 1];
+        }
+        lista.push(t);
+    }
+    return lista;
+}
+
+// Formato COLUMNAR: {"t0","paso","dt","y",("min","max")}
+function decodificarColumnar(objeto) {
+    var n = objeto.y.length;
+    var t = fechas(objeto.t0, objeto.paso, objeto.dt, n);
+    var puntos = [];
+    for (var i = 0; i < n; i++) {
+        var punto = { x: fechaTexto(t[i]), y: objeto.y[i] };
+        if (objeto.min !== undefined) {
+            punto.min = objeto.min[i];
+            punto.max = objeto.max[i];
+        }
+        puntos.push(punto);
+    }
+    return puntos;
+}
+
+// Formatos BINARIO y BINARIO_Z: cabecera de 12 bytes ("CE", version, banderas, n, columnas) y datos en little-endian
+function decodificarBinario(buffer) {
+    if (buffer.toString("ascii", 0, 2) !== "CE") {
+        throw new Error("Mensaje binario no valido");
+    }
+    var banderas = buffer.readUInt8(3);
+    var n = buffer.readUInt32LE(4);
+    var k = buffer.readUInt8(8);
+    var datos = buffer.slice(12);
+    if (banderas & 1) {
+        datos = zlib.inflateSync(datos);
+    }
+    if (n === 0) {
+        return [];
+    }
+
+    var t0 = Number(datos.readBigInt64LE(0));
+    var dt = [];
+    for (var i = 0; i < n - 1; i++) {
+        dt.push(datos.readInt32LE(8 + 4 * i));
+    }
+    var t = fechas(t0, null, dt, n);
+
+    // Columnas de valores: "y" y, en los datos agrupados de potencia, "min" y "max"
+    var nombres = ["y", "min", "max"];
+    var inicio = 8 + 4 * (n - 1);
+    var puntos = [];
+    for (var i = 0; i < n; i++) {
+        puntos.push({ x: fechaTexto(t[i]) });
+    }
+    for (var c = 0; c < k; c++) {
+        for (var i = 0; i < n; i++) {
+            puntos[i][nombres[c]] = datos.readFloatLE(inicio + 4 * i);
+        }
+        inicio += 4 * n;
+    }
+    return puntos;
+}
+
+if (Buffer.isBuffer(msg.payload) && msg.payload.toString("ascii", 0, 2) === "CE") {
+    msg.payload = decodificarBinario(msg.payload);
+} else {
+    var objeto = (typeof msg.payload === "string" || Buffer.isBuffer(msg.payload)) ? JSON.parse(msg.payload.toString()) : msg.payload;
+    if (!Array.isArray(objeto) && objeto.t0 !== undefined) {
+        objeto = decodificarColumnar(objeto);
+    }
+    msg.payload = objeto;
+}
+return msg;
@@ -0,0 +1,339 @@
+# Clase: analisispatrones
+# Esta clase se encarga de encontrar los patrones de consumo de los ordenadores conforme llegan sus mediciones, sin guardarlas:
+# linea base de la potencia (promedio movil exponencial) y su varianza, periodos apagado, en reposo y en uso (con histeresis),
+# picos y caidas breves respecto a la linea base (como las caidas a 11 W y las rafagas de 41 W de DELL_PC1)
+# y el perfil de consumo por hora de cada dia
+# Cada ordenador usa una cantidad fija de memoria (estadoordenador), sin importar cuantas mediciones reciba
+# Los eventos y los perfiles diarios se regresan como diccionarios listos para publicarse en JSON (ver conexionMQTT y reportes)
+# Por Fernando Daniel Ramirez
+
+from columnasdatos import columnasdatos
+import math
+import threading
+
+ESTADOS = ("apagado","reposo","uso")
+
+
+# Estado de un ordenador: estadisticas de la potencia, periodo actual, excursion actual y perfil del dia actual
+class estadoordenador():
+
+    __slots__ = ("base","varianza","n","ultimo",
+                 "estado","desde","energia","suma","muestras",
+                 "candidato","candidato_desde","candidato_energia","candidato_suma","candidato_muestras",
+                 "excursion_desde","excursion_signo","excursion_extremo","excursion_base","excursion_muestras",
+                 "dia","energia_horas","suma_horas","maximo_horas","muestras_horas","uso_horas","segundos_estados","picos","caidas")
+
+    def __init__(self):
+        self.base = 0.0 # Linea base de la potencia en W
+        self.varianza = 0.0 # Varianza de la potencia respecto a la linea base
+        self.n = 0 # Muestras que formaron la linea base
+        self.ultimo = None # Fecha en segundos de la ultima muestra
+
+        # Periodo actual (apagado, reposo o uso)
+        self.estado = None
+        self.desde = 0
+        self.energia = 0.0
+        self.suma = 0.0
+        self.muestras = 0
+
+        # Muestras seguidas de otro estado que todavia no alcanzan para cambiar de periodo (histeresis)
+        self.candidato = None
+        self.candidato_desde = 0
+        self.candidato_energia = 0.0
+        self.candidato_suma = 0.0
+        self.candidato_muestras = 0
+
+        # Muestras seguidas fuera de la banda de la linea base
+        self.excursion_desde = None
+        self.excursion_signo = 0
+        self.excursion_extremo = 0.0
+        self.excursion_base = 0.0
+        self.excursion_muestras = 0
+
+        self.dia = None
+        self.reiniciardia(None)
+
+    # Empieza el perfil de un dia (en dias desde 1970-01-01)
+    def reiniciardia(self,dia):
+        self.dia = dia
+        self.energia_horas = [0.0] * 24 # Energia en J
+        self.suma_horas = [0.0] * 24 # Suma de potencias, para promediar
+        self.maximo_horas = [0.0] * 24
+        self.muestras_horas = [0] * 24
+        self.uso_horas = [0] * 24 # Muestras en uso
+        self.segundos_estados = dict.fromkeys(ESTADOS,0)
+        self.picos = 0
+        self.caidas = 0
+
+
+class analisispatrones():
+
+    # El constructor recibe los parametros de la deteccion
+    # alfa: peso de cada muestra nueva en la linea base y su varianza (0.05 = aproximadamente las ultimas 20 muestras)
+    # sigmas, minimo_w: una muestra se sale de la linea base si se aleja mas de "sigmas" desviaciones estandar y mas de "minimo_w" W
+    # muestras_pico: una excursion de hasta estas muestras es un pico o una caida; si dura mas es un cambio de nivel y la linea base lo sigue
+    # calentamiento: muestras con las que se forma la linea base antes de buscar picos
+    # umbral_apagado, umbral_reposo, umbral_uso: potencias (W) de los periodos; entre umbral_reposo y umbral_uso se mantiene el periodo actual
+    # muestras_cambio: muestras seguidas de otro estado necesarias para cambiar de periodo
+    # hueco: segundos sin muestras a partir de los que se termina el periodo actual (ordenador sin conexion)
+    def __init__(self,alfa=0.05,sigmas=4,minimo_w=8,muestras_pico=3,calentamiento=30,
+                 umbral_apagado=5,umbral_reposo=30,umbral_uso=33,muestras_cambio=3,hueco=300):
+        self.alfa = alfa
+        self.sigmas = sigmas
+        self.minimo_w = minimo_w
+        self.muestras_pico = muestras_pico
+        self.calentamiento = calentamiento
+        self.umbral_apagado = umbral_apagado
+        self.umbral_reposo = umbral_reposo
+        self.umbral_uso = umbral_uso
+        self.muestras_cambio = muestras_cambio
+        self.hueco = hueco
+
+        self.estados = {} # tabla -> estadoordenador
+        self.candado = threading.Lock()
+
+        # Contadores
+        self.analizadas = 0 # Muestras analizadas
+        self.omitidas = 0 # Muestras con una fecha anterior o igual a la ultima del ordenador
+        self.eventos = dict.fromkeys(("pico","caida","periodo","hueco"),0)
+        self.perfiles = 0
+
+    # Analiza una muestra de un ordenador (fecha en segundos, potencia en W y energia en J)
+    # Las muestras deben llegar en orden: una muestra con fecha anterior o igual a la ultima se omite
+    # Regresa la lista de eventos que provoco la muestra y la lista de perfiles de los dias que termino
+    def agregar(self,table,segundos,potencia,energia):
+        eventos = []
+        perfiles = []
+        with self.candado:
+            estado = self.estados.get(table)
+            if estado is None:
+                estado = estadoordenador()
+                self.estados[table] = estado
+            if estado.ultimo is not None and segundos <= estado.ultimo:
+                self.omitidas += 1
+                return eventos,perfiles
+            self.analizadas += 1
+
+            transcurrido = 0
+            if estado.ultimo is not None:
+                transcurrido = segundos - estado.ultimo
+                if transcurrido > self.hueco: # El ordenador dejo de enviar mediciones
+                    self.cerrarperiodo(table,estado,eventos)
+                    eventos.append({"tabla":table,"tipo":"hueco","inicio":self.texto(estado.ultimo),"fin":self.texto(segundos),
+                                    "duracion":transcurrido})
+                    estado.excursion_desde = None
+                    transcurrido = 0
+
+            dia,resto = divmod(segundos,86400)
+            if estado.dia != dia:
+                if estado.dia is not None:
+                    perfiles.append(self.crearperfil(table,estado))
+                estado.reiniciardia(dia)
+            if estado.estado is not None:
+                estado.segundos_estados[estado.estado] += transcurrido # El tiempo desde la muestra anterior es del periodo en que estaba
+
+            self.detectarexcursion(table,estado,segundos,potencia,eventos)
+            self.actualizarperiodo(table,estado,segundos,potencia,energia,eventos)
+
+            hora = resto // 3600
+            estado.energia_horas[hora] += energia
+            estado.suma_horas[hora] += potencia
+            estado.muestras_horas[hora] += 1
+            if potencia > estado.maximo_horas[hora]:
+                estado.maximo_horas[hora] = potencia
+            if estado.estado == "uso":
+                estado.uso_horas[hora] += 1
+            estado.ultimo = segundos
+
+            for evento in eventos:
+                self.eventos[evento["tipo"]] += 1
+            self.perfiles += len(perfiles)
+        return eventos,perfiles
+
+    # Busca picos y caidas: muestras que se salen de la banda de la linea base por pocas muestras
+    # Las muestras fuera de la banda no cambian la linea base; si la excursion dura mas de "muestras_pico" es un cambio de nivel
+    # (por ejemplo el ordenador empezo a usarse) y la linea base empieza desde la potencia actual
+    def detectarexcursion(self,table,estado,segundos,potencia,eventos):
+        desviacion = potencia - estado.base
+        if estado.n < self.calentamiento:
+            self.actualizarbase(estado,desviacion)
+            return
+
+        banda = max(self.sigmas * math.sqrt(estado.varianza),self.minimo_w)
+        signo = 0
+        if desviacion > banda:
+            signo = 1
+        elif desviacion < -banda:
+            signo = -1
+
+        if estado.excursion_desde is not None and signo != estado.excursion_signo: # Termino la excursion
+            if estado.excursion_muestras <= self.muestras_pico:
+                self.agregarpico(table,estado,eventos)
+            estado.excursion_desde = None
+
+        if signo == 0:
+            self.actualizarbase(estado,desviacion)
+        elif estado.excursion_desde is None:
+            estado.excursion_desde = segundos
+            estado.excursion_signo = signo
+            estado.excursion_extremo = potencia
+            estado.excursion_base = estado.base
+            estado.excursion_muestras = 1
+        else:
+            estado.excursion_muestras += 1
+            if signo * (potencia - estado.excursion_extremo) > 0:
+                estado.excursion_extremo = potencia
+            if estado.excursion_muestras > self.muestras_pico: # Cambio de nivel
+                estado.base = potencia
+
+    # Agrega a la linea base y su varianza (promedios moviles exponenciales) una muestra con la desviacion dada
+    def actualizarbase(self,estado,desviacion):
+        if estado.n == 0:
+            estado.base += desviacion
+        else:
+            estado.base += self.alfa * desviacion
+            estado.varianza = (1 - self.alfa) * (estado.varianza + self.alfa * desviacion * desviacion)
+        estado.n += 1
+
+    # Agrega el evento del pico o la caida de la excursion actual
+    def agregarpico(self,table,estado,eventos):
+        tipo = "pico" if estado.excursion_signo > 0 else "caida"
+        if tipo == "pico":
+            estado.picos += 1
+        else:
+            estado.caidas += 1
+        eventos.append({"tabla":table,"tipo":tipo,"fecha":self.texto(estado.excursion_desde),"potencia":estado.excursion_extremo,
+                        "base":round(estado.excursion_base,2),"desviacion":round(estado.excursion_extremo - estado.excursion_base,2),
+                        "muestras":estado.excursion_muestras})
+
+    # Clasifica la potencia en apagado, reposo o uso, con histeresis entre umbral_reposo y umbral_uso
+    def clasificar(self,estado,potencia):
+        if potencia < self.umbral_apagado:
+            return "apagado"
+        if potencia >= self.umbral_uso:
+            return "uso"
+        if potencia <= self.umbral_reposo or estado.estado != "uso":
+            return "reposo"
+        return "uso"
+
+    # Agrega la muestra al periodo actual, o cambia de periodo si ya hubo "muestras_cambio" muestras seguidas de otro estado
+    def actualizarperiodo(self,table,estado,segundos,potencia,energia,eventos):
+        nuevo = self.clasificar(estado,potencia)
+        if estado.estado is None: # Primer periodo o primer periodo despues de un hueco
+            self.empezarperiodo(estado,nuevo,segundos)
+        elif nuevo == estado.estado:
+            # Las muestras candidatas eran una variacion breve, siguen siendo del periodo actual
+            estado.energia += estado.candidato_energia
+            estado.suma += estado.candidato_suma
+            estado.muestras += estado.candidato_muestras
+            estado.candidato = None
+            estado.candidato_energia = estado.candidato_suma = 0.0
+            estado.candidato_muestras = 0
+        else:
+            if nuevo != estado.candidato:
+                estado.energia += estado.candidato_energia
+                estado.suma += estado.candidato_suma
+                estado.muestras += estado.candidato_muestras
+                estado.candidato = nuevo
+                estado.candidato_desde = segundos
+                estado.candidato_energia = estado.candidato_suma = 0.0
+                estado.candidato_muestras = 0
+            estado.candidato_energia += energia
+            estado.candidato_suma += potencia
+            estado.candidato_muestras += 1
+            if estado.candidato_muestras < self.muestras_cambio:
+                return
+
+            # Las muestras candidatas empiezan el nuevo periodo
+            desde = estado.candidato_desde
+            energia_candidato,suma_candidato,muestras_candidato = estado.candidato_energia,estado.candidato_suma,estado.candidato_muestras
+            self.cerrarperiodo(table,estado,eventos,desde)
+            self.empezarperiodo(estado,nuevo,desde)
+            estado.energia = energia_candidato
+            estado.suma = suma_candidato
+            estado.muestras = muestras_candidato
+            return
+
+        estado.energia += energia
+        estado.suma += potencia
+        estado.muestras += 1
+
+    # Empieza un periodo en la fecha "desde" (en segundos)
+    def empezarperiodo(self,estado,nuevo,desde):
+        estado.estado = nuevo
+        estado.desde = desde
+        estado.energia = estado.suma = 0.0
+        estado.muestras = 0
+        estado.candidato = None
+        estado.candidato_energia = estado.candidato_suma = 0.0
+        estado.candidato_muestras = 0
+
+    # Termina el periodo actual en la fecha "hasta" (por defecto la ultima muestra) y agrega su evento
+    def cerrarperiodo(self,table,estado,eventos,hasta=None):
+        if estado.estado is None:
+            return
+        estado.energia += estado.candidato_energia
+        estado.suma += estado.candidato_suma
+        estado.muestras += estado.candidato_muestras
+        if hasta is None:
+            hasta = estado.ultimo
+        if estado.muestras > 0:
+            eventos.append({"tabla":table,"tipo":"periodo","estado":estado.estado,"inicio":self.texto(estado.desde),"fin":self.texto(hasta),
+                            "duracion":hasta - estado.desde,"energia":estado.energia/(3.6e+6),"potencia_promedio":round(estado.suma/estado.muestras,2)})
+        estado.estado = None
+
+    # Crea el perfil del dia actual de un ordenador: energia (kWh), potencia promedio y maxima y fraccion de muestras en uso de cada hora,
+    # y totales del dia
+    def crearperfil(self,table,estado):
+        horas = []
+        for hora in range(24):
+            muestras = estado.muestras_horas[hora]
+            if muestras == 0:
+                horas.append(None) # Hora sin mediciones
+                continue
+            horas.append({"energia":estado.energia_horas[hora]/(3.6e+6),"potencia_promedio":round(estado.suma_horas[hora]/muestras,2),
+                          "potencia_max":estado.maximo_horas[hora],"fraccion_uso":round(estado.uso_horas[hora]/muestras,3)})
+        return {"tabla":table,"dia":self.texto(estado.dia * 86400)[:10],"energia":sum(estado.energia_horas)/(3.6e+6),
+                "muestras":sum(estado.muestras_horas),"segundos":dict(estado.segundos_estados),"picos":estado.picos,"caidas":estado.caidas,
+                "horas":horas}
+
+    # Regresa el perfil del dia actual (hasta la ultima muestra) de un ordenador, o None si no tiene muestras
+    def perfil(self,table):
+        with self.candado:
+            estado = self.estados.get(table)
+            if estado is None or estado.dia is None:
+                return None
+            return self.crearperfil(table,estado)
+
+    # Regresa la linea base (W), la desviacion estandar y el periodo actual de un ordenador, o None si no tiene muestras
+    def resumen(self,table):
+        with self.candado:
+            estado = self.estados.get(table)
+            if estado is None:
+                return None
+            return estado.base,math.sqrt(estado.varianza),estado.estado
+
+    # Termina los periodos abiertos de todos los ordenadores (por ejemplo al final de un reporte)
+    # Regresa los eventos de los periodos y los perfiles de los dias sin terminar
+    def cerrar(self):
+        eventos = []
+        perfiles = []
+        with self.candado:
+            for table,estado in self.estados.items():
+                self.cerrarperiodo(table,estado,eventos)
+                if estado.dia is not None:
+                    perfiles.append(self.crearperfil(table,estado))
+            for evento in eventos:
+                self.eventos[evento["tipo"]] += 1
+        return eventos,perfiles
+
+    # Regresa los contadores del analisis
+    def estadisticas(self):
+        with self.candado:
+            return {"ordenadores":len(self.estados),"analizadas":self.analizadas,"omitidas":self.omitidas,
+                    "eventos":dict(self.eventos),"perfiles":self.perfiles}
+
+    # Fecha en segundos como texto 'YYYY-mm-dd HH:MM:SS'
+    @staticmethod
+    def texto(segundos):
+        return str(columnasdatos.afecha(segundos))
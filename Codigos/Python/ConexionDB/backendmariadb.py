@@ -0,0 +1,117 @@
+# Clase: backendmariadb
+# Esta clase se encarga de abrir conexiones con un servidor MariaDB y de dar las partes de las querys propias de MariaDB
+# (fechas en segundos, horas y dias, division entera, upsert, lista de tablas), para que conexionDB, resumenesDB e ingestaMQTT
+# no dependan de un motor de base de datos en particular (ver backendsqlite)
+# Por Fernando Daniel Ramirez
+
+import mariadb
+
+# Tabla de un ordenador, igual a las de "Base de datos/potencia.sql" con la fecha como llave primaria
+SQL_CREAR_TABLA = """CREATE TABLE IF NOT EXISTS `{}` (
+  `fecha` datetime NOT NULL,
+  `potencia` float(5,2) DEFAULT NULL,
+  `energia` float(6,2) DEFAULT NULL,
+  PRIMARY KEY (`fecha`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+# Columnas de los resumenes: inicio del periodo, numero de muestras, potencia minima, suma de potencias (para promediar), potencia maxima y suma de energia
+SQL_CREAR_RESUMEN = """CREATE TABLE IF NOT EXISTS {} (
+  `tabla` varchar(64) NOT NULL,
+  `inicio` datetime NOT NULL,
+  `muestras` int NOT NULL,
+  `potencia_min` float DEFAULT NULL,
+  `potencia_suma` double DEFAULT NULL,
+  `potencia_max` float DEFAULT NULL,
+  `energia` double NOT NULL,
+  PRIMARY KEY (`tabla`,`inicio`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+
+class backendmariadb():
+
+    nombre = "MARIADB"
+    Error = mariadb.Error # Excepcion base de los errores de la base de datos
+    ErrorPool = mariadb.PoolError # Excepcion cuando el pool no puede entregar una conexion
+
+    # El constructor recibe los datos para conectarse al servidor
+    def __init__(self,usr,passw,host,port,database):
+        self.usr = usr
+        self.passw = passw
+        self.host = host
+        self.port = port
+        self.database = database
+
+    # Abre una nueva conexion con la base de datos
+    def conectar(self):
+        conn = mariadb.connect(
+            user = self.usr,
+            password = self.passw,
+            host = self.host,
+            port = self.port,
+            database = self.database,
+        )
+        # Las conexiones pueden vivir mucho tiempo (pool), sin autocommit quedarian leyendo siempre la misma instantanea de los datos
+        conn.autocommit = True
+        return conn
+
+    # Verifica que una conexion siga abierta; lanza Error si se cayo
+    def verificar(self,conn):
+        conn.ping()
+
+    # Crea un cursor que lee las filas del servidor conforme se piden, sin guardar todo el resultado en memoria
+    def cursorsinbuffer(self,conn):
+        return conn.cursor(buffered=False)
+
+    # Crea un cursor que prepara sus querys en el servidor (protocolo binario)
+    # Si el cursor vuelve a ejecutar la misma query solo envia los parametros, sin que el servidor la analice ni la planee otra vez
+    def cursorpreparado(self,conn):
+        return conn.cursor(prepared=True)
+
+    # Nombre de una tabla o columna entre comillas, para usarse en una query
+    def identificador(self,nombre):
+        return "`" + nombre.replace("`","``") + "`"
+
+    # Expresion con los segundos desde 1970-01-01 00:00:00 de una columna de fecha, sin zona horaria
+    def segundos(self,columna):
+        return "TIMESTAMPDIFF(SECOND,'1970-01-01 00:00:00'," + columna + ")"
+
+    # Expresion con la division entera de una expresion entre un numero entero
+    def divisionentera(self,expresion,divisor):
+        return "(" + expresion + ") DIV " + str(int(divisor))
+
+    # Expresion con el inicio de la hora de una columna de fecha
+    def hora(self,columna):
+        return "CAST(DATE(" + columna + ") AS DATETIME) + INTERVAL HOUR(" + columna + ") HOUR"
+
+    # Expresion con el inicio del dia de una columna de fecha
+    def dia(self,columna):
+        return "CAST(DATE(" + columna + ") AS DATETIME)"
+
+    # Convierte una fecha leida de la base de datos en datetime (el conector ya las regresa como datetime)
+    def afecha(self,valor):
+        return valor
+
+    # Query y parametros para obtener los nombres de las tablas de la base de datos
+    def sqltablas(self):
+        return "SELECT table_name FROM information_schema.tables WHERE table_schema = ?",(self.database,)
+
+    # Query para crear la tabla de un ordenador si no existe
+    def sqlcreartabla(self,tabla):
+        return SQL_CREAR_TABLA.format(tabla)
+
+    # Query para insertar registros (fecha, potencia, energia) en la tabla de un ordenador, omitiendo las fechas repetidas
+    # (solo si la tabla tiene llave sobre fecha, como las que crea sqlcreartabla)
+    def sqlinsertarignorando(self,tabla):
+        return "INSERT IGNORE INTO `" + tabla + "` (fecha,potencia,energia) VALUES (?,?,?)"
+
+    # Query para crear una tabla de resumenes si no existe
+    def sqlcrearresumen(self,nombre):
+        return SQL_CREAR_RESUMEN.format(nombre)
+
+    # Clausula para que un INSERT ... SELECT en una tabla de resumenes reemplace las columnas dadas si el periodo ya existe
+    def sqlactualizarresumen(self,columnas):
+        return " ON DUPLICATE KEY UPDATE " + ", ".join(columna + " = VALUES(" + columna + ")" for columna in columnas)
+
+    # Agrega una columna a una tabla si no existe
+    def agregarcolumna(self,cur,tabla,columna,tipo):
+        cur.execute("ALTER TABLE " + tabla + " ADD COLUMN IF NOT EXISTS `" + columna + "` " + tipo)
@@ -0,0 +1,115 @@
+# Clase: backendsqlite
+# Esta clase se encarga de abrir conexiones con una base de datos SQLite en un archivo y de dar las partes de las querys propias de SQLite,
+# con la misma interfaz que backendmariadb, para instalaciones pequenas que no quieren mantener un servidor de base de datos
+# Se usa el modo WAL (las lecturas no bloquean a las escrituras) y las tablas de los ordenadores usan la fecha como llave primaria
+# sin rowid, asi los registros quedan guardados en orden de fecha
+# Las fechas se guardan como texto 'YYYY-mm-dd HH:MM:SS', que se ordena y compara igual que las fechas
+# Por Fernando Daniel Ramirez
+
+from datetime import datetime
+import sqlite3
+
+# Las fechas de las querys se envian con el mismo formato que se guardan (sin microsegundos)
+sqlite3.register_adapter(datetime,lambda fecha: fecha.strftime('%Y-%m-%d %H:%M:%S'))
+
+SQL_CREAR_TABLA = """CREATE TABLE IF NOT EXISTS "{}" (
+  fecha TEXT NOT NULL PRIMARY KEY,
+  potencia REAL,
+  energia REAL
+) WITHOUT ROWID"""
+
+SQL_CREAR_RESUMEN = """CREATE TABLE IF NOT EXISTS {} (
+  tabla TEXT NOT NULL,
+  inicio TEXT NOT NULL,
+  muestras INTEGER NOT NULL,
+  potencia_min REAL,
+  potencia_suma REAL,
+  potencia_max REAL,
+  energia REAL NOT NULL,
+  PRIMARY KEY (tabla,inicio)
+) WITHOUT ROWID"""
+
+
+class backendsqlite():
+
+    nombre = "SQLITE"
+    Error = sqlite3.Error # Excepcion base de los errores de la base de datos
+    ErrorPool = sqlite3.OperationalError # Excepcion cuando el pool no puede entregar una conexion
+
+    # El constructor recibe la ruta del archivo de la base de datos
+    def __init__(self,archivo):
+        self.archivo = archivo
+
+    # Abre una nueva conexion con la base de datos
+    # La conexion se puede usar desde otro hilo que el que la abrio (el pool la pasa entre hilos, pero nunca a dos al mismo tiempo)
+    def conectar(self):
+        conn = sqlite3.connect(self.archivo,timeout=10,isolation_level=None,check_same_thread=False) # isolation_level=None: autocommit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # En modo WAL solo se pueden perder las ultimas transacciones si se apaga el equipo
+        return conn
+
+    # Verifica que una conexion siga abierta; lanza Error si no
+    def verificar(self,conn):
+        conn.execute("SELECT 1")
+
+    # Los cursores de SQLite ya leen las filas conforme se piden
+    def cursorsinbuffer(self,conn):
+        return conn.cursor()
+
+    # SQLite ya guarda las querys preparadas de cada conexion (cached_statements), un cursor normal las reutiliza
+    def cursorpreparado(self,conn):
+        return conn.cursor()
+
+    # Nombre de una tabla o columna entre comillas, para usarse en una query
+    def identificador(self,nombre):
+        return "\"" + nombre.replace("\"","\"\"") + "\""
+
+    # Expresion con los segundos desde 1970-01-01 00:00:00 de una columna de fecha (la fecha se interpreta sin zona horaria)
+    def segundos(self,columna):
+        return "CAST(strftime('%s'," + columna + ") AS INTEGER)"
+
+    # Expresion con la division entera de una expresion entera entre un numero entero
+    def divisionentera(self,expresion,divisor):
+        return "(" + expresion + ") / " + str(int(divisor))
+
+    # Expresion con el inicio de la hora de una columna de fecha
+    def hora(self,columna):
+        return "strftime('%Y-%m-%d %H:00:00'," + columna + ")"
+
+    # Expresion con el inicio del dia de una columna de fecha
+    def dia(self,columna):
+        return "strftime('%Y-%m-%d 00:00:00'," + columna + ")"
+
+    # Convierte una fecha leida de la base de datos (texto) en datetime
+    def afecha(self,valor):
+        if isinstance(valor,str):
+            return datetime.strptime(valor[:19],'%Y-%m-%d %H:%M:%S')
+        return valor
+
+    # Query y parametros para obtener los nombres de las tablas de la base de datos
+    def sqltablas(self):
+        return "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'",()
+
+    # Query para crear la tabla de un ordenador si no existe
+    def sqlcreartabla(self,tabla):
+        return SQL_CREAR_TABLA.format(tabla)
+
+    # Query para insertar registros (fecha, potencia, energia) en la tabla de un ordenador, omitiendo las fechas repetidas
+    # (solo si la tabla tiene llave sobre fecha, como las que crea sqlcreartabla)
+    def sqlinsertarignorando(self,tabla):
+        return "INSERT OR IGNORE INTO \"" + tabla + "\" (fecha,potencia,energia) VALUES (?,?,?)"
+
+    # Query para crear una tabla de resumenes si no existe
+    def sqlcrearresumen(self,nombre):
+        return SQL_CREAR_RESUMEN.format(nombre)
+
+    # Clausula para que un INSERT ... SELECT en una tabla de resumenes reemplace las columnas dadas si el periodo ya existe
+    # (el SELECT debe tener WHERE para que SQLite no confunda el ON CONFLICT con un JOIN)
+    def sqlactualizarresumen(self,columnas):
+        return " ON CONFLICT (tabla,inicio) DO UPDATE SET " + ", ".join(columna + " = excluded." + columna for columna in columnas)
+
+    # Agrega una columna a una tabla si no existe (SQLite no tiene ADD COLUMN IF NOT EXISTS)
+    def agregarcolumna(self,cur,tabla,columna,tipo):
+        cur.execute("PRAGMA table_info(" + tabla + ")")
+        if columna not in [fila[1] for fila in cur.fetchall()]:
+            cur.execute("ALTER TABLE " + tabla + " ADD COLUMN " + columna + " " + tipo)
@@ -0,0 +1,161 @@
+# Benchmark: latencia de las peticiones por modo
+# Mide de extremo a extremo conexionMQTT.obtener_datos (lectura del mensaje, querys, decodificacion, formato y publicacion)
+# con un cliente MQTT falso que guarda los mensajes publicados en lugar de enviarlos al broker
+# Necesita la base de datos configurada en extraerdatosDB (MariaDB o SQLite) con datos, por ejemplo los de generadordatos.py
+# Reporta por modo (DIFF, ADD, FECHA, MES, TABLA): latencia p50 y p99, puntos por segundo, bytes publicados y memoria pico de una peticion,
+# y el tiempo promedio de cada etapa de las peticiones
+# La memoria se mide con tracemalloc (solo la que reserva Python) en una peticion adicional, para no afectar las latencias
+# Con --sin-bd solo mide el formato de los datos (enviardatosextraidos) con datos generados, sin base de datos ni MQTT
+# Uso: python benchmark.py [--tabla T] [--deltatime MINUTOS] [--repeticiones N] [--puntos N] [--formato F] [--cache] [--sin-bd]
+# Por Fernando Daniel Ramirez
+
+from codificador import CABECERA, FORMATOS
+from columnasdatos import columnasdatos
+from generadordatos import generadordatos
+from datetime import timedelta
+import argparse
+import json
+import time
+import tracemalloc
+
+
+# Cliente MQTT falso con la interfaz que usa conexionMQTT
+class clientefalso():
+
+    def __init__(self):
+        self.mensajes = []
+
+    def publish(self,topic,payload):
+        self.mensajes.append((topic,payload))
+
+    def subscribe(self,topic):
+        pass
+
+# Percentil p (0 a 100) de una lista de valores
+def percentil(valores,p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1,int(round(p / 100 * (len(ordenados) - 1))))]
+
+# Memoria pico (en MB) reservada por Python durante una peticion, contando solo esa peticion
+def memoriapico(connMQTT,cliente,mensaje):
+    cliente.mensajes = []
+    tracemalloc.start()
+    try:
+        connMQTT.obtener_datos(mensaje)
+        actual,pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pico / (1024 * 1024)
+
+# Cuenta los puntos de potencia publicados, en cualquiera de los formatos
+def contarpuntos(mensajes):
+    puntos = 0
+    for (topic,payload) in mensajes:
+        if not topic.startswith("capstone_energia/datosPotencia"):
+            continue
+        if isinstance(payload,bytes) and payload[:2] == b"CE": # Formato binario
+            puntos += CABECERA.unpack_from(payload,0)[3]
+            continue
+        objeto = json.loads(payload)
+        puntos += len(objeto) if isinstance(objeto,list) else len(objeto["y"])
+    return puntos
+
+# Crea los mensajes de peticion de cada modo para la tabla dada, como los envia Node-RED
+def crearpeticiones(tabla,deltatime,fecha,opciones):
+    fecha_ms = int(fecha.timestamp() * 1000)
+    hora_ms = int((fecha - timedelta(hours=6)).timestamp() * 1000) # conexionMQTT suma 6 horas a la hora recibida
+    peticiones = {
+        "DIFF": {"mode":"DIFF","nombre":tabla,"deltatime":deltatime},
+        "ADD": {"mode":"ADD","nombre":tabla,"deltatime":deltatime},
+        "FECHA": {"mode":"FECHA","nombre":tabla,"fecha":fecha_ms,"hora":hora_ms,"deltatime":deltatime},
+        "MES": {"mode":"MES","nombre":tabla,"fecha":fecha.month},
+        "TABLA": {"mode":"TABLA"},
+    }
+    for modo in ("DIFF","ADD","FECHA"):
+        peticiones[modo].update(opciones)
+    return {modo: json.dumps(peticion).encode() for modo,peticion in peticiones.items()}
+
+# Mide una peticion repetida varias veces e imprime sus resultados
+def medirmodo(connMQTT,cliente,modo,mensaje,repeticiones):
+    latencias = []
+    for i in range(repeticiones):
+        cliente.mensajes = []
+        inicio = time.perf_counter()
+        connMQTT.obtener_datos(mensaje)
+        latencias.append(time.perf_counter() - inicio)
+
+    p50 = percentil(latencias,50)
+    p99 = percentil(latencias,99)
+    puntos = contarpuntos(cliente.mensajes)
+    tamano = sum(len(payload) if isinstance(payload,(str,bytes)) else len(str(payload)) for (topic,payload) in cliente.mensajes) # El consumo mensual se publica como numero
+    print(f"{modo:<6} {p50*1000:>10.2f} {p99*1000:>10.2f} {puntos/p50:>14,.0f} {tamano:>12,} {memoriapico(connMQTT,cliente,mensaje):>10.1f}")
+
+# Mide de extremo a extremo cada modo contra la base de datos
+def medirpeticiones(tabla,deltatime,repeticiones,opciones,cache):
+    from conexionMQTT import conexionMQTT # Necesita paho y el conector de la base de datos configurada
+    from extraerdatosDB import extraerdatosDB
+    cliente = clientefalso()
+    connMQTT = conexionMQTT("","","","capstone_energia/parametrosGraficas",hilos=0,cliente=cliente)
+    if not cache: # Sin caches cada repeticion consulta la base de datos
+        connMQTT.cacheresultados = None
+        connMQTT.buffer = None
+
+    # Fecha a la mitad de los datos de la tabla para el modo FECHA
+    extrDB = extraerdatosDB(connMQTT.pool)
+    primera,ultima = extrDB.connDB.obtenerlimites(tabla)
+    extrDB.cerrar()
+    fecha = primera + (ultima - primera) / 2
+
+    print(f"Tabla {tabla}, {deltatime} minutos, {repeticiones} repeticiones, opciones {opciones}, cache: {cache}")
+    print(f"{'modo':<6} {'p50 [ms]':>10} {'p99 [ms]':>10} {'puntos/s':>14} {'bytes':>12} {'pico [MB]':>10}")
+    for modo,mensaje in crearpeticiones(tabla,deltatime,fecha,opciones).items():
+        medirmodo(connMQTT,cliente,modo,mensaje,repeticiones)
+
+    # Tiempo promedio de cada etapa de todas las peticiones (ver metricas)
+    print(f"{'etapa':<16} {'n':>8} {'promedio [ms]':>14} {'max [ms]':>10}")
+    for etapa,tiempos in connMQTT.metricas.estadisticas()["etapas"].items():
+        print(f"{etapa:<16} {tiempos['n']:>8} {tiempos['promedio_ms']:>14.3f} {tiempos['max_ms']:>10.3f}")
+
+# Mide solo el formato de los datos de una ventana generada, sin base de datos
+def medirformato(deltatime,repeticiones):
+    from extraerdatosDB import extraerdatosDB # No se conecta a la base de datos
+    extrDB = extraerdatosDB.__new__(extraerdatosDB) # Sin conexion: enviardatosextraidos no usa la base de datos
+
+    generador = generadordatos(1,max(1,deltatime // 1440 + 1))
+    columnas = columnasdatos()
+    for (fecha,potencia,energia) in generador.generar(generador.tablas()[0]):
+        if len(columnas) >= deltatime * 6:
+            break
+        columnas.agregar(columnasdatos.asegundos(fecha),potencia,energia)
+
+    print(f"enviardatosextraidos, {len(columnas)} registros")
+    print(f"{'formato':<10} {'p50 [ms]':>10} {'p99 [ms]':>10} {'filas/s':>14} {'bytes':>12}")
+    for formato in ("JSON","COLUMNAR","BINARIO","BINARIO_Z"):
+        latencias = []
+        for i in range(repeticiones):
+            inicio = time.perf_counter()
+            str_p,str_e = extrDB.enviardatosextraidos(columnas,formato)
+            latencias.append(time.perf_counter() - inicio)
+        p50 = percentil(latencias,50)
+        print(f"{formato:<10} {p50*1000:>10.2f} {percentil(latencias,99)*1000:>10.2f} {len(columnas)/p50:>14,.0f} {len(str_p) + len(str_e):>12,}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mide la latencia de las peticiones por modo")
+    parser.add_argument("--tabla",default="SIM_PC1",help="tabla del ordenador a consultar")
+    parser.add_argument("--deltatime",type=int,default=1440,help="minutos de la ventana")
+    parser.add_argument("--repeticiones",type=int,default=20,help="repeticiones de cada peticion")
+    parser.add_argument("--puntos",type=int,help="numero aproximado de puntos a enviar (reduccion de datos)")
+    parser.add_argument("--formato",choices=FORMATOS,help="formato de los datos enviados")
+    parser.add_argument("--cache",action="store_true",help="usa las caches de resultados y el buffer circular")
+    parser.add_argument("--sin-bd",action="store_true",help="solo mide el formato de los datos, sin base de datos ni MQTT")
+    args = parser.parse_args()
+
+    if args.sin_bd:
+        medirformato(args.deltatime,args.repeticiones)
+    else:
+        peticion = {}
+        if args.puntos is not None:
+            peticion["puntos"] = args.puntos
+        if args.formato is not None:
+            peticion["formato"] = args.formato
+        medirpeticiones(args.tabla,args.deltatime,args.repeticiones,peticion,args.cache)
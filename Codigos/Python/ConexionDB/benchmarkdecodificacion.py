@@ -0,0 +1,87 @@
+# Benchmark: decodificacion de registros
+# Compara cuantas filas por segundo se decodifican con la conversion anterior (datetime -> texto -> strptime, float(f"..."))
+# y con la lectura en columnas que usa el servicio (conexionDB.extraercolumnas: segundos enteros calculados en la query, fetchmany por lotes en arreglos)
+# No necesita base de datos: un cursor falso regresa las filas con los mismos tipos que el conector de MariaDB
+# Uso: python benchmarkdecodificacion.py [FILAS]
+# Por Fernando Daniel Ramirez
+
+from columnasdatos import columnasdatos
+from conexionDB import conexionDB
+from datetime import datetime, timedelta
+import argparse
+import random
+import time
+
+
+# Cursor falso con la interfaz del cursor de MariaDB que se usa en conexionDB
+class cursorfalso():
+
+    def __init__(self,filas):
+        self.filas = filas
+        self.posicion = 0
+
+    def __iter__(self):
+        return iter(self.filas)
+
+    def fetchmany(self,tamano):
+        lote = self.filas[self.posicion:self.posicion + tamano]
+        self.posicion += tamano
+        return lote
+
+# Genera filas como las de las tablas de los ordenadores: una muestra cada 10 segundos
+def generarfilas(n):
+    random.seed(0)
+    inicio = datetime(2022,2,17,8,4,41)
+    filas_fecha = []
+    filas_segundos = []
+    for i in range(n):
+        fecha = inicio + timedelta(seconds=10*i)
+        potencia = round(random.uniform(20,42),2)
+        energia = round(potencia*10,2)
+        filas_fecha.append((fecha,potencia,energia)) # SELECT fecha,potencia,energia
+        filas_segundos.append((columnasdatos.asegundos(fecha),potencia,energia)) # SELECT TIMESTAMPDIFF(SECOND,'1970-01-01',fecha),...
+    return filas_fecha,filas_segundos
+
+# Decodificacion anterior de conexionDB.extraerdatosDB
+def decodificaranterior(cur):
+    fechas = []
+    potencias = []
+    energias = []
+    for (fecha, potencia, energia) in cur:
+        fechas.append(datetime.strptime(f"{fecha}", '%Y-%m-%d %H:%M:%S'))
+        potencias.append(float(f"{potencia}"))
+        energias.append(float(f"{energia}"))
+    return fechas,potencias,energias
+
+# Decodificacion en columnas del servicio (conexionDB.extraercolumnas)
+def decodificarcolumnas(cur):
+    connDB = conexionDB.__new__(conexionDB) # Sin conexion: extraercolumnas solo lee el cursor recibido
+    return connDB.extraercolumnas(cur)
+
+# Mide las filas por segundo de una funcion (mejor de varias repeticiones)
+def medir(nombre,funcion,n,repeticiones=3):
+    mejor = None
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        duracion = time.perf_counter() - inicio
+        if mejor is None or duracion < mejor:
+            mejor = duracion
+    print(f"{nombre:<45} {n/mejor:>14,.0f} filas/s")
+    return n/mejor
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara la decodificacion anterior de los registros con la lectura en columnas")
+    parser.add_argument("filas",nargs="?",type=int,default=200000,help="numero de filas a decodificar")
+    n = parser.parse_args().filas
+    filas_fecha,filas_segundos = generarfilas(n)
+    print(str(n) + " filas")
+
+    antes = medir("antes: strptime + float(f'...')",lambda: decodificaranterior(cursorfalso(filas_fecha)),n)
+    despues = medir("despues: columnas con fetchmany",lambda: decodificarcolumnas(cursorfalso(filas_segundos)),n)
+
+    # El formato JSON necesita la fecha como texto en cada punto
+    antes_txt = medir("antes: decodificar + str(fecha)",lambda: [str(f) for f in decodificaranterior(cursorfalso(filas_fecha))[0]],n)
+    despues_txt = medir("despues: decodificar + columnasdatos.textos()",lambda: decodificarcolumnas(cursorfalso(filas_segundos)).textos(),n)
+
+    print(f"Mejora decodificacion: {despues/antes:.1f}x, decodificacion + texto: {despues_txt/antes_txt:.1f}x")
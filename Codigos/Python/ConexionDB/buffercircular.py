@@ -0,0 +1,108 @@
+# Clase: buffercircular
+# Esta clase se encarga de guardar en memoria las muestras mas recientes de cada ordenador, recibidas del tema de los dispositivos,
+# para atender las peticiones de los ultimos minutos sin consultar la base de datos
+# Cada ordenador tiene un buffer circular de capacidad fija con columnas compactas (arreglos), igual que columnasdatos
+# Por Fernando Daniel Ramirez
+
+from array import array
+from columnasdatos import columnasdatos
+import threading
+
+
+class buffercircular():
+
+    # El constructor recibe el numero maximo de muestras por ordenador (8640 = 24 horas con una muestra cada 10 segundos)
+    def __init__(self,capacidad=8640):
+        self.capacidad = capacidad
+        self.buffers = {} # tabla -> [segundos, potencias, energias, indice de la muestra mas antigua, numero de muestras]
+        self.candado = threading.Lock()
+
+        # Contadores
+        self.agregadas = 0 # Muestras guardadas
+        self.omitidas = 0 # Muestras con una fecha anterior o igual a la ultima del ordenador
+
+    # Agrega una muestra de un ordenador; si el buffer esta lleno se reemplaza la muestra mas antigua
+    # Las muestras deben llegar en orden: una muestra con fecha anterior o igual a la ultima se omite
+    def agregar(self,table,segundos,potencia,energia):
+        with self.candado:
+            buffer = self.buffers.get(table)
+            if buffer is None:
+                buffer = [array('q',bytes(8*self.capacidad)),array('d',bytes(8*self.capacidad)),array('d',bytes(8*self.capacidad)),0,0]
+                self.buffers[table] = buffer
+            seg,pot,ene,inicio,n = buffer
+
+            if n > 0 and segundos <= seg[(inicio + n - 1) % self.capacidad]:
+                self.omitidas += 1
+                return
+
+            if n < self.capacidad:
+                i = (inicio + n) % self.capacidad
+                buffer[4] = n + 1
+            else: # Lleno, se sobrescribe la muestra mas antigua
+                i = inicio
+                buffer[3] = (inicio + 1) % self.capacidad
+            seg[i] = segundos
+            pot[i] = potencia
+            ene[i] = energia
+            self.agregadas += 1
+
+    # Regresa la fecha en segundos de la primera y ultima muestra guardadas de un ordenador, o None si no hay muestras
+    def limites(self,table):
+        with self.candado:
+            buffer = self.buffers.get(table)
+            if buffer is None or buffer[4] == 0:
+                return None
+            seg,pot,ene,inicio,n = buffer
+            return seg[inicio],seg[(inicio + n - 1) % self.capacidad]
+
+    # Regresa las muestras de un ordenador con fecha entre "desde" y "hasta" (en segundos, incluidos) como columnasdatos
+    def ventana(self,table,desde,hasta):
+        columnas = columnasdatos()
+        with self.candado:
+            buffer = self.buffers.get(table)
+            if buffer is None:
+                return columnas
+            seg,pot,ene,inicio,n = buffer
+
+            primera = self.buscar(buffer,desde,False)
+            ultima = self.buscar(buffer,hasta,True)
+            if primera >= ultima:
+                return columnas
+
+            # Las muestras de la ventana pueden estar partidas en dos tramos del arreglo
+            i = (inicio + primera) % self.capacidad
+            j = (inicio + ultima) % self.capacidad
+            if i < j:
+                tramos = [(i,j)]
+            else:
+                tramos = [(i,self.capacidad),(0,j)]
+            for (a,b) in tramos:
+                columnas.segundos.extend(seg[a:b])
+                columnas.potencias.extend(pot[a:b])
+                columnas.energias.extend(ene[a:b])
+
+        return columnas
+
+    # Busqueda binaria sobre las posiciones logicas (0 = muestra mas antigua) del buffer
+    # Regresa la primera posicion con fecha mayor o igual a "segundos" (o mayor si despues = True)
+    def buscar(self,buffer,segundos,despues):
+        seg,pot,ene,inicio,n = buffer
+        bajo,alto = 0,n
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            valor = seg[(inicio + medio) % self.capacidad]
+            if valor < segundos or (despues and valor == segundos):
+                bajo = medio + 1
+            else:
+                alto = medio
+        return bajo
+
+    # Regresa los contadores del buffer
+    def estadisticas(self):
+        with self.candado:
+            return {
+                "dispositivos": len(self.buffers),
+                "muestras": sum(buffer[4] for buffer in self.buffers.values()),
+                "agregadas": self.agregadas,
+                "omitidas": self.omitidas,
+            }
@@ -0,0 +1,94 @@
+# Clase: cachefechas
+# Esta clase se encarga de guardar la primera y ultima fecha registradas de cada tabla para no consultarlas en cada peticion,
+# y la lista de tablas de los ordenadores con la que se validan los nombres de tabla de las peticiones
+# Por Fernando Daniel Ramirez
+
+import threading
+import time
+
+
+class cachefechas():
+
+    # El constructor recibe el tiempo en segundos que una entrada es valida sin volver a consultar la base de datos
+    # Si las fechas se actualizan al recibir nuevos registros (actualizarfin), el tiempo puede ser mayor
+    # ttl_tablas: segundos que la lista de tablas es valida; recarga_min_tablas: segundos minimos entre dos consultas de la lista
+    def __init__(self,ttl=10,ttl_tablas=60,recarga_min_tablas=2):
+        self.ttl = ttl
+        self.fechas = {} # tabla -> (primera fecha, ultima fecha, instante en que se consultaron)
+        self.candado = threading.Lock()
+
+        self.ttl_tablas = ttl_tablas
+        self.recarga_min_tablas = recarga_min_tablas
+        self.tablas = None # Conjunto de tablas de los ordenadores
+        self.instante_tablas = 0 # Instante en que se consulto la lista de tablas
+
+        # Contadores
+        self.aciertos = 0
+        self.fallos = 0
+
+    # Regresa la primera y ultima fecha de una tabla, o None si no estan guardadas o ya caducaron
+    def obtener(self,table):
+        with self.candado:
+            entrada = self.fechas.get(table)
+            if entrada is None or time.monotonic() - entrada[2] > self.ttl:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            return entrada[0],entrada[1]
+
+    # Guarda la primera y ultima fecha consultadas de una tabla
+    def guardar(self,table,primera,ultima):
+        with self.candado:
+            self.fechas[table] = (primera,ultima,time.monotonic())
+
+    # Actualiza la ultima fecha de una tabla al registrarse una nueva muestra
+    def actualizarfin(self,table,fecha):
+        with self.candado:
+            entrada = self.fechas.get(table)
+            if entrada is None:
+                return # No se conoce la primera fecha, se consultara en la siguiente peticion
+            primera,ultima,instante = entrada
+            if ultima is None or fecha > ultima:
+                ultima = fecha
+            if primera is None or fecha < primera:
+                primera = fecha
+            self.fechas[table] = (primera,ultima,time.monotonic())
+
+    # Regresa el conjunto de tablas guardado, o None si no se ha consultado o ya caduco
+    # Con recargar = True tambien regresa None (para volver a consultarlo) si la lista no se consulto en los ultimos segundos
+    def obtenertablas(self,recargar=False):
+        with self.candado:
+            if self.tablas is None:
+                return None
+            edad = time.monotonic() - self.instante_tablas
+            if edad > self.ttl_tablas or (recargar and edad > self.recarga_min_tablas):
+                return None
+            return self.tablas
+
+    # Regresa el conjunto de tablas guardado aunque haya caducado, o None si no se ha consultado
+    def ultimastablas(self):
+        with self.candado:
+            return self.tablas
+
+    # Guarda la lista de tablas de los ordenadores consultada
+    def guardartablas(self,tablas):
+        with self.candado:
+            self.tablas = frozenset(tablas)
+            self.instante_tablas = time.monotonic()
+
+    # Elimina las fechas guardadas de una tabla (o de todas)
+    def invalidar(self,table=None):
+        with self.candado:
+            if table is None:
+                self.fechas = {}
+            else:
+                self.fechas.pop(table,None)
+
+    # Regresa los contadores de la cache
+    def estadisticas(self):
+        with self.candado:
+            return {
+                "tablas": len(self.fechas),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
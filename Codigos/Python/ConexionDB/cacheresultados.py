@@ -0,0 +1,114 @@
+# Clase: cacheresultados
+# Esta clase se encarga de guardar los resultados ya codificados de las peticiones para no repetir la query ni la codificacion
+# Es una cache LRU limitada por numero de entradas y por tamano en bytes
+# Las entradas caducan despues de "edad_maxima" segundos y las de una tabla se pueden invalidar cuando recibe registros atrasados
+# Por Fernando Daniel Ramirez
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class cacheresultados():
+
+    # El constructor recibe el numero maximo de entradas y el tamano maximo aproximado en bytes de la cache
+    # edad_maxima: segundos que se usa una entrada desde que se guardo (None = hasta que se desaloje o se invalide)
+    # Las ventanas historicas solo cambian si llegan registros atrasados que no se avisaron (por ejemplo, insertados por Node-RED)
+    def __init__(self,max_entradas=64,max_bytes=32*1024*1024,edad_maxima=3600):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.edad_maxima = edad_maxima
+        self.entradas = OrderedDict() # clave -> (resultado, columnas, fin, bytes, guardada); la entrada usada mas recientemente va al final
+        self.bytes = 0
+        self.candado = threading.Lock()
+
+        # Contadores
+        self.aciertos = 0 # Resultados regresados directamente de la cache
+        self.fallos = 0 # Resultados calculados desde cero
+        self.extensiones = 0 # Ventanas recientes extendidas solo con los registros nuevos
+        self.desalojos = 0 # Entradas eliminadas para respetar los limites
+        self.caducadas = 0 # Entradas eliminadas por superar la edad maxima
+        self.invalidadas = 0 # Entradas eliminadas porque su tabla recibio registros atrasados
+
+    # Regresa la entrada (resultado, columnas, fin) guardada con la clave, o None
+    def obtener(self,clave):
+        with self.candado:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                return None
+            if self.edad_maxima is not None and time.monotonic() - entrada[4] > self.edad_maxima:
+                del self.entradas[clave]
+                self.bytes -= entrada[3]
+                self.caducadas += 1
+                return None
+            self.entradas.move_to_end(clave)
+            return entrada[0],entrada[1],entrada[2]
+
+    # Guarda el resultado de una peticion (par de mensajes de potencia y energia)
+    # Opcionalmente guarda las columnas de datos de la ventana y la fecha final, para extender la ventana despues
+    # Las entradas se guardan sin copiarse: no deben modificarse despues de guardarse
+    def guardar(self,clave,resultado,columnas=None,fin=None):
+        tamano = self.calculartamano(resultado,columnas)
+        if tamano > self.max_bytes: # El resultado no cabe en la cache
+            return
+
+        with self.candado:
+            anterior = self.entradas.pop(clave,None)
+            if anterior is not None:
+                self.bytes -= anterior[3]
+
+            self.entradas[clave] = (resultado,columnas,fin,tamano,time.monotonic())
+            self.bytes += tamano
+
+            # Se eliminan las entradas usadas hace mas tiempo hasta respetar los limites
+            while len(self.entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                clave_vieja,entrada = self.entradas.popitem(last=False)
+                self.bytes -= entrada[3]
+                self.desalojos += 1
+
+    # Calcula el tamano aproximado en bytes de una entrada
+    def calculartamano(self,resultado,columnas):
+        tamano = 0
+        for mensaje in resultado:
+            if isinstance(mensaje,(str,bytes)):
+                tamano += len(mensaje)
+            else:
+                tamano += 64
+        if columnas is not None:
+            tamano += len(columnas) * 24 # segundos, potencia y energia de 8 bytes cada uno
+        return tamano
+
+    # Incrementa un contador: "aciertos", "fallos" o "extensiones"
+    def contar(self,contador):
+        with self.candado:
+            setattr(self,contador,getattr(self,contador) + 1)
+
+    # Elimina las entradas de una tabla (el primer elemento de la clave), por ejemplo al recibir registros atrasados
+    # Regresa el numero de entradas eliminadas
+    def invalidar(self,tabla):
+        with self.candado:
+            claves = [clave for clave in self.entradas if clave[0] == tabla]
+            for clave in claves:
+                self.bytes -= self.entradas.pop(clave)[3]
+            self.invalidadas += len(claves)
+            return len(claves)
+
+    # Elimina todas las entradas
+    def limpiar(self):
+        with self.candado:
+            self.entradas = OrderedDict()
+            self.bytes = 0
+
+    # Regresa los contadores de la cache
+    def estadisticas(self):
+        with self.candado:
+            return {
+                "entradas": len(self.entradas),
+                "bytes": self.bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "extensiones": self.extensiones,
+                "desalojos": self.desalojos,
+                "caducadas": self.caducadas,
+                "invalidadas": self.invalidadas,
+            }
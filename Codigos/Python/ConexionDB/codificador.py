@@ -0,0 +1,126 @@
+# Clase: codificador
+# Esta clase se encarga de codificar series de tiempo en formatos compactos para enviarlas por MQTT
+# Formatos:
+#  "COLUMNAR": JSON con la fecha inicial, el paso (o las diferencias) entre fechas y un arreglo por cada columna de valores
+#  "BINARIO": cabecera de 12 bytes y datos empaquetados (fecha inicial int64, diferencias int32, valores float32)
+#  "BINARIO_Z": igual que "BINARIO" con los datos comprimidos con zlib
+# El decodificador para una funcion de Node-RED esta en "Codigos/Node Red/decodificador_compacto.js"
+# Por Fernando Daniel Ramirez
+
+from array import array
+import json
+import struct
+import sys
+import zlib
+
+FORMATOS = ["JSON","COLUMNAR","BINARIO","BINARIO_Z"]
+
+# Cabecera del formato binario (little-endian): "CE", version, banderas, numero de puntos, numero de columnas de valores, 3 bytes de relleno
+CABECERA = struct.Struct("<2sBBIB3x")
+VERSION = 1
+BANDERA_ZLIB = 1
+
+
+class codificador():
+
+    def __init__(self):
+        pass
+
+    # Codifica una serie en el formato indicado
+    # segundos: fechas en segundos desde 1970-01-01 (columnasdatos), valores: lista de pares (nombre, columna de valores)
+    def codificar(self,formato,segundos,valores):
+        if formato == "COLUMNAR":
+            return self.columnar(segundos,valores)
+        elif formato == "BINARIO":
+            return self.binario(segundos,valores,False)
+        elif formato == "BINARIO_Z":
+            return self.binario(segundos,valores,True)
+        raise ValueError("Formato no valido: " + str(formato))
+
+    # Calcula las diferencias entre fechas consecutivas
+    def diferencias(self,segundos):
+        return [segundos[i] - segundos[i-1] for i in range(1,len(segundos))]
+
+    # Formato columnar: {"t0": fecha inicial, "paso": segundos entre puntos o null, "dt": diferencias (si no hay paso fijo), "<nombre>": [valores]}
+    def columnar(self,segundos,valores):
+        objeto = {"t0": segundos[0] if len(segundos) > 0 else None}
+
+        dt = self.diferencias(segundos)
+        if len(dt) > 0 and min(dt) == max(dt): # Paso fijo, no es necesario enviar las diferencias
+            objeto["paso"] = dt[0]
+        else:
+            objeto["paso"] = None
+            objeto["dt"] = dt
+
+        for (nombre,columna) in valores:
+            objeto[nombre] = list(columna)
+
+        return json.dumps(objeto,separators=(",",":"))
+
+    # Formato binario: cabecera + [t0 int64][n-1 diferencias int32][n valores float32 por cada columna]
+    # Las columnas van en el mismo orden que en "valores"
+    def binario(self,segundos,valores,comprimir):
+        n = len(segundos)
+
+        dt = array('i',self.diferencias(segundos))
+        columnas = [array('f',columna) for (nombre,columna) in valores]
+        if sys.byteorder != "little": # Los datos se envian siempre en little-endian
+            dt.byteswap()
+            for columna in columnas:
+                columna.byteswap()
+
+        datos = b""
+        if n > 0:
+            datos = struct.pack("<q",segundos[0]) + dt.tobytes() + b"".join(columna.tobytes() for columna in columnas)
+
+        banderas = 0
+        if comprimir:
+            datos = zlib.compress(datos)
+            banderas |= BANDERA_ZLIB
+
+        return CABECERA.pack(b"CE",VERSION,banderas,n,len(columnas)) + datos
+
+    # Decodifica el formato binario (para pruebas y para clientes en Python)
+    # Regresa las fechas en segundos y la lista de columnas de valores
+    def decodificarbinario(self,mensaje):
+        firma,version,banderas,n,k = CABECERA.unpack_from(mensaje,0)
+        if firma != b"CE" or version != VERSION:
+            raise ValueError("Mensaje binario no valido")
+
+        datos = mensaje[CABECERA.size:]
+        if banderas & BANDERA_ZLIB:
+            datos = zlib.decompress(datos)
+        if n == 0:
+            return [],[[] for i in range(k)]
+
+        t0 = struct.unpack_from("<q",datos,0)[0]
+        dt = array('i')
+        dt.frombytes(datos[8:8 + 4*(n-1)])
+        columnas = []
+        inicio = 8 + 4*(n-1)
+        for i in range(k):
+            columna = array('f')
+            columna.frombytes(datos[inicio:inicio + 4*n])
+            columnas.append(columna)
+            inicio += 4*n
+        if sys.byteorder != "little":
+            dt.byteswap()
+            for columna in columnas:
+                columna.byteswap()
+
+        segundos = [t0]
+        for d in dt:
+            segundos.append(segundos[-1] + d)
+
+        return segundos,[list(columna) for columna in columnas]
+
+if __name__ == '__main__': # Un ejemplo del funcionamiento de esta clase
+    import time
+    cod = codificador()
+    segundos = [1645085081 + 10*i for i in range(360)]
+    potencias = [27.5 + (i % 7) for i in range(360)]
+    texto = json.dumps([{"x":time.strftime('%Y-%m-%d %H:%M:%S',time.gmtime(s)),"y":p} for s,p in zip(segundos,potencias)])
+    for formato in FORMATOS[1:]:
+        mensaje = cod.codificar(formato,segundos,[("y",potencias)])
+        print(formato + ": " + str(len(mensaje)) + " bytes (JSON: " + str(len(texto)) + " bytes)")
+    print(cod.decodificarbinario(cod.codificar("BINARIO_Z",segundos,[("y",potencias)]))[0][:3])
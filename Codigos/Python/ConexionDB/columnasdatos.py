@@ -0,0 +1,89 @@
+# Clase: columnasdatos
+# Esta clase se encarga de guardar los registros extraidos de la base de datos en columnas compactas (arreglos)
+# Las fechas se guardan como segundos desde 1970-01-01 00:00:00, sin zona horaria, tal como se calculan en la query
+# Por Fernando Daniel Ramirez
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+EPOCA = datetime(1970,1,1,0,0,0) # Fecha desde la que se cuentan los segundos
+
+
+class columnasdatos():
+
+    # El constructor crea las columnas vacias
+    def __init__(self):
+        self.segundos = array('q') # Fecha de cada registro en segundos
+        self.potencias = array('d') # Potencia en W
+        self.energias = array('d') # Energia en J
+
+    def __len__(self):
+        return len(self.segundos)
+
+    # Agrega un lote de filas (segundos, potencia, energia) tal como las regresa el cursor
+    def agregarfilas(self,filas):
+        if len(filas) == 0:
+            return
+        segundos,potencias,energias = zip(*filas)
+        self.segundos.extend(segundos)
+        self.potencias.extend(potencias)
+        self.energias.extend(energias)
+
+    # Agrega un registro
+    def agregar(self,segundos,potencia,energia):
+        self.segundos.append(segundos)
+        self.potencias.append(potencia)
+        self.energias.append(energia)
+
+    # Regresa unas columnas nuevas con los registros desde la fecha "desde" (en segundos) seguidos de los registros de "nuevas"
+    # No modifica estas columnas, por eso se pueden usar las que estan guardadas en la cache de resultados
+    def recortarextender(self,desde,nuevas):
+        inicio = bisect_left(self.segundos,desde)
+        columnas = columnasdatos()
+        columnas.segundos = self.segundos[inicio:]
+        columnas.potencias = self.potencias[inicio:]
+        columnas.energias = self.energias[inicio:]
+        columnas.segundos.extend(nuevas.segundos)
+        columnas.potencias.extend(nuevas.potencias)
+        columnas.energias.extend(nuevas.energias)
+        return columnas
+
+    # Regresa las fechas como texto 'YYYY-mm-dd HH:MM:SS', igual que str(datetime)
+    # La parte de la fecha se calcula una vez por dia y la hora con operaciones enteras, sin crear objetos datetime por registro
+    def textos(self):
+        textos = []
+        dia_actual = None
+        prefijo = ""
+
+        for s in self.segundos:
+            dia,resto = divmod(s,86400)
+            if dia != dia_actual:
+                dia_actual = dia
+                prefijo = (EPOCA + timedelta(days=dia)).strftime('%Y-%m-%d ')
+            hora,resto = divmod(resto,3600)
+            minuto,segundo = divmod(resto,60)
+            textos.append(f"{prefijo}{hora:02d}:{minuto:02d}:{segundo:02d}")
+
+        return textos
+
+    # Regresa las fechas como objetos datetime (para graficar)
+    def fechas(self):
+        return [EPOCA + timedelta(seconds=s) for s in self.segundos]
+
+    # Regresa las columnas como arreglos de NumPy, sin copiar los datos
+    def anumpy(self):
+        import numpy as np # NumPy solo se necesita para los calculos vectorizados
+        return (np.frombuffer(self.segundos,dtype=np.int64),
+                np.frombuffer(self.potencias,dtype=np.float64),
+                np.frombuffer(self.energias,dtype=np.float64))
+
+    # Convierte una fecha en segundos desde EPOCA
+    @staticmethod
+    def asegundos(fecha):
+        return int((fecha - EPOCA).total_seconds())
+
+    # Convierte segundos desde EPOCA en una fecha
+    @staticmethod
+    def afecha(segundos):
+        return EPOCA + timedelta(seconds=segundos)
@@ -2,32 +2,110 @@
 # Esta clase se encarga de establecer una conexion con la base de datos y formular las querys para extraer datos de la base de datos
 # Por Fernando Daniel Ramirez
 
-import mariadb
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import matplotlib.dates as mdates
+from columnasdatos import columnasdatos
+from metricas import TRAZA_NULA
+
+# Tablas que usa el propio servicio y que no corresponden a un ordenador monitoreado
+TABLAS_INTERNAS = ["resumen_hora","resumen_dia"]
+
+TAMANO_LOTE = 5000 # Numero de filas que se leen del cursor en cada llamada a fetchmany
+
+SEGUNDOS_2000 = 946684800 # Segundos de 1970-01-01 a 2000-01-01, fecha desde la que se cuentan las cubetas
+
+MAX_SENTENCIAS = 128 # Querys preparadas que se guardan por conexion; al rebasarse se cierra la usada hace mas tiempo
 
 
 class conexionDB():
 
+    traza = TRAZA_NULA # Traza de la peticion que mide el tiempo de las querys (ver metricas); por defecto no mide nada
+
     # El constructor recibe los datos para conectarse a una base de datos
-    def __init__(self,usr,passw,host,port,database):
-        try:
-            self.conn = mariadb.connect(
-                user = usr,
-                password = passw,
-                host = host,
-                port = port,
-                database = database,
-            )
-            #print("Conector from database "+database)
-        except mariadb.Error as e:
-            print(f"Error connecting to MariaDB Platform: {e}");
-            sys.exit(1)
+    # Si recibe un pool de conexiones, toma una conexion del pool en lugar de abrir una nueva
+    # Si recibe una cache de fechas (cachefechas), la primera y ultima fecha de cada tabla se toman de ella
+    # backend: motor de base de datos (backendmariadb o backendsqlite); si no se da, se usa el del pool o MariaDB con los datos recibidos
+    # traza: opcional, traza de la peticion (metricas) en la que se miden las querys
+    def __init__(self,usr,passw,host,port,database,pool=None,cachefechas=None,backend=None,traza=None):
+        if traza is not None:
+            self.traza = traza
+        if backend is None and pool is not None:
+            backend = pool.backend
+        if backend is None:
+            from backendmariadb import backendmariadb
+            backend = backendmariadb(usr,passw,host,port,database)
+        self.backend = backend # Partes de las querys que dependen del motor de base de datos
+        self.pool = pool
+        self.database = database
+        self.cachefechas = cachefechas
+        self.limites = {} # Primera y ultima fecha de las tablas consultadas por este conector
+        self.tablas = None # Tablas de los ordenadores, si no hay cache de fechas (ver nombretabla)
+        self.sentencias = OrderedDict() # Cursores preparados por query, si la conexion no es del pool (ver ejecutar)
+
+        # Si la base de datos no esta disponible (o el pool no tiene conexiones libres) se lanza backend.Error,
+        # para que quien creo el conector decida que hacer (por ejemplo responder la peticion con un error)
+        if pool is not None:
+            self.conn = pool.obtener()
+            return
+
+        self.conn = backend.conectar()
+        #print("Conector from database "+database)
+
+    # Cierra la conexion con la base de datos, o la regresa al pool si se obtuvo de uno
+    # Si la conexion quedo en un estado invalido (valida = False), se descarta en lugar de regresarse al pool
+    def cerrar(self,valida=True):
+        if self.conn is None:
+            return
+        if self.pool is not None:
+            if valida:
+                self.pool.devolver(self.conn)
+            else:
+                self.pool.descartar(self.conn)
+        else:
+            self.conn.close()
+        self.conn = None
+
+    # Ejecuta una query con parametros y regresa el cursor con el resultado
+    # Cada query se prepara una sola vez por conexion: el cursor preparado se guarda (en el pool, si la conexion es del pool)
+    # y se reutiliza en las siguientes ejecuciones, asi las querys con la misma forma no se vuelven a analizar ni planear
+    # El cursor regresado no se debe cerrar, y su resultado se debe leer antes de ejecutar la misma query otra vez
+    def ejecutar(self,sql,parametros=()):
+        sentencias = self.pool.sentencias(self.conn) if self.pool is not None else self.sentencias
+        cur = sentencias.get(sql)
+        if cur is None:
+            cur = self.backend.cursorpreparado(self.conn)
+            sentencias[sql] = cur
+            if len(sentencias) > MAX_SENTENCIAS:
+                sentencias.popitem(last=False)[1].close()
+        else:
+            sentencias.move_to_end(sql)
+        cur.execute(sql,parametros)
+        return cur
+
+    # Regresa el nombre de una tabla listo para usarse en una query (entre las comillas del motor de base de datos)
+    # Los nombres llegan en las peticiones MQTT, por eso solo se aceptan las tablas de los ordenadores que existen en la base de datos
+    # Lanza ValueError si la tabla no existe
+    def nombretabla(self,table):
+        if not isinstance(table,str) or (table not in self.tablasconocidas(False) and table not in self.tablasconocidas(True)):
+            raise ValueError("Tabla no encontrada: " + str(table))
+        return self.backend.identificador(table)
+
+    # Regresa el conjunto de tablas de los ordenadores, de la cache de fechas o de este conector, consultandolo si no se tiene
+    # Con recargar = True se vuelve a consultar (para tablas creadas despues); con cache de fechas se consulta como maximo
+    # una vez cada pocos segundos, asi los nombres que no existen no generan una consulta cada uno
+    def tablasconocidas(self,recargar):
+        if self.cachefechas is not None:
+            tablas = self.cachefechas.obtenertablas(recargar)
+        else:
+            tablas = None if recargar else self.tablas
+        if tablas is None:
+            self.extraernombrestablas()
+            tablas = self.tablas
+        return tablas
 
     # Extrae datos de la base de datos segun los parametros recibidos
     def obtenerdatos(self,table,date,interval,mode):
-        cur = self.conn.cursor()
-
         # Determina si el intervalo de tiempo es antes o despues de la fecha recibida, segun el modo indicado
         date1 = ""
         date2 = ""
@@ -46,16 +124,141 @@ class conexionDB():
         #print("date1: " + str(date1))
         #print("date2: " + str(date2))
         
-        print("SELECT fecha,potencia,energia FROM " + str(table) + " WHERE fecha BETWEEN '" + str(date1) + "' AND '" + str(date2) + "'")
-        cur.execute("SELECT fecha,potencia,energia FROM " + str(table) + " WHERE fecha BETWEEN '" + str(date1) + "' AND '" + str(date2) + "'") # Se ejecuta la query
+        #print("SELECT fecha,potencia,energia FROM " + str(table) + " WHERE fecha BETWEEN '" + str(date1) + "' AND '" + str(date2) + "'")
+        cur = self.ejecutar("SELECT fecha,potencia,energia FROM " + self.nombretabla(table) + " WHERE fecha BETWEEN ? AND ?",(date1,date2)) # Se ejecuta la query
         fechas, potencias, energias = self.extraerdatosDB(cur) # Extrae los datos de la query
 
         return fechas,potencias,energias # Regresa las listas de los datos extraidos
 
+    # Extrae datos de la base de datos segun los parametros recibidos, en columnas (columnasdatos)
+    # La fecha se calcula en la query como segundos enteros, asi que ningun registro se convierte a texto ni se vuelve a leer
+    def obtenercolumnas(self,table,date,interval,mode):
+        # Determina si el intervalo de tiempo es antes o despues de la fecha recibida, segun el modo indicado
+        ventana = self.calcularventana(date,interval,mode)
+        if ventana is None:
+            return
+        date1,date2 = ventana
+
+        with self.traza.medir("sql"):
+            cur = self.ejecutar("SELECT " + self.backend.segundos("fecha") + ",COALESCE(potencia,0),COALESCE(energia,0) FROM " + self.nombretabla(table) +
+                                " WHERE fecha BETWEEN ? AND ? ORDER BY fecha",(date1,date2)) # Se ejecuta la query
+
+        return self.extraercolumnas(cur) # Regresa las columnas de los datos extraidos
+
+    # Extrae los registros posteriores a la fecha "date1" y hasta la fecha "date2" (incluida)
+    # Se usa para extender una ventana guardada en la cache solo con los registros nuevos
+    def obtenercolumnasnuevas(self,table,date1,date2):
+        with self.traza.medir("sql"):
+            cur = self.ejecutar("SELECT " + self.backend.segundos("fecha") + ",COALESCE(potencia,0),COALESCE(energia,0) FROM " + self.nombretabla(table) +
+                                " WHERE fecha > ? AND fecha <= ? ORDER BY fecha",(date1,date2)) # Se ejecuta la query
+
+        return self.extraercolumnas(cur)
+
+    # Extrae los registros desde la fecha "date1" (incluida) hasta antes de la fecha "date2"
+    # Se usa para completar con la base de datos la parte de una ventana anterior al buffer circular
+    def obtenercolumnasentre(self,table,date1,date2):
+        with self.traza.medir("sql"):
+            cur = self.ejecutar("SELECT " + self.backend.segundos("fecha") + ",COALESCE(potencia,0),COALESCE(energia,0) FROM " + self.nombretabla(table) +
+                                " WHERE fecha >= ? AND fecha < ? ORDER BY fecha",(date1,date2)) # Se ejecuta la query
+
+        return self.extraercolumnas(cur)
+
+    # Extrae datos de la base de datos segun los parametros recibidos, por bloques de "tamano_bloque" registros
+    # Es un generador: usa un cursor sin buffer, asi que la ventana completa nunca esta en memoria
+    # La conexion no puede ejecutar otras querys hasta terminar de recorrer los bloques
+    def obtenercolumnasporbloques(self,table,date,interval,mode,tamano_bloque):
+        ventana = self.calcularventana(date,interval,mode)
+        if ventana is None:
+            return
+        date1,date2 = ventana
+
+        cur = self.backend.cursorsinbuffer(self.conn)
+        try:
+            with self.traza.medir("sql"):
+                cur.execute("SELECT " + self.backend.segundos("fecha") + ",COALESCE(potencia,0),COALESCE(energia,0) FROM " + self.nombretabla(table) +
+                            " WHERE fecha BETWEEN ? AND ? ORDER BY fecha",(date1,date2)) # Se ejecuta la query
+                filas = cur.fetchmany(tamano_bloque)
+
+            while len(filas) > 0:
+                with self.traza.medir("decodificacion"):
+                    columnas = columnasdatos()
+                    columnas.agregarfilas(filas)
+                self.traza.contarfilas(len(filas))
+                yield columnas
+                with self.traza.medir("sql"):
+                    filas = cur.fetchmany(tamano_bloque)
+        finally:
+            cur.close()
+
+    # Extrae los datos de una query con columnas: segundos, potencia, energia, leyendolos por lotes
+    def extraercolumnas(self,cur):
+        columnas = columnasdatos()
+
+        with self.traza.medir("sql"):
+            filas = cur.fetchmany(TAMANO_LOTE)
+            while len(filas) > 0:
+                with self.traza.medir("decodificacion"):
+                    columnas.agregarfilas(filas)
+                filas = cur.fetchmany(TAMANO_LOTE)
+        self.traza.contarfilas(len(columnas))
+
+        return columnas
+
+    # Calcula el inicio y fin de la ventana de tiempo antes (DIFF) o despues (ADD) de la fecha recibida
+    def calcularventana(self,date,interval,mode):
+        if mode == "ADD":
+            return date,date + interval
+        elif mode == "DIFF":
+            return date - interval,date
+        print("Modo invalido")
+        return None
+
+    # Extrae datos agrupados en cubetas de "ancho" segundos segun los parametros recibidos
+    # Por cada cubeta regresa la primera y ultima fecha, la potencia minima, promedio y maxima, y la suma de la energia
+    def obtenerdatosagrupados(self,table,date,interval,mode,ancho):
+        # Determina si el intervalo de tiempo es antes o despues de la fecha recibida, segun el modo indicado
+        ventana = self.calcularventana(date,interval,mode)
+        if ventana is None:
+            return
+        date1,date2 = ventana
+
+        # Las cubetas se cuentan desde una fecha fija para que no dependan de la zona horaria de la sesion
+        with self.traza.medir("sql"):
+            cur = self.ejecutar("SELECT MIN(fecha),MAX(fecha),MIN(potencia),AVG(potencia),MAX(potencia),SUM(energia) FROM " + self.nombretabla(table) +
+                                " WHERE fecha BETWEEN ? AND ?" +
+                                " GROUP BY " + self.backend.divisionentera(self.backend.segundos("fecha") + " - " + str(SEGUNDOS_2000),ancho) +
+                                " ORDER BY 1",(date1,date2)) # Se ejecuta la query
+
+        return self.extraerdatosagrupados(cur) # Regresa las listas de los datos agrupados
+
+    # Extrae los datos agrupados de una query con columnas: fecha inicial, fecha final, potencia minima, promedio y maxima, energia
+    def extraerdatosagrupados(self,cur):
+
+        # Guarda los datos de cada cubeta en listas
+        fechas_ini = []
+        fechas_fin = []
+        potencias_min = []
+        potencias_prom = []
+        potencias_max = []
+        energias = []
+
+        with self.traza.medir("decodificacion"):
+            for (fecha_ini, fecha_fin, potencia_min, potencia_prom, potencia_max, energia) in cur:
+                fechas_ini.append(self.backend.afecha(fecha_ini))
+                fechas_fin.append(self.backend.afecha(fecha_fin))
+                potencias_min.append(float(potencia_min))
+                potencias_prom.append(float(potencia_prom))
+                potencias_max.append(float(potencia_max))
+                energias.append(float(energia))
+        self.traza.contarfilas(len(energias))
+
+        return fechas_ini,fechas_fin,potencias_min,potencias_prom,potencias_max,energias # Regresa las listas de los datos agrupados
+
     # Extrae los nombres de las tablas de la base de datos
+    # Los nombres se guardan como lista de tablas validas para las querys (ver nombretabla)
     def extraernombrestablas(self):
-        cur = self.conn.cursor()
-        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = \'" + self.conn.database + "\'") # Se ejecuta la query
+        sql,parametros = self.backend.sqltablas()
+        cur = self.ejecutar(sql,parametros) # Se ejecuta la query
 
 
         # Se guardan los nombres de las tablas en una lista
@@ -63,9 +266,14 @@ class conexionDB():
         
         for table_name in cur:
             for name in table_name:
-                table_names.append(name)
+                if name not in TABLAS_INTERNAS: # Solo se regresan las tablas de los ordenadores
+                    table_names.append(name)
         
         #print(table_names)
+
+        self.tablas = set(table_names)
+        if self.cachefechas is not None:
+            self.cachefechas.guardartablas(table_names)
         
         return table_names # Regresa lalistas de los nombres de las tablas de la base de datos
 
@@ -78,91 +286,109 @@ class conexionDB():
         potencias = []
         energias = []
         
+        # El conector ya regresa la fecha como datetime y los numeros como float, no es necesario convertirlos
         for (fecha, potencia, energia) in cur:
-            fechas.append(datetime.strptime(f"{fecha}", '%Y-%m-%d %H:%M:%S'))
-            #print(fecha)
-            #print(type(fecha))
-            
-            potencias.append(float(f"{potencia}"))
-            energias.append(float(f"{energia}"))
+            fechas.append(self.backend.afecha(fecha))
+            potencias.append(potencia)
+            energias.append(energia)
 
         #print("Fecha: " + str(fechas[len(fechas)-1]) + ", Potencia: " + str(potencias[len(potencias)-1]) + ", Energia: " + str(energias[len(energias)-1]))
         
         return fechas,potencias,energias # Regresa las listas de los datos obtenidos
 
+    # Obtiene la primera y ultima fecha registradas en una tabla
+    # Se consultan una sola vez por peticion (y por tabla) y, si hay una cache de fechas compartida, se toman de ella
+    # En caso de no haber registros en la tabla, ambas fechas corresponden al dia de hoy
+    def obtenerlimites(self,table):
+        limites = self.limites.get(table)
+        if limites is not None:
+            return limites
+
+        if self.cachefechas is not None:
+            limites = self.cachefechas.obtener(table)
+
+        if limites is None:
+            nombre = self.nombretabla(table)
+            # Con ORDER BY ... LIMIT 1 la base de datos lee solo un extremo del indice de fecha en lugar de toda la tabla
+            with self.traza.medir("limites"):
+                cur = self.ejecutar("SELECT (SELECT fecha FROM " + nombre + " WHERE fecha IS NOT NULL ORDER BY fecha ASC LIMIT 1)," +
+                                    "(SELECT fecha FROM " + nombre + " WHERE fecha IS NOT NULL ORDER BY fecha DESC LIMIT 1)")
+                primera,ultima = cur.fetchone()
+            primera,ultima = self.backend.afecha(primera),self.backend.afecha(ultima)
+            if self.cachefechas is not None and primera is not None:
+                self.cachefechas.guardar(table,primera,ultima)
+            limites = (primera,ultima)
+
+        if limites[0] is None:
+            today = datetime.now()
+            hoy = datetime(today.year,today.month,today.day,0,0,0)
+            limites = (hoy,hoy)
+
+        self.limites[table] = limites
+        return limites
+
     # Obtiene la fecha mas cercana a la almacenada en la base de datos
     def obtenerfecha(self,table,date,mode):
-        cur = self.conn.cursor()
         #print("mode:" + str(mode))
         #print("type(mode):" + str(type(mode)))
         #print("mode == INI:" + str(mode == "INI"))
 
-        
         if mode == "FIN": # Obtiene la ultima fecha registrada en la base de datos
             #print("modo fin")
-            cur.execute("SELECT potencia,max(fecha) FROM " + table)
-            
+            return self.obtenerlimites(table)[1]
         elif mode == "INI": # Obtiene la primera fecha registrada en la base de datos
             #print("modo ini")
-            cur.execute("SELECT potencia,min(fecha) FROM " + table)
+            return self.obtenerlimites(table)[0]
         elif mode == "FECHA": # Obtiene la fecha mas cercana registrada en la base de datos
             #print("modo fecha")
-            return self.verificarfecha(cur,table,date) # Verifica si la fecha dada esta entre la primera y ultima fecha registrada en la base de datos
+            return self.verificarfecha(table,date) # Verifica si la fecha dada esta entre la primera y ultima fecha registrada en la base de datos
         elif mode == "MES": # Para este modo no se realiza ninguna modificacion
             return date
             #print("modo mes")
         else:
             print("Modo no valido")
             return ""
-        
-        fecha_obtenida = ""
-
-        # Se extrae la fecha mas cercana registrada en la base de datos
-        for (potencia,fecha) in cur:
-            #print(fecha)
-            #print(type(fecha))
-            #print(fecha is None)
-            if fecha is None: # En caso de no haber registros de la base de datos, se regresa la fecha correspondiente al dia de hoy
-                #print("fecha is null")
-                today = datetime.now()
-                fecha_obtenida = datetime(today.year,today.month,today.day,0,0,0)
-            else:
-                #print("fecha valida")
-                fecha_obtenida = datetime.strptime(f"{fecha}", '%Y-%m-%d %H:%M:%S')
-            #print(fecha)
-        
-        #print("fecha_obtenida: " + str(fecha_obtenida))
-
-        return fecha_obtenida # Regresa la fecha obtenida
 
     
     # Verifica que la fecha recibida este entre la primera y ultima fecha almacenadas en la base de datos
-    def verificarfecha(self,cur,table,date):
+    def verificarfecha(self,table,date):
 
         # Obtiene la primera y ultima fecha registradas en la base de datos
-        primera_fecha = self.obtenerfecha(table,-1,"INI")
-        ultima_fecha = self.obtenerfecha(table,-1,"FIN")
+        primera_fecha,ultima_fecha = self.obtenerlimites(table)
         if date <= primera_fecha: # En caso de que la fecha recibida sea anterior a la primera fecha registrada de la base de datos, regresa la primera fecha
-            return self.obtenerfecha(table,-1,"INI")
+            return primera_fecha
         elif date >= ultima_fecha: # En caso de que la fecha recibida sea superior a la ultima fecha registrada de la base de datos, regresa la ultima fecha
-            return self.obtenerfecha(table,-1,"FIN")
-        else: # En caso de que la fecha recibida este entre la primera y ultima fecha registrada en la base de datos, se calcula la fecha mas cercana almacenada en la base de datos
-            delta_date = self.obtenerdeltafecha(0,0,15,0)
-            date1 = date - delta_date
-            date2 = date + delta_date
-            cur.execute("SELECT fecha,potencia FROM " + str(table) + " WHERE fecha BETWEEN '" + str(date1) + "' AND '" + str(date2) + "'")
-            
-            #fecha_obtenida = ""
-
-            #Se extrae la fecha mas cercana registrada en la base de datos
-            for (fecha,potencia) in cur:
-                fecha_obtenida = datetime.strptime(f"{fecha}", '%Y-%m-%d %H:%M:%S')
-                if date - fecha_obtenida < timedelta(seconds=0):
-                    #print("fecha_obtenida: " + str(fecha_obtenida))
-                    return fecha_obtenida
-                
-        return self.obtenerfecha(table,-1,"FIN")
-                
+            return ultima_fecha
+        else: # En caso de que la fecha recibida este entre la primera y ultima fecha registrada en la base de datos, se obtiene la fecha mas cercana almacenada en la base de datos
+            return self.fechamascercana(table,date)
+
+    # Obtiene la ultima fecha registrada anterior o igual a la fecha recibida, o None si no hay ninguna
+    def fechaanterior(self,table,date):
+        cur = self.ejecutar("SELECT fecha FROM " + self.nombretabla(table) + " WHERE fecha <= ? ORDER BY fecha DESC LIMIT 1",(date,)) # Una sola busqueda en el indice de fecha
+        fila = cur.fetchone()
+        return self.backend.afecha(fila[0]) if fila is not None else None
+
+    # Obtiene la primera fecha registrada posterior o igual a la fecha recibida, o None si no hay ninguna
+    def fechaposterior(self,table,date):
+        cur = self.ejecutar("SELECT fecha FROM " + self.nombretabla(table) + " WHERE fecha >= ? ORDER BY fecha ASC LIMIT 1",(date,)) # Una sola busqueda en el indice de fecha
+        fila = cur.fetchone()
+        return self.backend.afecha(fila[0]) if fila is not None else None
+
+    # Obtiene la fecha registrada mas cercana a la fecha recibida, o None si la tabla esta vacia
+    # En caso de empate se prefiere la fecha posterior
+    def fechamascercana(self,table,date):
+        with self.traza.medir("limites"):
+            anterior = self.fechaanterior(table,date)
+            posterior = self.fechaposterior(table,date)
+
+        if anterior is None:
+            return posterior
+        if posterior is None:
+            return anterior
+        if date - anterior < posterior - date:
+            return anterior
+        return posterior
+
     # Obtiene un delta de tiempo dados los parametros
     def obtenerdeltafecha(self,day,hour,minute,second):
         delta_fecha = timedelta(days=day,hours=hour,minutes=minute,seconds=second)
@@ -4,20 +4,95 @@
 
 import paho.mqtt.client as mqtt
 from manejoJSON import manejoJSON
-from extraerdatosDB import extraerdatosDB
+from extraerdatosDB import extraerdatosDB, DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, crearbackend
+from poolconexiones import poolconexiones
+from ejecutorpeticiones import ejecutorpeticiones
+from cachefechas import cachefechas
+from cacheresultados import cacheresultados
+from buffercircular import buffercircular
+from ingestaMQTT import ingestaMQTT, TEMA_ACTUALIZADOS
+from columnasdatos import columnasdatos
+from codificador import FORMATOS
+from metricas import metricas
+from analisispatrones import analisispatrones
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime,timedelta
+import json
 import math
+import re
+import threading
+import time
+import uuid
+
+TEMA_DISPOSITIVOS = "capstone_energia/potencia" # Tema en el que los ordenadores publican sus mediciones
+TEMA_ESTADISTICAS = "capstone_energia/estadisticas" # Tema en el que se publican periodicamente las metricas del servicio
+MODOS = ("DIFF","ADD","FECHA","MES","TABLA") # Modos de las peticiones; cualquier otro se cuenta en las metricas como "INVALIDO"
+TEMA_ERRORES = "capstone_energia/errores" # Tema en el que se avisa que una peticion no se pudo atender
+TEMA_EVENTOS = "capstone_energia/eventos" # Tema en el que se publican los picos, caidas, periodos y huecos de las mediciones
+TEMA_PERFILES = "capstone_energia/perfilDiario" # Tema en el que se publica el perfil de consumo de cada ordenador al terminar el dia
 
 
 class conexionMQTT():
     
     # El constructor recibe los datos para conectarse a un broker a traves del protocolo MQTT
-    def __init__(self,addr,usr,passw,topic):
+    # Opcionalmente recibe un pool de conexiones a la base de datos; si no se da, se crea uno que dura lo mismo que el servicio
+    # Las peticiones se atienden en "hilos" hilos de trabajo con una cola de "tamano_cola" peticiones (ver ejecutorpeticiones);
+    # con hilos = 0 se atienden directamente en el hilo de red de MQTT
+    # Las peticiones de varios ordenadores (flota) consultan las tablas al mismo tiempo en "hilos_flota" hilos
+    # Las mediciones de los ordenadores se guardan en un buffer circular de "capacidad_buffer" muestras por ordenador (0 = sin buffer)
+    # Si recibe un cliente (con el metodo publish, por ejemplo uno falso para pruebas), lo usa en lugar de conectarse al broker
+    # trazas: mide el tiempo de cada etapa de las peticiones (ver metricas); umbral_lento: segundos a partir de los que se imprime la traza de una peticion
+    # Las metricas se publican en JSON cada "intervalo_estadisticas" segundos en capstone_energia/estadisticas (0 = no se publican)
+    # y, si se da "puerto_metricas", se sirven en formato de Prometheus en http://<equipo>:<puerto_metricas>/metrics
+    # Los resumenes por hora y por dia se ponen al dia al iniciar y despues cada "intervalo_resumenes" segundos en su propio hilo (0 = solo al iniciar),
+    # nunca dentro de las peticiones; lo que aun no esta resumido se lee de los registros (ver resumenesDB)
+    # analisis: busca patrones en las mediciones conforme llegan (ver analisispatrones) y publica los eventos en capstone_energia/eventos
+    # y los perfiles diarios en capstone_energia/perfilDiario
+    def __init__(self,addr,usr,passw,topic,pool=None,hilos=4,tamano_cola=32,politica="DESCARTAR_ANTIGUO",hilos_flota=4,capacidad_buffer=8640,cliente=None,
+                 trazas=True,umbral_lento=None,intervalo_estadisticas=60,puerto_metricas=None,analisis=True,intervalo_resumenes=300):
         self.MQTT_ADDRESS = addr
         self.MQTT_USER = usr
         self.MQTT_PASSWORD = passw
         self.MQTT_TOPIC = topic
 
+        if pool is None:
+            pool = poolconexiones(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,tamano_max=max(4,hilos) + hilos_flota,backend=crearbackend())
+        self.pool = pool # Conexiones a la base de datos compartidas entre todas las peticiones
+        self.cachefechas = cachefechas() # Primera y ultima fecha de cada tabla compartidas entre todas las peticiones
+        self.candado_tablas = threading.Lock()
+        self.recargando_tablas = False # Hay un hilo consultando la lista de tablas (ver dispositivo_conocido)
+        self.cacheresultados = cacheresultados() # Resultados ya codificados compartidos entre todas las peticiones
+        self.buffer = None
+        if capacidad_buffer > 0:
+            self.buffer = buffercircular(capacidad_buffer) # Muestras recientes de cada ordenador para las ventanas de los ultimos minutos
+        self.analisis = None
+        if analisis:
+            self.analisis = analisispatrones() # Estadisticas de la potencia de cada ordenador, sin guardar las mediciones
+
+        self.ejecutor = None
+        if hilos > 0:
+            self.ejecutor = ejecutorpeticiones(hilos,tamano_cola,politica,self.descartar_peticion) # Atiende las peticiones fuera del hilo de red
+        self.ejecutorflota = ThreadPoolExecutor(max_workers=max(1,hilos_flota)) # Consulta las tablas de una peticion de flota
+
+        self.metricas = metricas(trazas,umbral_lento) # Tiempos, filas y bytes de las peticiones
+        if puerto_metricas is not None:
+            self.metricas.servir(puerto_metricas,self.componentes)
+
+        # Se ponen al dia los resumenes por hora y por dia de todas las tablas antes de atender peticiones
+        # (la lista de tablas consultada queda en la cache de fechas para reconocer las mediciones de los ordenadores)
+        extrDB = extraerdatosDB(self.pool,self.cachefechas)
+        extrDB.resumenes.actualizartodas()
+        extrDB.cerrar()
+
+        if cliente is not None: # Sin conexion al broker, los mensajes se entregan llamando a on_message
+            self.mqtt_client = cliente
+            return
+
+        if intervalo_estadisticas > 0:
+            threading.Thread(target=self.publicar_estadisticas,args=(intervalo_estadisticas,),name="estadisticas",daemon=True).start()
+        if intervalo_resumenes > 0:
+            threading.Thread(target=self.actualizar_resumenes,args=(intervalo_resumenes,),name="resumenes",daemon=True).start()
+
         self.mqtt_client = mqtt.Client()
         self.mqtt_client.username_pw_set(self.MQTT_USER, self.MQTT_PASSWORD)
         self.mqtt_client.on_connect = self.on_connect
@@ -31,26 +106,354 @@ class conexionMQTT():
         """ The callback for when the client receives a CONNACK response from the server."""
         print('Connected with result code ' + str(rc))
         client.subscribe(self.MQTT_TOPIC)
+        client.subscribe(TEMA_ACTUALIZADOS)
+        if self.buffer is not None or self.analisis is not None:
+            client.subscribe(TEMA_DISPOSITIVOS)
 
     # Cuando llega un mensaje en el tema suscrito, se ejecuta este metodos
     def on_message(self,client, userdata, msg):
         """The callback for when a PUBLISH message is received from the server."""
-        print(msg.topic + ' ' + str(msg.payload))
-        self.obtener_datos(msg.payload) # Obtiene los datos solicitados
+        if msg.topic == TEMA_DISPOSITIVOS: # Medicion de un ordenador, solo se guarda en el buffer circular y se analiza
+            self.guardar_medicion(msg.payload)
+            return
+        if msg.topic == TEMA_ACTUALIZADOS: # Una tabla recibio registros atrasados
+            self.invalidar_cache(msg.payload)
+            return
+        #print(msg.topic + ' ' + str(msg.payload))
+        if self.ejecutor is not None:
+            if not self.ejecutor.enviar(self.obtener_datos,msg.payload,time.perf_counter()): # Obtiene los datos solicitados en un hilo de trabajo
+                print("Peticion descartada, cola llena")
+        else:
+            try:
+                self.obtener_datos(msg.payload) # Obtiene los datos solicitados
+            except Exception as e: # Ya se aviso a quien hizo la peticion; el error no debe detener el hilo de red de MQTT
+                print(f"Error al atender la peticion: {e}")
+
+    # Guarda la medicion de un ordenador (con tabla en la base de datos) en el buffer circular con la fecha en que se recibio,
+    # la analiza y publica los eventos y perfiles diarios que encuentre el analisis de patrones
+    def guardar_medicion(self,payload):
+        registro = ingestaMQTT.validar(payload)
+        if registro is None:
+            return
+        tabla,fecha,potencia,energia = registro
+        if not self.dispositivo_conocido(tabla): # Ni el buffer ni el analisis guardan estado de identificadores sin tabla
+            return
+        segundos = columnasdatos.asegundos(fecha)
+        if self.buffer is not None:
+            self.buffer.agregar(tabla,segundos,potencia,energia)
+        if self.analisis is not None:
+            eventos,perfiles = self.analisis.agregar(tabla,segundos,potencia,energia)
+            for evento in eventos:
+                self.publicar(TEMA_EVENTOS,json.dumps(evento))
+            for perfil in perfiles:
+                self.publicar(TEMA_PERFILES,json.dumps(perfil))
+
+    # Elimina de la cache de resultados los de la tabla que recibio registros atrasados (aviso {"id","desde"} de ingestaMQTT)
+    def invalidar_cache(self,payload):
+        try:
+            tabla = str(json.loads(payload)["id"])
+        except (ValueError,TypeError,KeyError):
+            return
+        eliminadas = self.cacheresultados.invalidar(tabla)
+        if eliminadas > 0:
+            print(f"{tabla}: {eliminadas} resultado(s) eliminados de la cache por registros atrasados")
+
+    # Indica si un ordenador tiene tabla en la base de datos, con la lista de tablas en cache (cachefechas)
+    # El tema de los dispositivos esta abierto: asi los identificadores inventados no ocupan memoria en el servicio
+    # Se llama desde el hilo de red de MQTT, por eso nunca espera a la base de datos: si la lista caduco o el identificador
+    # no esta en ella, se vuelve a consultar en otro hilo (como maximo una vez cada pocos segundos) y mientras tanto
+    # se usa la ultima lista consultada; las mediciones de un ordenador nuevo se descartan hasta que aparece en la lista
+    def dispositivo_conocido(self,tabla):
+        tablas = self.cachefechas.obtenertablas()
+        if tablas is not None and tabla in tablas:
+            return True
+        if self.cachefechas.obtenertablas(True) is None: # La lista caduco o no es reciente
+            self.recargar_tablas()
+        tablas = self.cachefechas.ultimastablas()
+        return tablas is not None and tabla in tablas
+
+    # Consulta la lista de tablas en un hilo aparte, si no se esta consultando ya
+    def recargar_tablas(self):
+        with self.candado_tablas:
+            if self.recargando_tablas:
+                return
+            self.recargando_tablas = True
+        threading.Thread(target=self.consultar_tablas,name="tablas",daemon=True).start()
+
+    # Consulta la lista de tablas de la base de datos; se guarda en la cache de fechas
+    def consultar_tablas(self):
+        try:
+            try:
+                extrDB = extraerdatosDB(self.pool,self.cachefechas)
+            except self.pool.backend.Error as e:
+                print(f"Error al consultar las tablas: {e}")
+                return
+            try:
+                extrDB.connDB.extraernombrestablas() # Tambien se guardan en la cache de fechas
+            except self.pool.backend.Error as e:
+                print(f"Error al consultar las tablas: {e}")
+                extrDB.cerrar(False)
+                return
+            extrDB.cerrar()
+        finally:
+            with self.candado_tablas:
+                self.recargando_tablas = False
+
+    # Obtiene el identificador de la peticion, si el mensaje lo incluye, para correlacionar la respuesta
+    # Se aceptan solo caracteres validos dentro de un tema MQTT
+    def obtener_id_peticion(self,parametrosdict):
+        id_peticion = parametrosdict.get("id")
+        if id_peticion is None:
+            return None
+        id_peticion = str(id_peticion)
+        if re.fullmatch(r"[A-Za-z0-9_\-]{1,64}",id_peticion) is None:
+            print("Identificador de peticion no valido: " + id_peticion)
+            return None
+        return id_peticion
+
+    # Obtiene del mensaje las opciones para reducir el numero de puntos enviados
+    # "puntos": numero aproximado de puntos, "resolucion": ancho de cubeta en segundos, "reduccion": "PROMEDIO" o "LTTB"
+    # "bloque": numero de registros por mensaje para enviar los datos por bloques (ver publicar_bloques)
+    # "formato": "JSON" (por defecto) o un formato compacto "COLUMNAR", "BINARIO" o "BINARIO_Z" (ver codificador)
+    # "acumulado": "VENTANA" (por defecto) acumula la energia desde el inicio de la ventana, "TOTAL" desde el primer registro
+    def obtener_opciones(self,parametrosdict):
+        opciones = {}
+        if parametrosdict.get("puntos") not in (None,"null",""):
+            opciones["puntos"] = abs(int(float(parametrosdict["puntos"])))
+        if parametrosdict.get("resolucion") not in (None,"null",""):
+            opciones["resolucion"] = abs(float(parametrosdict["resolucion"]))
+        if parametrosdict.get("reduccion") in ("PROMEDIO","LTTB"):
+            opciones["reduccion"] = parametrosdict["reduccion"]
+        if parametrosdict.get("bloque") not in (None,"null",""): # Numero de registros por bloque para enviar los datos por bloques
+            opciones["bloque"] = abs(int(float(parametrosdict["bloque"])))
+        if parametrosdict.get("formato") in FORMATOS:
+            opciones["formato"] = parametrosdict["formato"]
+        if parametrosdict.get("acumulado") in ("VENTANA","TOTAL"):
+            opciones["acumulado"] = parametrosdict["acumulado"]
+        return opciones
+
+    # Publica un mensaje; si la peticion tiene identificador, la respuesta se publica en el subtema <tema>/<id>
+    # para que quien hizo la peticion reciba su respuesta aunque otras se atiendan al mismo tiempo
+    # traza: opcional, traza de la peticion en la que se mide la publicacion y se cuentan los bytes publicados
+    def publicar(self,topic,payload,id_peticion=None,traza=None):
+        if id_peticion is not None:
+            topic = topic + "/" + id_peticion
+        if traza is None:
+            self.mqtt_client.publish(topic,payload)
+            return
+        with traza.medir("publicacion"):
+            self.mqtt_client.publish(topic,payload)
+        traza.contarbytes(len(payload) if isinstance(payload,(str,bytes)) else len(str(payload))) # Los JSON son ASCII, el numero de caracteres es el de bytes
+
+    # Regresa las estadisticas de los componentes del servicio (pool, caches, ejecutor, buffer circular y analisis de patrones)
+    def componentes(self):
+        componentes = {
+            "pool": self.pool.estadisticas(),
+            "cachefechas": self.cachefechas.estadisticas(),
+            "cacheresultados": self.cacheresultados.estadisticas(),
+        }
+        if self.ejecutor is not None:
+            componentes["ejecutor"] = self.ejecutor.estadisticas()
+        if self.buffer is not None:
+            componentes["buffer"] = self.buffer.estadisticas()
+        if self.analisis is not None:
+            componentes["analisis"] = self.analisis.estadisticas()
+        return componentes
+
+    # Regresa las metricas de las peticiones junto con las estadisticas de los componentes
+    def estadisticas(self):
+        return self.metricas.estadisticas(self.componentes())
+
+    # Publica las estadisticas en JSON en capstone_energia/estadisticas cada "intervalo" segundos (en su propio hilo)
+    def publicar_estadisticas(self,intervalo):
+        while True:
+            time.sleep(intervalo)
+            try:
+                self.publicar(TEMA_ESTADISTICAS,json.dumps(self.estadisticas()))
+            except Exception as e: # Un error al publicar no debe terminar el hilo
+                print(f"Error al publicar las estadisticas: {e}")
+
+    # Pone al dia los resumenes de todas las tablas cada "intervalo" segundos (en su propio hilo)
+    # Un solo hilo escribe los resumenes, asi las peticiones solo los leen y no compiten por los mismos registros
+    def actualizar_resumenes(self,intervalo):
+        while True:
+            time.sleep(intervalo)
+            try:
+                extrDB = extraerdatosDB(self.pool)
+            except self.pool.backend.Error as e:
+                print(f"Error al actualizar los resumenes: {e}")
+                continue
+            try:
+                extrDB.resumenes.actualizartodas()
+            except self.pool.backend.Error as e:
+                print(f"Error al actualizar los resumenes: {e}")
+                extrDB.cerrar(False)
+                continue
+            extrDB.cerrar()
+
+    # Publica los datos de una ventana por bloques en el tema capstone_energia/datosBloques (o en su subtema <id>)
+    # Protocolo: un mensaje {"id","tipo":"inicio","bloque"}, un mensaje {"id","tipo":"datos","seq","potencia","energia"}
+    # por cada bloque de hasta "bloque" registros, y un mensaje {"id","tipo":"fin","bloques","total"} con el numero de bloques y registros
+    # Asi la memoria usada no depende del tamano de la ventana y los primeros puntos llegan antes al panel
+    # Los bloques siempre se envian en JSON, las opciones de resolucion y formato no se aplican
+    def publicar_bloques(self,extrDB,peticion,tamano_bloque,id_peticion,acumulado="VENTANA"):
+        topic = "capstone_energia/datosBloques"
+        id_flujo = id_peticion if id_peticion is not None else uuid.uuid4().hex[:12] # Identificador del flujo de bloques
+
+        traza = extrDB.traza
+        self.publicar(topic,json.dumps({"id":id_flujo,"tipo":"inicio","bloque":tamano_bloque}),id_peticion,traza)
+
+        seq = 0
+        total = 0
+        for list_p,list_e in extrDB.extraerdatosporbloques(*peticion,tamano_bloque,acumulado):
+            with traza.medir("codificacion"):
+                mensaje = json.dumps({"id":id_flujo,"tipo":"datos","seq":seq,"potencia":list_p,"energia":list_e})
+            self.publicar(topic,mensaje,id_peticion,traza)
+            seq += 1
+            total += len(list_p)
+
+        self.publicar(topic,json.dumps({"id":id_flujo,"tipo":"fin","bloques":seq,"total":total}),id_peticion,traza)
+
+    # Si "nombre" es una lista de tablas o "TODOS", regresa la lista de tablas de la peticion de flota; si es una sola tabla regresa None
+    def obtener_tablas_flota(self,nombre,extrDB):
+        if nombre == "TODOS":
+            return sorted(extrDB.connDB.tablasconocidas(False))
+        if isinstance(nombre,list):
+            return [str(tabla) for tabla in nombre]
+        return None
+
+    # Atiende una peticion de varios ordenadores: las tablas se consultan al mismo tiempo, cada una con su conexion del pool
+    # Publica en capstone_energia/datosFlota un solo mensaje con los datos de cada ordenador y los totales de la flota:
+    # {"modo","dispositivos":{tabla:{"potencia","energia","energia_ventana"}},"totales":{"dispositivos","energia","potencia_promedio"},"errores":{tabla:mensaje}}
+    # En el modo "MES" cada ordenador solo lleva "energia_ventana" (consumo del mes en kWh)
+    # Los formatos binarios no se pueden incluir en un mensaje JSON, en su lugar se usa "COLUMNAR"
+    # modo: modo de la peticion ("DIFF", "ADD", "FECHA" o "MES") que se publica en "modo"
+    def atender_flota(self,extrDB,tablas,peticion,opciones,id_peticion,modo):
+        if opciones.get("formato") in ("BINARIO","BINARIO_Z"):
+            opciones["formato"] = "COLUMNAR"
+
+        errores = {}
+        futuros = {}
+        for tabla in dict.fromkeys(tablas): # Sin tablas repetidas, en el mismo orden
+            try:
+                extrDB.connDB.nombretabla(tabla) # Las tablas que no existen se reportan como error sin consultarse (lista de tablas en cache)
+            except ValueError:
+                errores[tabla] = "Tabla no encontrada"
+            else:
+                traza = extrDB.traza.hija() # Cada hilo mide en su propia traza
+                futuros[tabla] = (self.ejecutorflota.submit(self.extraer_dispositivo,(tabla,) + tuple(peticion[1:]),opciones,traza),traza)
+
+        partes = []
+        energia_total = 0
+        potencia_total = 0
+        for tabla,(futuro,traza) in futuros.items():
+            try:
+                str_p,str_e,energia,duracion = futuro.result()
+            except Exception as e:
+                errores[tabla] = str(e)
+                continue
+            finally:
+                extrDB.traza.unir(traza)
+            energia_total += energia
+            if duracion > 0:
+                potencia_total += energia * 3.6e+6 / duracion # Potencia promedio en W de la ventana
+            if peticion[1] == "MES":
+                partes.append(json.dumps(tabla) + ":{\"energia_ventana\":" + json.dumps(energia) + "}")
+            else:
+                # Los datos de cada ordenador ya estan en JSON, se insertan sin volver a decodificarse
+                partes.append(json.dumps(tabla) + ":{\"potencia\":" + str_p + ",\"energia\":" + str_e + ",\"energia_ventana\":" + json.dumps(energia) + "}")
+
+        totales = {"dispositivos":len(partes),"energia":energia_total,"potencia_promedio":potencia_total}
+        mensaje = ("{\"modo\":" + json.dumps(modo) + ",\"dispositivos\":{" + ",".join(partes) + "}" +
+                   ",\"totales\":" + json.dumps(totales) + ",\"errores\":" + json.dumps(errores) + "}")
+        self.publicar("capstone_energia/datosFlota",mensaje,id_peticion,extrDB.traza)
+
+    # Extrae los datos de un ordenador de una peticion de flota con su propia conexion del pool
+    # Regresa los mensajes de potencia y energia, la energia de la ventana en kWh y la duracion de la ventana en segundos
+    def extraer_dispositivo(self,peticion,opciones,traza=None):
+        extrDB = extraerdatosDB(self.pool,self.cachefechas,self.cacheresultados,self.buffer,traza)
+        try:
+            if peticion[1] == "MES":
+                str_p,energia = extrDB.extraerdatos(*peticion)
+                str_e = None
+                duracion = peticion[3] * 60
+            else:
+                str_p,str_e = extrDB.extraerdatos(*peticion,**opciones)
+                energia,duracion = extrDB.energiaventana(*peticion)
+        except Exception:
+            extrDB.cerrar(False)
+            raise
+        extrDB.cerrar()
+        return str_p,str_e,energia,duracion
 
     # Este metodo obtiene los datos solicitados, segun los parametros del mensaje recibido
-    def obtener_datos(self,paramjson):
+    # recibido: opcional, momento (time.perf_counter) en que se recibio el mensaje, para medir la espera en la cola
+    def obtener_datos(self,paramjson,recibido=None):
+        traza = self.metricas.traza() # Mide cada etapa de la peticion
+        if recibido is not None:
+            traza.agregar("espera_cola",time.perf_counter() - recibido)
+
         # Parse json
         mjson = manejoJSON() # Crea un objeto para leer objetos JSON
-        extrDB = extraerdatosDB() # Crea un objeto para extraer datos de la base de datos
-        
+        try:
+            extrDB = extraerdatosDB(self.pool,self.cachefechas,self.cacheresultados,self.buffer,traza) # Crea un objeto para extraer datos de la base de datos con una conexion del pool
+        except self.pool.backend.Error as e: # Base de datos no disponible o pool sin conexiones libres
+            print(f"Error connecting to the database: {e}")
+            traza.terminar(True)
+            self.publicar_error(mjson,paramjson,e)
+            raise
+
+        try:
+            self.atender_peticion(mjson,extrDB,paramjson)
+        except ValueError as e: # Peticion invalida (por ejemplo una tabla que no existe): no se consulto nada y la conexion sigue siendo valida
+            extrDB.cerrar()
+            traza.terminar(True)
+            print(e)
+            self.publicar_error(mjson,paramjson,e)
+            return
+        except Exception as e:
+            extrDB.cerrar(False) # La conexion pudo quedar en un estado invalido, se descarta
+            traza.terminar(True)
+            self.publicar_error(mjson,paramjson,e)
+            raise
+        extrDB.cerrar() # Se regresa la conexion al pool
+        traza.terminar()
+
+    # Cuenta una peticion que el ejecutor descarto por tener la cola llena y avisa a quien la hizo en capstone_energia/errores,
+    # para que no se quede esperando la respuesta
+    def descartar_peticion(self,paramjson,recibido=None):
+        self.metricas.contardescartada()
+        self.publicar_error(manejoJSON(),paramjson,"Peticion descartada, cola llena")
+
+    # Avisa a quien hizo la peticion que no se pudo atender, con un mensaje {"id","error"} en capstone_energia/errores (o en su subtema <id>)
+    def publicar_error(self,mjson,paramjson,error):
+        id_peticion = None
+        try:
+            id_peticion = self.obtener_id_peticion(mjson.convertirJSON(paramjson))
+        except Exception: # El mensaje no es un objeto JSON: el aviso se publica sin identificador
+            pass
+        try:
+            self.publicar(TEMA_ERRORES,json.dumps({"id":id_peticion,"error":str(error)}),id_peticion)
+        except Exception as e:
+            print(f"Error al publicar el aviso de error: {e}")
+
+    # Atiende la peticion recibida con la conexion a la base de datos dada
+    def atender_peticion(self,mjson,extrDB,paramjson):
         parametrosdict = mjson.convertirJSON(paramjson) # Lee el objeto JSON y lo convierte en un diccionario de Python
+        id_peticion = self.obtener_id_peticion(parametrosdict) # Identificador opcional para correlacionar la respuesta
+        opciones = self.obtener_opciones(parametrosdict) # Opciones de resolucion de los datos, si se pidieron
+        traza = extrDB.traza
+        traza.etiquetar(parametrosdict["mode"] if parametrosdict["mode"] in MODOS else "INVALIDO") # El modo llega del cliente, no se usa tal cual como etiqueta
         #print(parametrosdict)
 
         # Extrae los datos solicitados segun el modo del mensaje recibido
         if parametrosdict["mode"] != "TABLA": # Extrae datos de la base de datos
             str_p = ""
             str_e = ""
+            peticion = None # Parametros para extraer los datos: tabla, modo de fecha, fecha, deltatime y modo ADD/DIFF
+            tablas = self.obtener_tablas_flota(parametrosdict["nombre"],extrDB) # Lista de tablas si se pidieron varios ordenadores
+            if tablas is not None and parametrosdict["mode"] in MODOS:
+                traza.etiquetar(parametrosdict["mode"] + "_FLOTA")
 
             if parametrosdict["mode"] == "MES": # Modo para calcular consumo electrico mensual
                 #print("modo Mes")
@@ -67,17 +470,20 @@ class conexionMQTT():
                 delta = fecha2 - fecha
                 deltatime = delta.days * 24 * 60
                 #print(deltatime)
-                
+
+                if tablas is not None: # Consumo mensual de varios ordenadores
+                    self.atender_flota(extrDB,tablas,(None,"MES",fecha,deltatime,"ADD"),{},id_peticion,"MES")
+                    return
+
                 str_p,str_e = extrDB.extraerdatos(parametrosdict["nombre"],"MES",fecha,deltatime,"ADD") # Se extraen datos de la base de datos
-                print(str_e)
-                self.mqtt_client.publish("capstone_energia/consumoEnergia",str_e) # Se publica un mensaje por MQTT con la informacion requerida
-                extrDB.connDB.conn.close() # Se cierra la conexion con la base de datos
+                #print(str_e)
+                self.publicar("capstone_energia/consumoEnergia",str_e,id_peticion,traza) # Se publica un mensaje por MQTT con la informacion requerida
                 return
             elif parametrosdict["mode"] == "DIFF": # Extrae los datos mas recientes
-                str_p,str_e = extrDB.extraerdatos(parametrosdict["nombre"],"FIN",-1,abs(round(float(parametrosdict["deltatime"]))),parametrosdict["mode"]) # Se extraen datos de la base de datos
+                peticion = (parametrosdict["nombre"],"FIN",-1,abs(round(float(parametrosdict["deltatime"]))),parametrosdict["mode"])
                 
             elif parametrosdict["mode"] == "ADD": # Extrae los datos mas antiguos
-                str_p,str_e = extrDB.extraerdatos(parametrosdict["nombre"],"INI",-1,abs(round(float(parametrosdict["deltatime"]))),parametrosdict["mode"]) # Se extraen datos de la base de datos
+                peticion = (parametrosdict["nombre"],"INI",-1,abs(round(float(parametrosdict["deltatime"]))),parametrosdict["mode"])
                 
             elif parametrosdict["mode"] == "FECHA": # Extrae datos cercanos a una fecha dada
                 #print("modo fecha")
@@ -100,18 +506,29 @@ class conexionMQTT():
 
                 #print("date: " + str(date))
                 #print("hour: " + str(hour))
-                print("fecha: " + str(fecha))
+                #print("fecha: " + str(fecha))
                 
-                str_p,str_e = extrDB.extraerdatos(parametrosdict["nombre"],"FECHA",fecha,deltatime,adddifmode) # Se extraen datos de la base de datos
+                peticion = (parametrosdict["nombre"],"FECHA",fecha,deltatime,adddifmode)
+
+            tamano_bloque = opciones.pop("bloque",0)
+            if peticion is None:
+                print("Modo no valido")
+            elif tablas is not None: # Los datos de varios ordenadores se publican en un solo mensaje
+                self.atender_flota(extrDB,tablas,peticion,opciones,id_peticion,parametrosdict["mode"])
+                return
+            elif tamano_bloque > 0: # Los datos se publican por bloques
+                self.publicar_bloques(extrDB,peticion,tamano_bloque,id_peticion,opciones.get("acumulado","VENTANA"))
+                return
+            else:
+                str_p,str_e = extrDB.extraerdatos(*peticion,**opciones) # Se extraen datos de la base de datos
 
-            self.mqtt_client.publish("capstone_energia/datosPotencia",str_p) # Se publica un mensaje por MQTT con un JSON de las potencias extraidas
-            self.mqtt_client.publish("capstone_energia/datosEnergia",str_e) # Se publica un mensaje por MQTT con un JSON de las energias extraidas
-            extrDB.connDB.conn.close() # Se cierra la conexion con la base de datos
+            self.publicar("capstone_energia/datosPotencia",str_p,id_peticion,traza) # Se publica un mensaje por MQTT con un JSON de las potencias extraidas
+            self.publicar("capstone_energia/datosEnergia",str_e,id_peticion,traza) # Se publica un mensaje por MQTT con un JSON de las energias extraidas
             
         else: # Obtiene los nombres de las tablas de la base de datos
             table_names = extrDB.extraernombretablas() # Se extraen los nombres de las tablas de la base de datos
-            print(table_names)
-            self.mqtt_client.publish("capstone_energia/nombreTablas",str(table_names)) # Se publica un mensaje por MQTT con un JSON de los nombres de las tablas de la base de datos
+            #print(table_names)
+            self.publicar("capstone_energia/nombreTablas",str(table_names),id_peticion,traza) # Se publica un mensaje por MQTT con un JSON de los nombres de las tablas de la base de datos
             
         
         
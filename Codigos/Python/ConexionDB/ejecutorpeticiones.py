@@ -0,0 +1,129 @@
+# Clase: ejecutorpeticiones
+# Esta clase se encarga de atender peticiones en hilos de trabajo, fuera del hilo de red de MQTT, con una cola acotada
+# Por Fernando Daniel Ramirez
+
+import queue
+import threading
+import traceback
+
+
+class ejecutorpeticiones():
+
+    # El constructor recibe el numero de hilos de trabajo, el tamano de la cola y la politica a seguir cuando la cola esta llena:
+    # "DESCARTAR_ANTIGUO": se descarta la peticion mas antigua de la cola para dar lugar a la nueva
+    # "RECHAZAR": se descarta la peticion nueva
+    # al_descartar: opcional, funcion que se llama con los argumentos de cada peticion descartada (por ejemplo para avisar a quien la hizo)
+    def __init__(self,hilos=4,tamano_cola=32,politica="DESCARTAR_ANTIGUO",al_descartar=None):
+        if politica not in ("DESCARTAR_ANTIGUO","RECHAZAR"):
+            raise ValueError("Politica no valida: " + str(politica))
+
+        self.politica = politica
+        self.al_descartar = al_descartar
+        self.cola = queue.Queue(maxsize=tamano_cola)
+        self.candado = threading.Lock()
+
+        # Contadores
+        self.recibidas = 0
+        self.atendidas = 0
+        self.descartadas = 0
+        self.errores = 0
+        self.reemplazados = 0 # Hilos de trabajo que terminaron inesperadamente y se volvieron a crear
+
+        # Se crean los hilos de trabajo
+        self.hilos = [self.crearhilo(i) for i in range(hilos)]
+
+    # Crea e inicia el hilo de trabajo numero i
+    def crearhilo(self,i):
+        hilo = threading.Thread(target=self.trabajar,name="ejecutorpeticiones-" + str(i),daemon=True)
+        hilo.start()
+        return hilo
+
+    # Vuelve a crear los hilos de trabajo que terminaron, para que la cola no se quede sin quien la atienda
+    # Se llama con el candado tomado
+    def reponerhilos(self):
+        for i,hilo in enumerate(self.hilos):
+            if not hilo.is_alive():
+                self.hilos[i] = self.crearhilo(i)
+                self.reemplazados += 1
+
+    # Encola una funcion con sus argumentos para ejecutarse en un hilo de trabajo
+    # Regresa False si la peticion se descarto por tener la cola llena
+    def enviar(self,funcion,*args):
+        tarea = (funcion,args)
+        descartadas = [] # Tareas descartadas; se avisan despues de soltar el candado
+        encolada = False
+
+        with self.candado:
+            self.recibidas += 1
+            self.reponerhilos()
+
+            while True:
+                try:
+                    self.cola.put_nowait(tarea)
+                    encolada = True
+                    break
+                except queue.Full:
+                    if self.politica == "RECHAZAR":
+                        self.descartadas += 1
+                        descartadas.append(tarea)
+                        break
+
+                # Se descarta la peticion mas antigua; como varios hilos consumen la cola, puede que ya se haya vaciado un lugar
+                try:
+                    descartadas.append(self.cola.get_nowait())
+                    self.cola.task_done()
+                    self.descartadas += 1
+                except queue.Empty:
+                    pass
+
+        if self.al_descartar is not None:
+            for tarea_descartada in descartadas:
+                if tarea_descartada is None: # Senal para terminar un hilo (ver cerrar), no es una peticion
+                    continue
+                try:
+                    self.al_descartar(*tarea_descartada[1])
+                except Exception:
+                    traceback.print_exc()
+        return encolada
+
+    # Ciclo de cada hilo de trabajo: toma una tarea de la cola y la ejecuta
+    def trabajar(self):
+        while True:
+            tarea = self.cola.get()
+            if tarea is None: # Senal para terminar el hilo
+                self.cola.task_done()
+                return
+
+            funcion,args = tarea
+            try:
+                funcion(*args)
+                with self.candado:
+                    self.atendidas += 1
+            except BaseException:
+                # Un error en una peticion no debe terminar el hilo de trabajo, aunque sea SystemExit
+                with self.candado:
+                    self.errores += 1
+                traceback.print_exc()
+            finally:
+                self.cola.task_done()
+
+    # Termina los hilos de trabajo despues de atender las peticiones pendientes
+    def cerrar(self):
+        for hilo in self.hilos:
+            self.cola.put(None)
+        for hilo in self.hilos:
+            hilo.join()
+        self.hilos = []
+
+    # Regresa los contadores del ejecutor
+    def estadisticas(self):
+        with self.candado:
+            return {
+                "hilos": len(self.hilos),
+                "en_cola": self.cola.qsize(),
+                "recibidas": self.recibidas,
+                "atendidas": self.atendidas,
+                "descartadas": self.descartadas,
+                "errores": self.errores,
+                "reemplazados": self.reemplazados,
+            }
@@ -0,0 +1,101 @@
+# Clase: exportarDB
+# Esta clase se encarga de copiar las tablas de los ordenadores de una base de datos a otra, aunque usen motores distintos
+# (por ejemplo del esquema "potencia" en MariaDB a un archivo SQLite y de regreso), y de rehacer los resumenes en el destino
+# Los registros se leen por lotes sin cargar la tabla completa en memoria, y solo se copian los posteriores
+# al ultimo registro que ya tiene el destino, asi se puede volver a ejecutar para sincronizar
+# Uso: python exportarDB.py exportar|importar [--archivo ARCHIVO] [TABLA ...]
+#      exportar: de la base de datos MariaDB configurada en extraerdatosDB al archivo SQLite
+#      importar: del archivo SQLite a la base de datos MariaDB
+# Por Fernando Daniel Ramirez
+
+from conexionDB import conexionDB, TAMANO_LOTE
+from extraerdatosDB import DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, DB_ARCHIVO, crearbackend
+from resumenesDB import resumenesDB
+import argparse
+import time
+
+
+class exportarDB():
+
+    # El constructor recibe los conectores (conexionDB) de la base de datos de origen y de destino
+    def __init__(self,origen,destino):
+        self.origen = origen
+        self.destino = destino
+
+    # Copia los registros de una tabla que el destino aun no tiene, creando la tabla si no existe
+    # Cada lote se escribe en una transaccion (con autocommit cada registro seria una transaccion); si la copia se interrumpe,
+    # los lotes ya confirmados no se vuelven a copiar porque se continua desde la ultima fecha del destino
+    # Regresa el numero de registros copiados
+    def copiartabla(self,table):
+        backend_origen = self.origen.backend
+        backend_destino = self.destino.backend
+
+        cur_destino = self.destino.conn.cursor()
+        cur_destino.execute(backend_destino.sqlcreartabla(table))
+        cur_destino.execute("SELECT MAX(fecha) FROM " + backend_destino.identificador(table))
+        (ultima,) = cur_destino.fetchone()
+        ultima = backend_destino.afecha(ultima)
+
+        cur_origen = backend_origen.cursorsinbuffer(self.origen.conn)
+        if ultima is None:
+            cur_origen.execute("SELECT fecha,potencia,energia FROM " + backend_origen.identificador(table) + " WHERE fecha IS NOT NULL ORDER BY fecha")
+        else:
+            cur_origen.execute("SELECT fecha,potencia,energia FROM " + backend_origen.identificador(table) + " WHERE fecha > ? ORDER BY fecha",(ultima,))
+
+        insertar = backend_destino.sqlinsertarignorando(table)
+        total = 0
+        while True:
+            filas = cur_origen.fetchmany(TAMANO_LOTE)
+            if len(filas) == 0:
+                break
+            cur_destino.execute("BEGIN")
+            cur_destino.executemany(insertar,[(backend_origen.afecha(fecha),potencia,energia) for (fecha,potencia,energia) in filas])
+            cur_destino.execute("COMMIT")
+            total += len(filas)
+        cur_origen.close()
+        cur_destino.close()
+
+        return total
+
+    # Copia las tablas indicadas (o todas las de los ordenadores) y pone al dia sus resumenes en el destino
+    # Regresa un diccionario con los registros copiados por tabla
+    def copiar(self,tablas=None):
+        existentes = self.origen.extraernombrestablas()
+        if tablas is None or len(tablas) == 0:
+            tablas = existentes
+
+        copiados = {}
+        for table in tablas:
+            if table not in existentes:
+                print(table + ": no existe en el origen")
+                continue
+            inicio = time.perf_counter()
+            copiados[table] = self.copiartabla(table)
+            print(f"{table}: {copiados[table]} registro(s) copiados en {time.perf_counter() - inicio:.1f} s")
+
+        resumenes = resumenesDB(self.destino)
+        resumenes.creartablas()
+        for table in copiados:
+            resumenes.actualizar(table)
+
+        return copiados
+
+if __name__ == '__main__': # Copia las tablas entre la base de datos MariaDB y el archivo SQLite
+    parser = argparse.ArgumentParser(description="Copia las tablas de los ordenadores entre MariaDB y un archivo SQLite")
+    parser.add_argument("direccion",choices=["exportar","importar"],help="exportar: de MariaDB a SQLite, importar: de SQLite a MariaDB")
+    parser.add_argument("tablas",nargs="*",help="tablas a copiar (por defecto todas)")
+    parser.add_argument("--archivo",default=DB_ARCHIVO,help="archivo de la base de datos SQLite")
+    args = parser.parse_args()
+
+    connmariadb = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,backend=crearbackend("MARIADB"))
+    connsqlite = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,backend=crearbackend("SQLITE",args.archivo))
+    if args.direccion == "exportar":
+        exportar = exportarDB(connmariadb,connsqlite)
+    else:
+        exportar = exportarDB(connsqlite,connmariadb)
+
+    copiados = exportar.copiar(args.tablas)
+    print(f"{sum(copiados.values())} registro(s) copiados en {len(copiados)} tabla(s)")
+
+    connmariadb.cerrar()
+    connsqlite.cerrar()
@@ -4,21 +4,231 @@
 
 from conexionDB import conexionDB
 from graficador import graficador
+from reducciondatos import reducciondatos
+from resumenesDB import resumenesDB
+from codificador import codificador
+from columnasdatos import columnasdatos
+from metricas import TRAZA_NULA
 from datetime import datetime
+import itertools
 import json
+import math
+import os
+
+# Datos de conexion a la base de datos; se pueden cambiar con variables de entorno sin modificar el codigo
+# POTENCIA_DB_MOTOR: MARIADB (servidor, por defecto) o SQLITE (archivo local, sin servidor de base de datos)
+DB_MOTOR = os.environ.get("POTENCIA_DB_MOTOR","MARIADB").upper()
+DB_USUARIO = os.environ.get("POTENCIA_DB_USUARIO","fernando")
+DB_PASSWORD = os.environ.get("POTENCIA_DB_PASSWORD","pass1234")
+DB_HOST = os.environ.get("POTENCIA_DB_HOST","localhost")
+DB_PUERTO = int(os.environ.get("POTENCIA_DB_PUERTO","3306"))
+DB_NOMBRE = os.environ.get("POTENCIA_DB_NOMBRE","potencia")
+DB_ARCHIVO = os.environ.get("POTENCIA_DB_ARCHIVO","potencia.db") # Archivo de la base de datos SQLite
+
+# Crea el backend del motor de base de datos configurado (o del motor dado)
+# Los modulos de cada motor se importan solo si se usan, asi SQLite no necesita el conector de MariaDB
+def crearbackend(motor=None,archivo=None):
+    motor = DB_MOTOR if motor is None else motor.upper()
+    if motor == "SQLITE":
+        from backendsqlite import backendsqlite
+        return backendsqlite(DB_ARCHIVO if archivo is None else archivo)
+    if motor == "MARIADB":
+        from backendmariadb import backendmariadb
+        return backendmariadb(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE)
+    raise ValueError("Motor de base de datos desconocido: " + motor)
 
 
 class extraerdatosDB():
 
-    # El constructor se conecta a la base de datos local con nombre "potencia"
-    def __init__(self):
-        self.connDB = conexionDB("fernando","pass1234","localhost",3306,"potencia") # Conector para la base de datos
+    traza = TRAZA_NULA # Traza de la peticion (ver metricas); por defecto no mide nada
+
+    # El constructor se conecta a la base de datos configurada (DB_MOTOR)
+    # Si recibe un pool de conexiones, la conexion se toma del pool y se regresa a el al llamar cerrar()
+    # Si recibe una cache de fechas, la primera y ultima fecha de cada tabla se comparten entre peticiones
+    # Si recibe una cache de resultados, los resultados ya codificados se reutilizan entre peticiones
+    # Si recibe un buffer circular, las ventanas de los ultimos minutos se toman de las muestras recientes en memoria
+    # Si recibe una traza (metricas), se mide el tiempo de cada etapa de la peticion
+    def __init__(self,pool=None,cachefechas=None,cacheresultados=None,buffer=None,traza=None):
+        if traza is not None:
+            self.traza = traza
+        backend = pool.backend if pool is not None else crearbackend()
+        self.connDB = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,pool,cachefechas,backend,traza) # Conector para la base de datos
+        self.cacheresultados = cacheresultados
+        self.buffer = buffer
+        self.resumenes = resumenesDB(self.connDB) # Resumenes por hora y por dia para ventanas largas
         #self.graf = graficador() # Objeto para graficar datos en Python
 
+    # Cierra la conexion con la base de datos (o la regresa al pool)
+    def cerrar(self,valida=True):
+        self.connDB.cerrar(valida)
+
     # Extrae datos de la base de datos, segun los parametros recibidos
-    def extraerdatos(self,table,datemode,date,deltatime,adddifmode):
+    # Opcionalmente se puede pedir una resolucion para no enviar todos los registros de la ventana:
+    # puntos: numero aproximado de puntos deseados, resolucion: ancho de cada cubeta en segundos
+    # reduccion: "PROMEDIO" agrupa en cubetas en la base de datos (potencia minima, promedio y maxima),
+    # "LTTB" selecciona los puntos mas representativos de la serie conservando los picos
+    # formato: "JSON" (arreglo de objetos {"x","y"}) o un formato compacto de codificador ("COLUMNAR", "BINARIO", "BINARIO_Z")
+    # acumulado: "VENTANA" acumula la energia desde el inicio de la ventana, "TOTAL" desde el primer registro de la tabla
+    def extraerdatos(self,table,datemode,date,deltatime,adddifmode,puntos=0,resolucion=0,reduccion="PROMEDIO",formato="JSON",acumulado="VENTANA"):
+        # Calcular el ancho de las cubetas en segundos si se pidio una resolucion (0 = todos los registros)
+        ancho = self.calcularancho(deltatime,puntos,resolucion)
+
+        # Las ventanas de los ultimos minutos con todos los registros o reducidas con LTTB se toman del buffer circular, si lo hay
+        if self.buffer is not None and datemode == "FIN" and adddifmode == "DIFF" and (ancho == 0 or reduccion == "LTTB"):
+            resultado = self.extraerdatosbuffer(table,deltatime,ancho,formato,acumulado)
+            if resultado is not None:
+                return resultado
+
         # Para extraer datos, independientemente del "datemode" con el que se extraigan datos, se realizan 5 pasos.
         
+        # 1. y 2. Calcular una fecha, la mas cercana a la almacenada en la base de datos, y un delta de tiempo para esa fecha
+        with self.traza.medir("limites"):
+            fecha,delta_fecha,adddifmode = self.calcularfecha(table,datemode,date,deltatime,adddifmode)
+
+        # 3. Extraer datos de la base de datos con los datos calculados y recibidos
+        if datemode == "MES": # El consumo mensual se suma de los resumenes por dia en lugar de recorrer todos los registros del mes
+            date1,date2 = self.connDB.calcularventana(fecha,delta_fecha,adddifmode)
+            return [],self.resumenes.energiaentre(table,date1,date2)/(3.6e+6)
+
+        # Energia acumulada antes de la ventana, en kWh
+        energia_inicial = 0
+        if acumulado == "TOTAL":
+            energia_inicial = self.calcularenergiainicial(table,fecha,delta_fecha,adddifmode)
+
+        if self.cacheresultados is not None: # Se busca primero el resultado en la cache
+            return self.extraerdatosencache(table,datemode,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial)
+
+        return self.extraerventana(table,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial)[:2]
+
+    # Extrae los ultimos "deltatime" minutos de una tabla a partir de la ultima muestra del buffer circular
+    # Si el buffer no alcanza a cubrir la ventana, la parte anterior a su primera muestra se extrae de la base de datos
+    # Regresa None si el buffer no tiene muestras de la tabla
+    def extraerdatosbuffer(self,table,deltatime,ancho,formato,acumulado):
+        with self.traza.medir("buffer"):
+            limites = self.buffer.limites(table)
+            if limites is None:
+                return None
+            primera,ultima = limites
+            desde = ultima - deltatime * 60
+
+            columnas = self.buffer.ventana(table,desde,ultima)
+        if primera > desde: # Parte de la ventana anterior al buffer
+            anteriores = self.connDB.obtenercolumnasentre(table,columnasdatos.afecha(desde),columnasdatos.afecha(primera))
+            columnas = anteriores.recortarextender(desde,columnas)
+
+        energia_inicial = 0
+        if acumulado == "TOTAL":
+            energia_inicial = self.resumenes.energiaacumulada(table,columnasdatos.afecha(desde))/(3.6e+6)
+
+        return self.codificarcolumnas(columnas,deltatime,ancho,formato,energia_inicial)
+
+    # Calcula la energia consumida en kWh y la duracion en segundos de la ventana pedida, a partir de los resumenes
+    # Se usa para los totales de las peticiones de varios ordenadores (flota)
+    def energiaventana(self,table,datemode,date,deltatime,adddifmode):
+        fecha,delta_fecha,adddifmode = self.calcularfecha(table,datemode,date,deltatime,adddifmode)
+        ventana = self.connDB.calcularventana(fecha,delta_fecha,adddifmode)
+        if ventana is None:
+            return 0,0
+        date1,date2 = ventana
+        return self.resumenes.energiaentre(table,date1,date2)/(3.6e+6),(date2 - date1).total_seconds()
+
+    # Calcula la energia acumulada en kWh de la tabla antes del inicio de la ventana, a partir de la energia acumulada por hora de los resumenes
+    def calcularenergiainicial(self,table,fecha,delta_fecha,adddifmode):
+        ventana = self.connDB.calcularventana(fecha,delta_fecha,adddifmode)
+        if ventana is None:
+            return 0
+        return self.resumenes.energiaacumulada(table,ventana[0])/(3.6e+6)
+
+    # Extrae y codifica los datos de la ventana calculada en extraerdatos()
+    # Regresa las listas (o mensajes) de potencia y energia, y las columnas extraidas (None si los datos se agruparon en la base de datos)
+    def extraerventana(self,table,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial=0):
+        if ancho > 0 and reduccion != "LTTB": # Los datos se agrupan en la base de datos
+            if ancho % 3600 == 0: # Las cubetas de horas o dias completos se calculan a partir de los resumenes
+                date1,date2 = self.connDB.calcularventana(fecha,delta_fecha,adddifmode)
+                fechas_ini,fechas_fin,potencias_min,potencias_prom,potencias_max,energias = self.resumenes.obtenerdatosagrupados(table,date1,date2,ancho)
+            else:
+                fechas_ini,fechas_fin,potencias_min,potencias_prom,potencias_max,energias = self.connDB.obtenerdatosagrupados(table,fecha,delta_fecha,adddifmode,ancho)
+            with self.traza.medir("codificacion"):
+                list_p,list_e = self.enviardatosagrupados(fechas_ini,fechas_fin,potencias_min,potencias_prom,potencias_max,energias,formato,energia_inicial)
+            return list_p,list_e,None
+
+        columnas = self.connDB.obtenercolumnas(table,fecha,delta_fecha,adddifmode) # Los registros se extraen en columnas (columnasdatos)
+        #fechas,potencias,energias = self.connDB.obtenerdatos(table,fecha,delta_fecha,"ADD") # Ejemplo con listas
+
+        #print(str(columnas.potencias))
+
+        # 4. Graficar datos (debug) en Python
+        #self.graf.graficar_datos(columnas.fechas(),columnas.potencias,'Tiempo[s]','Potencia[W]','Consumo de energia de ' + table) # Grafica los datos extraidos de potencias
+        #self.graf.graficar_datos(columnas.fechas(),columnas.energias,'Tiempo[s]','Energia[J]','Consumo de energia de ' + table) # Grafica los datos extraidos de energias
+        
+        # 5. Guardar en un archivo .txt o enviar por MQTT
+        #self.guardardatosextraidos(columnas)# Guarda los datos en un archivo .txt
+        list_p,list_e = self.codificarcolumnas(columnas,deltatime,ancho,formato,energia_inicial)
+
+        #print(str(len(columnas)) + " dato(s) extraidos(s)")
+
+        return list_p,list_e,columnas # Regresa objetos tipo JSON
+
+    # Da formato a las columnas extraidas: todos los registros, o reducidos con LTTB si se pidio una resolucion
+    def codificarcolumnas(self,columnas,deltatime,ancho,formato,energia_inicial=0):
+        with self.traza.medir("codificacion"):
+            if ancho > 0:
+                return self.enviardatosreducidos(columnas,max(1,round(deltatime * 60 / ancho)),formato,energia_inicial) # Reduce los datos con LTTB y les da formato JSON
+            return self.enviardatosextraidos(columnas,formato,energia_inicial) # Da formato a los datos extraidos como objetos JSON
+
+    # Extrae los datos de la ventana usando la cache de resultados
+    # Las ventanas que terminan antes del ultimo registro solo cambian con registros atrasados: se guardan hasta que la cache las desaloje,
+    # caduquen o se invaliden al avisar la ingesta que la tabla recibio registros atrasados (ver conexionMQTT.invalidar_cache)
+    # Las ventanas "FIN" con "DIFF" (los ultimos minutos) se extienden solo con los registros nuevos desde la ultima peticion
+    # Las demas ventanas se guardan junto con la ultima fecha de la tabla, y dejan de usarse cuando llegan registros nuevos
+    def extraerdatosencache(self,table,datemode,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial=0):
+        cache = self.cacheresultados
+        ventana = self.connDB.calcularventana(fecha,delta_fecha,adddifmode)
+        if ventana is None:
+            return self.extraerventana(table,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial)[:2]
+        date1,date2 = ventana
+        ultima_fecha = self.connDB.obtenerlimites(table)[1]
+        agrupado = ancho > 0 and reduccion != "LTTB"
+
+        if datemode == "FIN" and adddifmode == "DIFF" and not agrupado:
+            clave = (table,"ULTIMOS",deltatime,ancho,formato,energia_inicial != 0)
+            entrada = cache.obtener(clave)
+            if entrada is not None and entrada[2] == date2: # No hay registros nuevos
+                cache.contar("aciertos")
+                return entrada[0]
+
+            if entrada is not None and len(entrada[1]) > 0:
+                # Se quitan los registros que quedaron fuera de la ventana y se agregan los nuevos
+                anteriores = entrada[1]
+                nuevas = self.connDB.obtenercolumnasnuevas(table,columnasdatos.afecha(anteriores.segundos[-1]),date2)
+                columnas = anteriores.recortarextender(columnasdatos.asegundos(date1),nuevas)
+                cache.contar("extensiones")
+            else:
+                columnas = self.connDB.obtenercolumnas(table,fecha,delta_fecha,adddifmode)
+                cache.contar("fallos")
+
+            resultado = self.codificarcolumnas(columnas,deltatime,ancho,formato,energia_inicial)
+            cache.guardar(clave,resultado,columnas,date2)
+            return resultado
+
+        if date2 < ultima_fecha: # Ventana historica
+            clave = (table,date1,date2,ancho,reduccion,formato,energia_inicial)
+        else:
+            clave = (table,date1,date2,ancho,reduccion,formato,energia_inicial,ultima_fecha)
+
+        entrada = cache.obtener(clave)
+        if entrada is not None:
+            cache.contar("aciertos")
+            return entrada[0]
+
+        cache.contar("fallos")
+        resultado = self.extraerventana(table,fecha,delta_fecha,deltatime,adddifmode,ancho,reduccion,formato,energia_inicial)[:2]
+        cache.guardar(clave,resultado)
+        return resultado
+
+    # Calcula la fecha (la mas cercana a la almacenada en la base de datos) y el delta de tiempo de la ventana a extraer
+    # Regresa la fecha, el delta de tiempo y el modo ADD/DIFF corregido
+    def calcularfecha(self,table,datemode,date,deltatime,adddifmode):
         # 1. Calcular una fecha, la mas cercana a la almacenada en la base de datos
         fecha = self.connDB.obtenerfecha(table,date,datemode)
 
@@ -31,10 +241,11 @@ class extraerdatosDB():
         # Corregir si el usuario ingresa mal los datos
         if datemode == "FECHA":
             deltatime = abs(deltatime)
-            if fecha == self.connDB.obtenerfecha(table,-1,"INI"):
+            primera_fecha,ultima_fecha = self.connDB.obtenerlimites(table) # Ya se consultaron al calcular la fecha
+            if fecha == primera_fecha:
                 adddifmode = "ADD"
                 pass
-            elif fecha == self.connDB.obtenerfecha(table,-1,"FIN"):
+            elif fecha == ultima_fecha:
                 adddifmode = "DIFF"
         
         #print("deltatime: " + str(deltatime))
@@ -47,31 +258,45 @@ class extraerdatosDB():
 
         #print(delta_fecha)
 
-        # 3. Extraer datos de la base de datos con los datos calculados y recibidos
-        fechas,potencias,energias = self.connDB.obtenerdatos(table,fecha,delta_fecha,adddifmode)
-        #fechas,potencias = self.connDB.obtenerdatos(table,fecha,delta_fecha,"ADD") # Ejemplo
+        return fecha,delta_fecha,adddifmode
 
-        #print(str(potencias))
+    # Extrae los datos de la ventana por bloques de "tamano_bloque" registros, sin guardar la ventana completa en memoria
+    # Es un generador: por cada bloque regresa las listas de objetos de potencia y energia de ese bloque (sin codificar)
+    # La energia acumulada continua de un bloque al siguiente ("acumulado" igual que en extraerdatos)
+    def extraerdatosporbloques(self,table,datemode,date,deltatime,adddifmode,tamano_bloque,acumulado="VENTANA"):
+        with self.traza.medir("limites"):
+            fecha,delta_fecha,adddifmode = self.calcularfecha(table,datemode,date,deltatime,adddifmode)
 
-        # 4. Graficar datos (debug) en Python
-        #self.graf.graficar_datos(fechas,potencias,'Tiempo[s]','Potencia[W]','Consumo de energia de ' + table) # Grafica los datos extraidos de potencias
-        #self.graf.graficar_datos(fechas,energias,'Tiempo[s]','Energia[J]','Consumo de energia de ' + table) # Grafica los datos extraidos de energias
-        
-        # 5. Guardar en un archivo .txt o enviar por MQTT
-        
-        list_p = []
-        list_e = []
-        
-        if datemode != "MES":
-            #self.guardardatosextraidos(fechas,potencias,energias)# Guarda los datos en un archivo .txt
-            list_p,list_e = self.enviardatosextraidos(fechas,potencias,energias) # Da formato a los datos extraidos como objetos JSON
-        else:
-            list_e = self.enviardatosextraidosmes(fechas,energias) # Da formato a los datos extraidos como objetos JSON
-        
-        #print(str(len(potencias)) + " dato(s) extraidos(s) de potencia")
-        #print(str(len(energias)) + " dato(s) extraidos(s) de energia")
+        energia_acc = 0
+        if acumulado == "TOTAL":
+            energia_acc = self.calcularenergiainicial(table,fecha,delta_fecha,adddifmode)
+        for columnas in self.connDB.obtenercolumnasporbloques(table,fecha,delta_fecha,adddifmode,tamano_bloque):
+            with self.traza.medir("codificacion"):
+                energia_acc,list_p,list_e = self.formatearbloque(columnas,energia_acc)
+            yield list_p,list_e
+
+    # Da formato de objetos JSON a un bloque de datos (columnasdatos), continuando la energia acumulada recibida
+    # Regresa la energia acumulada al final del bloque y las listas de objetos de potencia y energia
+    def formatearbloque(self,columnas,energia_acc):
+        fechas = columnas.textos()
+        energias_acc = self.acumularenergia(columnas.energias,energia_acc)
+
+        list_p = [{"x":x,"y":y} for x,y in zip(fechas,columnas.potencias)]
+        list_e = [{"x":x,"y":y} for x,y in zip(fechas,energias_acc)]
+
+        if len(energias_acc) > 0:
+            energia_acc = energias_acc[-1]
 
-        return list_p,list_e # Regresa objetos tipo JSON
+        return energia_acc,list_p,list_e
+
+    # Calcula el ancho en segundos de las cubetas segun el numero de puntos o la resolucion pedidos para una ventana de "deltatime" minutos
+    # Regresa 0 si no se pidio ninguna resolucion
+    def calcularancho(self,deltatime,puntos,resolucion):
+        if resolucion > 0:
+            return max(1,int(math.ceil(resolucion)))
+        if puntos > 0:
+            return max(1,int(math.ceil(deltatime * 60 / puntos)))
+        return 0
 
     # Extrae los nombres de las tablas de la base de datos y les da formato JSON
     def extraernombretablas(self):
@@ -80,39 +305,82 @@ class extraerdatosDB():
 
     # Obtiene el consumo mensual electrico
     def enviardatosextraidosmes(self,fechas,energias):
-        energia_acc = 0
+        return math.fsum(energias)/(3.6e+6) # Suma todos los registros de energia para obtener el consumo total de energia
+
+    # Da formato JSON a los datos extraidos de potencia y energia (columnasdatos)
+    # energia_inicial: energia acumulada en kWh antes de la ventana (0 para acumular solo la energia de la ventana)
+    def enviardatosextraidos(self,columnas,formato="JSON",energia_inicial=0):
+        if formato != "JSON": # Formato compacto
+            cod = codificador()
+            energias_acc = self.acumularenergia(columnas.energias,energia_inicial)
+            return cod.codificar(formato,columnas.segundos,[("y",columnas.potencias)]),cod.codificar(formato,columnas.segundos,[("y",energias_acc)])
+
+        # Guarda los datos extraidos de potencia y energia como un arreglo de objetos JSON
+        energia_acc,list_p,list_e = self.formatearbloque(columnas,energia_inicial)
+
+        return json.dumps(list_p),json.dumps(list_e) # Le da formato JSON a las listas de potencias y energias
         
-        for i in range(len(fechas)):
-            energia_acc += (energias[i]/(3.6e+6)) #Suma todos los registros de energia para obtener el consumo total de energia
 
-        return energia_acc # 
+    # Calcula la energia acumulada en kWh de cada registro a partir de la energia en J de cada registro
+    # La suma se hace con cumsum de NumPy si esta instalado, o con itertools.accumulate, sin un ciclo en Python por registro
+    # energia_inicial: energia acumulada en kWh antes del primer registro
+    def acumularenergia(self,energias,energia_inicial=0):
+        if len(energias) == 0:
+            return []
+        with self.traza.medir("agregacion"):
+            try:
+                import numpy as np # NumPy es opcional
+            except ImportError:
+                return [energia_inicial + energia/(3.6e+6) for energia in itertools.accumulate(energias)]
+            return (np.cumsum(np.asarray(energias,dtype=np.float64))/(3.6e+6) + energia_inicial).tolist()
+
+    # Da formato JSON a los datos agrupados en cubetas
+    # La potencia se envia con el promedio como "y" y los extremos de la cubeta como "min" y "max"
+    # La energia acumulada se envia al final de cada cubeta
+    def enviardatosagrupados(self,fechas_ini,fechas_fin,potencias_min,potencias_prom,potencias_max,energias,formato="JSON",energia_inicial=0):
+        energias_acc = self.acumularenergia(energias,energia_inicial)
+
+        if formato != "JSON": # Formato compacto, la potencia lleva las columnas "y" (promedio), "min" y "max"
+            cod = codificador()
+            segundos_ini = [columnasdatos.asegundos(fecha) for fecha in fechas_ini]
+            segundos_fin = [columnasdatos.asegundos(fecha) for fecha in fechas_fin]
+            return (cod.codificar(formato,segundos_ini,[("y",potencias_prom),("min",potencias_min),("max",potencias_max)]),
+                    cod.codificar(formato,segundos_fin,[("y",energias_acc)]))
 
-    # Da formato JSON a los datos extraidos de potencia y energia
-    def enviardatosextraidos(self,fechas,potencias,energias):
-        energia_acc = 0
         list_p = []
         list_e = []
 
-        # Guarda los datos extraidos de potencia y energia como un arreglo de objetos JSON
-        for i in range(len(fechas)):
+        for i in range(len(fechas_ini)):
 
-            energia_acc += (energias[i]/(3.6e+6))
+            p = {"x":str(fechas_ini[i]),"y":potencias_prom[i],"min":potencias_min[i],"max":potencias_max[i]}
+            e = {"x":str(fechas_fin[i]),"y":energias_acc[i]}
 
-            p = {"x":str(fechas[i]),"y":potencias[i]}
-            e = {"x":str(fechas[i]),"y":energia_acc}
-
-            #p = {"x":i,"y":potencias[i]}
-            #e = {"x":i,"y":energia_acc}
-            
             list_p.append(p)
             list_e.append(e)
-            
 
         return json.dumps(list_p),json.dumps(list_e) # Le da formato JSON a las listas de potencias y energias
-        
 
-    # Guarda los datos extraidos de potencia y energia en dos archivos de texto, uno para cada variable respectivamente
-    def guardardatosextraidos(self,fechas,potencias,energias):
+    # Reduce los datos extraidos a "puntos" puntos con LTTB y les da formato JSON
+    # La energia acumulada se calcula con todos los registros y despues se toma en los mismos puntos que la potencia
+    def enviardatosreducidos(self,columnas,puntos,formato="JSON",energia_inicial=0):
+        with self.traza.medir("agregacion"):
+            indices = reducciondatos().lttb(columnas.segundos,columnas.potencias,puntos)
+        energias_acc = self.acumularenergia(columnas.energias,energia_inicial)
+
+        if formato != "JSON": # Formato compacto
+            cod = codificador()
+            segundos = [columnas.segundos[i] for i in indices]
+            return (cod.codificar(formato,segundos,[("y",[columnas.potencias[i] for i in indices])]),
+                    cod.codificar(formato,segundos,[("y",[energias_acc[i] for i in indices])]))
+
+        fechas = columnas.textos()
+        list_p = [{"x":fechas[i],"y":columnas.potencias[i]} for i in indices]
+        list_e = [{"x":fechas[i],"y":energias_acc[i]} for i in indices]
+
+        return json.dumps(list_p),json.dumps(list_e) # Le da formato JSON a las listas de potencias y energias
+
+    # Guarda los datos extraidos de potencia y energia (columnasdatos) en dos archivos de texto, uno para cada variable respectivamente
+    def guardardatosextraidos(self,columnas):
         
         f = open("potencia.txt", "w")
         g = open("energia.txt", "w")
@@ -124,14 +392,15 @@ class extraerdatosDB():
         #print(type(potencias))
         #print(type(energias))
 
-        energia_acc = 0
+        fechas = columnas.textos()
+        potencias = columnas.potencias
+        energias_acc = self.acumularenergia(columnas.energias)
 
         # Guarda objetos tipo JSON de potencia y energia respectivamente en el archivo correspondiente
         for i in range(len(fechas)):
             #strp =
-            energia_acc += (energias[i]/(3.6e+6))
             f.write("{ \"fecha\": \"" + str(fechas[i]) + "\",\"potencia\": \"" + str(potencias[i]) + "\"}")
-            g.write("{ \"fecha\": \"" + str(fechas[i]) + "\",\"energia\": \"" + str(energia_acc) + "\"}")
+            g.write("{ \"fecha\": \"" + str(fechas[i]) + "\",\"energia\": \"" + str(energias_acc[i]) + "\"}")
             if i < (len(fechas)-1):
                 f.write("\n")
                 g.write("\n")
@@ -0,0 +1,133 @@
+# Clase: generadordatos
+# Esta clase se encarga de generar datos sinteticos de potencia y energia con la misma forma que "Base de datos/potencia.sql":
+# una muestra cada 10 segundos por ordenador, con horario de uso, ruido, picos y huecos (ordenador apagado o mensajes perdidos)
+# Sirve para probar y medir el servicio con varios meses y varios ordenadores
+# Uso: python generadordatos.py [--sql ARCHIVO] [--dispositivos N] [--dias N] [--inicio AAAA-MM-DD]
+#      sin --sql los datos se cargan en la base de datos configurada en extraerdatosDB (MariaDB o SQLite, ver POTENCIA_DB_MOTOR)
+# Por Fernando Daniel Ramirez
+
+from datetime import datetime, timedelta
+import argparse
+import random
+
+TAMANO_LOTE = 5000 # Registros por INSERT
+
+
+class generadordatos():
+
+    # El constructor recibe el numero de ordenadores, el numero de dias a generar, la fecha inicial y la semilla aleatoria
+    def __init__(self,dispositivos=3,dias=90,inicio=datetime(2022,1,1,0,0,0),cadencia=10,semilla=0):
+        self.dispositivos = dispositivos
+        self.dias = dias
+        self.inicio = inicio
+        self.cadencia = cadencia # Segundos entre muestras
+        self.semilla = semilla
+
+    # Regresa los nombres de las tablas de los ordenadores generados
+    def tablas(self):
+        return ["SIM_PC" + str(i + 1) for i in range(self.dispositivos)]
+
+    # Genera los registros (fecha, potencia, energia) de un ordenador, en orden
+    # Potencia en reposo de 20 a 28 W y de 35 a 90 W en uso (dias habiles de 8 a 18 h), con ruido,
+    # picos ocasionales, caidas breves, periodos apagado y muestras perdidas
+    def generar(self,tabla):
+        aleatorio = random.Random(str(self.semilla) + tabla)
+        reposo = aleatorio.uniform(20,28)
+        uso = aleatorio.uniform(35,90)
+
+        fecha = self.inicio
+        fin = self.inicio + timedelta(days=self.dias)
+        paso = timedelta(seconds=self.cadencia)
+        dia = None
+        apagado_desde = apagado_hasta = fin
+
+        while fecha < fin:
+            # Cada dia, con probabilidad de 0.1, el ordenador se apaga de 1 a 8 horas
+            if fecha.date() != dia:
+                dia = fecha.date()
+                if aleatorio.random() < 0.1:
+                    apagado_desde = datetime(dia.year,dia.month,dia.day) + timedelta(hours=aleatorio.uniform(0,16))
+                    apagado_hasta = apagado_desde + timedelta(hours=aleatorio.uniform(1,8))
+            if apagado_desde <= fecha < apagado_hasta:
+                fecha += paso
+                continue
+
+            if aleatorio.random() < 0.01: # Mensaje perdido
+                fecha += paso
+                continue
+
+            en_uso = fecha.weekday() < 5 and 8 <= fecha.hour < 18
+            potencia = (uso if en_uso else reposo) * aleatorio.gauss(1,0.06)
+            azar = aleatorio.random()
+            if azar < 0.002: # Pico
+                potencia *= aleatorio.uniform(2,3)
+            elif azar < 0.003: # Caida breve
+                potencia *= 0.45
+            potencia = round(min(max(potencia,0),999.99),2) # Rango de la columna float(5,2)
+            energia = round(potencia * self.cadencia,2)
+
+            yield (fecha,potencia,energia)
+            fecha += paso
+
+    # Escribe un archivo .sql con la misma forma que "Base de datos/potencia.sql" (CREATE TABLE + INSERT por lotes)
+    def escribirsql(self,archivo):
+        with open(archivo,"w") as f:
+            for tabla in self.tablas():
+                f.write("DROP TABLE IF EXISTS `" + tabla + "`;\n")
+                f.write("CREATE TABLE `" + tabla + "` (\n  `fecha` datetime NOT NULL,\n  `potencia` float(5,2) DEFAULT NULL,\n" +
+                        "  `energia` float(6,2) DEFAULT NULL,\n  PRIMARY KEY (`fecha`)\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;\n")
+                lote = []
+                for (fecha,potencia,energia) in self.generar(tabla):
+                    lote.append(f"('{fecha}',{potencia:.2f},{energia:.2f})")
+                    if len(lote) >= TAMANO_LOTE:
+                        f.write("INSERT INTO `" + tabla + "` VALUES " + ",".join(lote) + ";\n")
+                        lote = []
+                if len(lote) > 0:
+                    f.write("INSERT INTO `" + tabla + "` VALUES " + ",".join(lote) + ";\n")
+
+    # Carga los datos en la base de datos con una conexion abierta (crea las tablas si no existen)
+    # Cada lote se escribe en una transaccion: con autocommit cada registro seria una transaccion
+    # backend: motor de la base de datos de la conexion (backendmariadb o backendsqlite), da las mismas tablas que crea el servicio de ingesta
+    # Regresa el numero de registros cargados
+    def cargar(self,conn,backend):
+        cur = conn.cursor()
+        total = 0
+        for tabla in self.tablas():
+            cur.execute(backend.sqlcreartabla(tabla))
+            lote = []
+            for registro in self.generar(tabla):
+                lote.append(registro)
+                if len(lote) >= TAMANO_LOTE:
+                    self.insertarlote(cur,backend,tabla,lote)
+                    total += len(lote)
+                    lote = []
+            if len(lote) > 0:
+                self.insertarlote(cur,backend,tabla,lote)
+                total += len(lote)
+        cur.close()
+        return total
+
+    # Inserta un lote de registros en una transaccion
+    def insertarlote(self,cur,backend,tabla,lote):
+        cur.execute("BEGIN")
+        cur.executemany(backend.sqlinsertarignorando(tabla),lote)
+        cur.execute("COMMIT")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera datos sinteticos de potencia y energia de varios ordenadores")
+    parser.add_argument("--sql",help="archivo SQL donde se escriben los datos (por defecto se cargan en la base de datos)")
+    parser.add_argument("--dispositivos",type=int,default=3,help="numero de ordenadores")
+    parser.add_argument("--dias",type=int,default=90,help="numero de dias a generar")
+    parser.add_argument("--inicio",type=lambda texto: datetime.strptime(texto,'%Y-%m-%d'),default=datetime(2022,1,1),help="primer dia, AAAA-MM-DD")
+    args = parser.parse_args()
+
+    generador = generadordatos(args.dispositivos,args.dias,args.inicio)
+    if args.sql is not None:
+        generador.escribirsql(args.sql)
+        print("Datos escritos en " + args.sql)
+    else:
+        from conexionDB import conexionDB
+        from extraerdatosDB import DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, crearbackend
+        connDB = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,backend=crearbackend())
+        print(str(generador.cargar(connDB.conn,connDB.backend)) + " registro(s) cargados en " + ", ".join(generador.tablas()))
+        connDB.cerrar()
@@ -34,3 +34,35 @@ class graficador():
         plt.title(title)
 
         plt.show()
+
+    # Guarda en un archivo (PNG) el reporte de un dia de un ordenador, sin mostrarlo:
+    # potencia y linea base en el tiempo, periodos en uso sombreados, picos y caidas marcados, y la energia de cada hora
+    # picos, caidas: listas de (fecha, potencia); energias_horas: energia en kWh de cada una de las 24 horas
+    # Para usarse sin pantalla se debe elegir el backend Agg antes de importar esta clase (ver reportes)
+    def guardar_reporte(self,archivo,title,fechas,potencias,bases,en_uso,picos,caidas,energias_horas):
+        fechasnum = mdates.date2num(fechas)
+        formatter = mdates.DateFormatter('%H:%M')
+
+        fig,(ax1,ax2) = plt.subplots(2,1,figsize=(12,8),gridspec_kw={"height_ratios":[2,1]})
+        fig.suptitle(title)
+
+        maximo = max(potencias) if len(potencias) > 0 else 1
+        ax1.fill_between(fechasnum,0,maximo,where=en_uso,color="tab:orange",alpha=0.15,step="post",label="En uso")
+        ax1.plot(fechasnum,potencias,linewidth=0.6,label="Potencia")
+        ax1.plot(fechasnum,bases,linestyle="--",linewidth=1,color="black",label="Linea base")
+        if len(picos) > 0:
+            ax1.scatter(mdates.date2num([fecha for (fecha,potencia) in picos]),[potencia for (fecha,potencia) in picos],marker="^",color="tab:red",label="Picos",zorder=3)
+        if len(caidas) > 0:
+            ax1.scatter(mdates.date2num([fecha for (fecha,potencia) in caidas]),[potencia for (fecha,potencia) in caidas],marker="v",color="tab:blue",label="Caidas",zorder=3)
+        ax1.xaxis.set_major_formatter(formatter)
+        ax1.set_ylabel("Potencia [W]")
+        ax1.legend(loc="upper right")
+
+        ax2.bar(np.arange(24),[energia * 1000 for energia in energias_horas])
+        ax2.set_xticks(np.arange(24))
+        ax2.set_xlabel("Hora")
+        ax2.set_ylabel("Energia [Wh]")
+
+        fig.tight_layout()
+        fig.savefig(archivo,dpi=100)
+        plt.close(fig) # Sin cerrarla la figura se queda en memoria
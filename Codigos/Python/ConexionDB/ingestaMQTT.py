@@ -0,0 +1,339 @@
+# Clase: ingestaMQTT
+# Esta clase se encarga de recibir las mediciones que publican los ordenadores por MQTT y guardarlas en la base de datos por lotes
+# Sustituye al nodo de Node-RED que hace un INSERT por cada mensaje
+# Por Fernando Daniel Ramirez
+
+import paho.mqtt.client as mqtt
+from extraerdatosDB import DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, crearbackend
+from conexionDB import conexionDB, TABLAS_INTERNAS
+from poolconexiones import poolconexiones
+from resumenesDB import resumenesDB
+from datetime import datetime
+import json
+import math
+import os
+import re
+import threading
+import time
+
+TEMA_ACTUALIZADOS = "capstone_energia/actualizados" # Tema en el que se avisa que una tabla recibio registros atrasados (ver actualizarresumenes)
+
+
+class ingestaMQTT():
+
+    # El constructor recibe los datos para conectarse al broker y el tema en el que publican los ordenadores
+    # tamano_lote: registros acumulados a partir de los cuales se escriben en la base de datos
+    # intervalo_escritura: segundos maximos que un registro espera en memoria antes de escribirse
+    # archivo_respaldo: archivo JSONL donde se guardan los registros mientras la base de datos no esta disponible
+    # intervalo_resumenes: segundos entre actualizaciones de los resumenes por hora y por dia de las tablas que recibieron registros
+    # cachefechas: opcional, la ultima fecha de cada tabla se actualiza al escribir los registros
+    def __init__(self,addr,usr,passw,topic="capstone_energia/potencia",pool=None,tamano_lote=500,intervalo_escritura=2,
+                 archivo_respaldo="respaldo_ingesta.jsonl",intervalo_resumenes=300,cachefechas=None):
+        self.MQTT_ADDRESS = addr
+        self.MQTT_USER = usr
+        self.MQTT_PASSWORD = passw
+        self.MQTT_TOPIC = topic
+
+        if pool is None:
+            pool = poolconexiones(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,tamano_max=2,backend=crearbackend())
+        self.pool = pool
+        self.backend = pool.backend # Tablas e INSERT propios del motor de base de datos
+        self.cachefechas = cachefechas
+        self.tamano_lote = tamano_lote
+        self.intervalo_escritura = intervalo_escritura
+        self.archivo_respaldo = archivo_respaldo
+        self.intervalo_resumenes = intervalo_resumenes
+
+        self.registros = [] # Registros (tabla, fecha, potencia, energia) en espera de escribirse
+        self.tablas = set() # Tablas que ya se crearon o se verificaron
+        self.pendientes_resumen = {} # Tablas con registros nuevos desde la ultima actualizacion de resumenes -> fecha del registro mas antiguo
+        self.ultimo_resumen = time.monotonic()
+        self.condicion = threading.Condition()
+        self.cerrado = False
+
+        # Contadores
+        self.inicio = time.monotonic()
+        self.recibidos = 0 # Mensajes recibidos
+        self.invalidos = 0 # Mensajes descartados por no ser validos
+        self.insertados = 0 # Registros escritos en la base de datos (incluye los repetidos que se omitieron en las tablas con llave sobre fecha)
+        self.lotes = 0 # Escrituras realizadas
+        self.respaldados = 0 # Registros guardados en el archivo de respaldo
+        self.reproducidos = 0 # Registros del archivo de respaldo escritos en la base de datos
+        self.errores = 0 # Escrituras fallidas (y errores inesperados del hilo de escritura)
+        self.perdidos = 0 # Registros que no se pudieron escribir ni respaldar
+
+        # Hilo que escribe los registros acumulados
+        self.hilo = threading.Thread(target=self.escribir,daemon=True)
+        self.hilo.start()
+
+        self.mqtt_client = mqtt.Client()
+        self.mqtt_client.username_pw_set(self.MQTT_USER, self.MQTT_PASSWORD)
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_message = self.on_message
+
+        self.mqtt_client.connect(self.MQTT_ADDRESS, 1883)
+        try:
+            self.mqtt_client.loop_forever()
+        finally:
+            self.cerrar()
+
+    # Se suscribe al tema de los ordenadores
+    def on_connect(self,client, userdata, flags, rc):
+        print('Connected with result code ' + str(rc))
+        client.subscribe(self.MQTT_TOPIC)
+
+    # Cuando llega una medicion solo se valida y se agrega al lote; la escritura se hace en otro hilo
+    def on_message(self,client, userdata, msg):
+        registro = self.validar(msg.payload)
+        with self.condicion:
+            self.recibidos += 1
+            if registro is None:
+                self.invalidos += 1
+                return
+            self.registros.append(registro)
+            if len(self.registros) >= self.tamano_lote:
+                self.condicion.notify()
+
+    # Valida un mensaje {"id","potencia","energia"} y regresa el registro (tabla, fecha, potencia, energia), o None si no es valido
+    # El "id" es el nombre de la tabla, por eso solo se aceptan caracteres validos en un identificador de MariaDB
+    # Tambien la usa conexionMQTT para alimentar el buffer circular con el mismo tema
+    @staticmethod
+    def validar(payload):
+        try:
+            mensaje = json.loads(payload)
+            tabla = str(mensaje["id"])
+            potencia = float(mensaje["potencia"])
+            energia = float(mensaje["energia"])
+        except (ValueError,TypeError,KeyError):
+            return None
+
+        if re.fullmatch(r"[A-Za-z0-9_]{1,64}",tabla) is None or tabla in TABLAS_INTERNAS:
+            return None
+        if not math.isfinite(potencia) or not math.isfinite(energia):
+            return None
+
+        fecha = datetime.now().replace(microsecond=0) # Misma precision que la columna "fecha" (datetime)
+        return (tabla,fecha,potencia,energia)
+
+    # Hilo de escritura: escribe el lote al llenarse o cada "intervalo_escritura" segundos
+    def escribir(self):
+        while True:
+            with self.condicion:
+                if len(self.registros) < self.tamano_lote and not self.cerrado:
+                    self.condicion.wait(self.intervalo_escritura)
+                registros = self.registros
+                self.registros = []
+                cerrado = self.cerrado
+
+            try:
+                if len(registros) > 0:
+                    self.escribirlote(registros)
+                elif os.path.exists(self.archivo_respaldo) or os.path.exists(self.archivo_respaldo + ".reproduciendo"):
+                    self.reproducirrespaldo() # Sin registros nuevos, se aprovecha para vaciar el respaldo
+
+                if time.monotonic() - self.ultimo_resumen >= self.intervalo_resumenes or cerrado:
+                    self.actualizarresumenes()
+            except Exception as e: # Un error inesperado no debe detener el hilo: los mensajes se seguirian acumulando sin escribirse
+                print(f"Error en el hilo de escritura: {e}")
+                with self.condicion:
+                    self.errores += 1
+
+            if cerrado:
+                return
+
+    # Escribe un lote de registros en la base de datos; si no esta disponible, los guarda en el archivo de respaldo
+    def escribirlote(self,registros):
+        try:
+            conn = self.pool.obtener()
+        except self.backend.Error as e:
+            print(f"Base de datos no disponible, se respaldan {len(registros)} registro(s): {e}")
+            with self.condicion:
+                self.errores += 1
+            self.respaldar(registros)
+            return
+
+        try:
+            self.insertar(conn,registros)
+        except self.backend.Error as e:
+            print(f"Error al escribir {len(registros)} registro(s), se respaldan: {e}")
+            self.pool.descartar(conn)
+            with self.condicion:
+                self.errores += 1
+            self.respaldar(registros)
+            return
+        self.pool.devolver(conn)
+
+        with self.condicion:
+            self.insertados += len(registros)
+            self.lotes += 1
+
+        # La base de datos respondio, se reproducen los registros respaldados mientras no estaba disponible
+        if os.path.exists(self.archivo_respaldo) or os.path.exists(self.archivo_respaldo + ".reproduciendo"):
+            self.reproducirrespaldo()
+
+    # Inserta los registros con un executemany por tabla, creando las tablas que no existan
+    # Todos los registros se escriben en una sola transaccion: si la escritura falla no queda ninguno escrito,
+    # asi al respaldarlos y reproducirlos despues no se duplican
+    def insertar(self,conn,registros):
+        por_tabla = {}
+        for (tabla,fecha,potencia,energia) in registros:
+            por_tabla.setdefault(tabla,[]).append((fecha,potencia,energia))
+
+        cur = conn.cursor()
+        for tabla in por_tabla:
+            if tabla not in self.tablas: # Fuera de la transaccion: en MariaDB un CREATE TABLE la confirma
+                cur.execute(self.backend.sqlcreartabla(tabla))
+                self.tablas.add(tabla)
+
+        cur.execute("BEGIN")
+        for tabla,filas in por_tabla.items():
+            # Las fechas repetidas solo se omiten en las tablas con llave sobre fecha (las que crea el servicio o las migradas con migracionDB)
+            cur.executemany(self.backend.sqlinsertarignorando(tabla),filas)
+        cur.execute("COMMIT")
+
+        for tabla,filas in por_tabla.items():
+            if self.cachefechas is not None:
+                self.cachefechas.actualizarfin(tabla,max(fila[0] for fila in filas))
+            primera = min(fila[0] for fila in filas)
+            self.pendientes_resumen[tabla] = min(self.pendientes_resumen.get(tabla,primera),primera)
+        cur.close()
+
+    # Agrega registros al archivo de respaldo, una linea JSON por registro
+    # Se fuerza la escritura a disco para no perder los registros si el servicio se detiene
+    def respaldar(self,registros):
+        try:
+            with open(self.archivo_respaldo,"a") as archivo:
+                for (tabla,fecha,potencia,energia) in registros:
+                    archivo.write(json.dumps({"id":tabla,"fecha":str(fecha),"potencia":potencia,"energia":energia}) + "\n")
+                archivo.flush()
+                os.fsync(archivo.fileno())
+        except OSError as e:
+            print(f"Error al escribir el archivo de respaldo, se pierden {len(registros)} registro(s): {e}")
+            with self.condicion:
+                self.perdidos += len(registros)
+            return
+        with self.condicion:
+            self.respaldados += len(registros)
+
+    # Escribe en la base de datos los registros del archivo de respaldo
+    # El archivo se renombra antes de leerlo, asi los registros que se respalden mientras tanto van a un archivo nuevo
+    # Despues de escribir cada lote se guarda en <archivo>.avance la posicion (en bytes) hasta la que se escribio;
+    # si la escritura falla a la mitad, la siguiente reproduccion continua desde ahi en lugar de volver a escribir los lotes ya escritos
+    # (las tablas sin llave sobre fecha no pueden omitir registros repetidos)
+    def reproducirrespaldo(self):
+        reproduciendo = self.archivo_respaldo + ".reproduciendo"
+        avance = reproduciendo + ".avance"
+        if not os.path.exists(reproduciendo):
+            if not os.path.exists(self.archivo_respaldo):
+                return
+            if os.path.exists(avance): # Avance de una reproduccion anterior que ya termino
+                os.remove(avance)
+            os.replace(self.archivo_respaldo,reproduciendo)
+
+        try:
+            conn = self.pool.obtener()
+        except self.backend.Error:
+            return # La base de datos sigue sin estar disponible
+
+        total = 0
+        try:
+            lote = []
+            posicion = self.leeravance(avance)
+            with open(reproduciendo,"rb") as archivo:
+                archivo.seek(posicion)
+                for linea in archivo:
+                    posicion += len(linea)
+                    try:
+                        registro = json.loads(linea)
+                        lote.append((registro["id"],datetime.strptime(registro["fecha"],'%Y-%m-%d %H:%M:%S'),registro["potencia"],registro["energia"]))
+                    except (ValueError,KeyError):
+                        continue # Linea incompleta (el servicio se detuvo mientras se escribia)
+                    if len(lote) >= self.tamano_lote:
+                        self.insertar(conn,lote)
+                        self.guardaravance(avance,posicion)
+                        total += len(lote)
+                        lote = []
+            if len(lote) > 0:
+                self.insertar(conn,lote)
+                self.guardaravance(avance,posicion)
+                total += len(lote)
+        except self.backend.Error as e:
+            print(f"Error al reproducir el archivo de respaldo: {e}")
+            self.pool.descartar(conn)
+            return
+        self.pool.devolver(conn)
+
+        # Sin lineas validas no se guardo ningun avance
+        for archivo in (reproduciendo,avance):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+        with self.condicion:
+            self.reproducidos += total
+        print(f"{total} registro(s) del archivo de respaldo escritos en la base de datos")
+
+    # Lee la posicion del archivo de respaldo hasta la que ya se escribieron los registros (0 si no hay avance guardado)
+    def leeravance(self,avance):
+        try:
+            with open(avance) as archivo:
+                return int(archivo.read())
+        except (OSError,ValueError):
+            return 0
+
+    # Guarda la posicion hasta la que se escribieron los registros del archivo de respaldo
+    # Se escribe en un archivo temporal que luego reemplaza al anterior, asi nunca queda a medio escribir
+    def guardaravance(self,avance,posicion):
+        with open(avance + ".tmp","w") as archivo:
+            archivo.write(str(posicion))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(avance + ".tmp",avance)
+
+    # Pone al dia los resumenes por hora y por dia de las tablas que recibieron registros
+    # Si alguna recibio registros de horas ya resumidas, se avisa en TEMA_ACTUALIZADOS con {"id","desde"}
+    # para que conexionMQTT deje de usar los resultados que tiene en cache de esa tabla
+    def actualizarresumenes(self):
+        self.ultimo_resumen = time.monotonic()
+        if len(self.pendientes_resumen) == 0:
+            return
+
+        try:
+            connDB = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,self.pool,backend=self.backend)
+        except self.backend.Error: # La base de datos no esta disponible, se intenta en la siguiente actualizacion
+            return
+        resumenes = resumenesDB(connDB)
+        try:
+            resumenes.creartablas()
+            for tabla,desde in list(self.pendientes_resumen.items()):
+                # Desde el registro mas antiguo: los del archivo de respaldo pueden caer en horas ya resumidas
+                if resumenes.actualizar(tabla,desde):
+                    self.mqtt_client.publish(TEMA_ACTUALIZADOS,json.dumps({"id":tabla,"desde":str(desde)}))
+                del self.pendientes_resumen[tabla]
+        except self.backend.Error as e:
+            print(f"Error al actualizar los resumenes: {e}")
+            connDB.cerrar(False)
+            return
+        connDB.cerrar()
+
+    # Escribe los registros pendientes y detiene el hilo de escritura
+    def cerrar(self):
+        with self.condicion:
+            self.cerrado = True
+            self.condicion.notify()
+        self.hilo.join()
+
+    # Regresa los contadores de la ingesta, incluyendo los registros escritos por segundo desde el inicio
+    def estadisticas(self):
+        with self.condicion:
+            duracion = time.monotonic() - self.inicio
+            return {
+                "recibidos": self.recibidos,
+                "invalidos": self.invalidos,
+                "insertados": self.insertados,
+                "lotes": self.lotes,
+                "respaldados": self.respaldados,
+                "reproducidos": self.reproducidos,
+                "errores": self.errores,
+                "perdidos": self.perdidos,
+                "pendientes": len(self.registros),
+                "registros_por_segundo": self.insertados / duracion if duracion > 0 else 0,
+            }
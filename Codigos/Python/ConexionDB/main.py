@@ -1,6 +1,15 @@
 
 #from extraerdatosDB import extraerdatosDB
 from conexionMQTT import conexionMQTT
+from ingestaMQTT import ingestaMQTT
+import sys
 
-# Se realiza una conexion MQTT para recibir mensajes provenientes de NodeRed
-connMQTT = conexionMQTT("3.126.191.185","fernando","pass1234","capstone_energia/parametrosGraficas")
+# Uso: python main.py [peticiones|ingesta]
+modo = sys.argv[1] if len(sys.argv) > 1 else "peticiones"
+
+if modo == "ingesta":
+    # Se reciben las mediciones de los ordenadores y se guardan en la base de datos por lotes
+    ingesta = ingestaMQTT("3.126.191.185","fernando","pass1234","capstone_energia/potencia")
+else:
+    # Se realiza una conexion MQTT para recibir mensajes provenientes de NodeRed
+    connMQTT = conexionMQTT("3.126.191.185","fernando","pass1234","capstone_energia/parametrosGraficas")
@@ -0,0 +1,342 @@
+# Clase: metricas
+# Esta clase se encarga de medir cuanto tiempo pasa cada peticion en cada etapa (espera en la cola, busqueda de limites,
+# querys, decodificacion, lectura del buffer circular, agregacion, codificacion y publicacion) y de acumular los tiempos, filas y bytes de todas las peticiones
+# Los resultados se exponen como texto para Prometheus o como JSON (ver conexionMQTT)
+# Cuando esta deshabilitada las trazas son objetos vacios que no miden nada, asi el costo en las peticiones es casi nulo
+# Por Fernando Daniel Ramirez
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import json
+import threading
+import time
+
+ETAPAS = ("espera_cola","limites","sql","decodificacion","buffer","agregacion","codificacion","publicacion")
+
+# Limites superiores (en segundos) de las cubetas de los histogramas de tiempo
+LIMITES_HISTOGRAMA = (0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10)
+
+
+# Escapa el valor de una etiqueta de Prometheus (\\, comillas y saltos de linea), para que no pueda cerrar la etiqueta ni agregar lineas
+def escaparetiqueta(valor):
+    return str(valor).replace("\\","\\\\").replace("\"","\\\"").replace("\n","\\n")
+
+
+# Histograma de tiempos: numero de observaciones por cubeta, suma y maximo
+class histograma():
+
+    __slots__ = ("cubetas","suma","n","maximo")
+
+    def __init__(self):
+        self.cubetas = [0] * (len(LIMITES_HISTOGRAMA) + 1) # La ultima cubeta es +Inf
+        self.suma = 0.0
+        self.n = 0
+        self.maximo = 0.0
+
+    def observar(self,segundos):
+        self.cubetas[bisect.bisect_left(LIMITES_HISTOGRAMA,segundos)] += 1
+        self.suma += segundos
+        self.n += 1
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+
+# Medicion de una etapa dentro de una traza, se usa con "with"
+class medicion():
+
+    __slots__ = ("traza","etapa")
+
+    def __init__(self,traza,etapa):
+        self.traza = traza
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.traza.entrar(self.etapa)
+        return self
+
+    def __exit__(self,tipo,valor,rastreo):
+        self.traza.salir()
+        return False
+
+
+# Traza de una peticion: tiempo de cada etapa, filas leidas y bytes publicados
+# Las etapas se pueden anidar (por ejemplo la decodificacion dentro de la query); cada etapa cuenta solo su tiempo propio,
+# sin el de las etapas que contiene, asi la suma de las etapas nunca es mayor que la duracion de la peticion
+# Una traza se usa desde un solo hilo; los hilos de una peticion de flota usan trazas hijas que se unen al terminar
+class traza():
+
+    def __init__(self,metricas,modo=None):
+        self.metricas = metricas
+        self.modo = modo
+        self.inicio = time.perf_counter()
+        self.etapas = {} # Segundos por etapa
+        self.filas = 0
+        self.bytes = 0
+        self.pila = [] # Etapas abiertas, la ultima es la que se esta midiendo
+        self.desde = 0.0 # Momento desde el que se mide la ultima etapa abierta
+
+    # Regresa un objeto para medir una etapa con "with"
+    def medir(self,etapa):
+        return medicion(self,etapa)
+
+    # Asigna el modo de la peticion, con el que se cuentan las peticiones
+    def etiquetar(self,modo):
+        self.modo = modo
+
+    def entrar(self,etapa):
+        ahora = time.perf_counter()
+        if len(self.pila) > 0: # La etapa que la contiene deja de contar
+            anterior = self.pila[-1]
+            self.etapas[anterior] = self.etapas.get(anterior,0.0) + ahora - self.desde
+        self.pila.append(etapa)
+        self.desde = ahora
+
+    def salir(self):
+        ahora = time.perf_counter()
+        etapa = self.pila.pop()
+        self.etapas[etapa] = self.etapas.get(etapa,0.0) + ahora - self.desde
+        self.desde = ahora # La etapa que la contiene vuelve a contar
+
+    # Agrega a una etapa un tiempo medido fuera de la traza (por ejemplo la espera en la cola)
+    def agregar(self,etapa,segundos):
+        self.etapas[etapa] = self.etapas.get(etapa,0.0) + segundos
+
+    def contarfilas(self,filas):
+        self.filas += filas
+
+    def contarbytes(self,cantidad):
+        self.bytes += cantidad
+
+    # Crea una traza para otro hilo de la misma peticion
+    def hija(self):
+        return traza(self.metricas,self.modo)
+
+    # Suma a esta traza los tiempos y contadores de una traza hija
+    def unir(self,hija):
+        for etapa,segundos in hija.etapas.items():
+            self.etapas[etapa] = self.etapas.get(etapa,0.0) + segundos
+        self.filas += hija.filas
+        self.bytes += hija.bytes
+
+    # Termina la traza y la acumula en las metricas
+    def terminar(self,error=False):
+        self.metricas.registrar(self,time.perf_counter() - self.inicio,error)
+
+    # Representacion de la traza como diccionario (tiempos en milisegundos)
+    def resumen(self,duracion):
+        return {
+            "modo": self.modo,
+            "duracion_ms": round(duracion * 1000,3),
+            "etapas_ms": {etapa: round(segundos * 1000,3) for etapa,segundos in self.etapas.items()},
+            "filas": self.filas,
+            "bytes": self.bytes,
+        }
+
+
+# Traza que no mide nada, para cuando las metricas estan deshabilitadas
+class trazanula():
+
+    __slots__ = ()
+
+    def medir(self,etapa):
+        return MEDICION_NULA
+
+    def etiquetar(self,modo):
+        pass
+
+    def agregar(self,etapa,segundos):
+        pass
+
+    def contarfilas(self,filas):
+        pass
+
+    def contarbytes(self,cantidad):
+        pass
+
+    def hija(self):
+        return self
+
+    def unir(self,hija):
+        pass
+
+    def terminar(self,error=False):
+        pass
+
+
+# Medicion que no mide nada
+class medicionnula():
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,tipo,valor,rastreo):
+        return False
+
+MEDICION_NULA = medicionnula()
+TRAZA_NULA = trazanula() # No guarda estado, se comparte entre todas las peticiones
+
+
+class metricas():
+
+    # El constructor recibe si las metricas estan habilitadas y, opcionalmente, la duracion en segundos a partir de la cual
+    # una peticion se considera lenta y su traza se imprime completa en una linea JSON
+    def __init__(self,habilitada=True,umbral_lento=None):
+        self.habilitada = habilitada
+        self.umbral_lento = umbral_lento
+        self.candado = threading.Lock()
+        self.inicio = time.time()
+
+        self.peticiones = {} # Peticiones atendidas por modo
+        self.errores = 0
+        self.descartadas = 0 # Peticiones descartadas por tener la cola llena (ver ejecutorpeticiones)
+        self.filas = 0
+        self.bytes = 0
+        self.duracion = histograma() # Duracion total de las peticiones
+        self.etapas = {etapa: histograma() for etapa in ETAPAS} # Tiempo de cada etapa
+
+        self.servidor = None
+
+    # Crea la traza de una nueva peticion (una traza vacia si las metricas estan deshabilitadas)
+    def traza(self,modo=None):
+        if not self.habilitada:
+            return TRAZA_NULA
+        return traza(self,modo)
+
+    # Acumula una traza terminada
+    def registrar(self,traza,duracion,error=False):
+        with self.candado:
+            modo = str(traza.modo)
+            self.peticiones[modo] = self.peticiones.get(modo,0) + 1
+            if error:
+                self.errores += 1
+            self.filas += traza.filas
+            self.bytes += traza.bytes
+            self.duracion.observar(duracion)
+            for etapa,segundos in traza.etapas.items():
+                if etapa not in self.etapas:
+                    self.etapas[etapa] = histograma()
+                self.etapas[etapa].observar(segundos)
+
+        if self.umbral_lento is not None and duracion >= self.umbral_lento:
+            print("Peticion lenta: " + json.dumps(traza.resumen(duracion)))
+
+    # Cuenta una peticion descartada sin atenderse
+    def contardescartada(self):
+        with self.candado:
+            self.descartadas += 1
+
+    # Regresa los contadores y tiempos acumulados como diccionario (tiempos en milisegundos)
+    # componentes: diccionario opcional {nombre: estadisticas} de otros objetos del servicio (pool, caches, ejecutor...)
+    def estadisticas(self,componentes=None):
+        with self.candado:
+            resultado = {
+                "habilitada": self.habilitada,
+                "segundos_activo": round(time.time() - self.inicio),
+                "peticiones": dict(self.peticiones),
+                "errores": self.errores,
+                "descartadas": self.descartadas,
+                "filas": self.filas,
+                "bytes": self.bytes,
+                "duracion": self.resumirhistograma(self.duracion),
+                "etapas": {etapa: self.resumirhistograma(h) for etapa,h in self.etapas.items() if h.n > 0},
+            }
+        if componentes is not None:
+            resultado.update(componentes)
+        return resultado
+
+    # Numero de observaciones, promedio y maximo de un histograma, en milisegundos
+    def resumirhistograma(self,h):
+        return {
+            "n": h.n,
+            "promedio_ms": round(h.suma / h.n * 1000,3) if h.n > 0 else 0,
+            "max_ms": round(h.maximo * 1000,3),
+        }
+
+    # Regresa las metricas en el formato de texto de Prometheus
+    # Los valores numericos de los componentes se exponen como potencia_<componente>_<clave>
+    def prometheus(self,componentes=None):
+        lineas = []
+        with self.candado:
+            lineas.append("# HELP potencia_peticiones_total Peticiones atendidas por modo")
+            lineas.append("# TYPE potencia_peticiones_total counter")
+            for modo,n in sorted(self.peticiones.items()):
+                lineas.append("potencia_peticiones_total{modo=\"" + escaparetiqueta(modo) + "\"} " + str(n))
+            lineas.append("# TYPE potencia_peticiones_error_total counter")
+            lineas.append("potencia_peticiones_error_total " + str(self.errores))
+            lineas.append("# TYPE potencia_peticiones_descartadas_total counter")
+            lineas.append("potencia_peticiones_descartadas_total " + str(self.descartadas))
+            lineas.append("# TYPE potencia_filas_total counter")
+            lineas.append("potencia_filas_total " + str(self.filas))
+            lineas.append("# TYPE potencia_bytes_publicados_total counter")
+            lineas.append("potencia_bytes_publicados_total " + str(self.bytes))
+
+            lineas.append("# HELP potencia_peticion_segundos Duracion de las peticiones")
+            lineas.append("# TYPE potencia_peticion_segundos histogram")
+            self.escribirhistograma(lineas,"potencia_peticion_segundos","",self.duracion)
+
+            lineas.append("# HELP potencia_etapa_segundos Tiempo de cada etapa de las peticiones")
+            lineas.append("# TYPE potencia_etapa_segundos histogram")
+            for etapa,h in self.etapas.items():
+                self.escribirhistograma(lineas,"potencia_etapa_segundos","etapa=\"" + escaparetiqueta(etapa) + "\",",h)
+
+        if componentes is not None:
+            for componente,valores in componentes.items():
+                for clave,valor in valores.items():
+                    if isinstance(valor,(int,float)) and not isinstance(valor,bool):
+                        lineas.append("potencia_" + componente + "_" + clave + " " + str(valor))
+
+        return "\n".join(lineas) + "\n"
+
+    # Agrega las lineas de un histograma (cubetas acumuladas, suma y conteo) en el formato de Prometheus
+    def escribirhistograma(self,lineas,nombre,etiquetas,h):
+        acumulado = 0
+        for limite,n in zip(LIMITES_HISTOGRAMA + ("+Inf",),h.cubetas):
+            acumulado += n
+            lineas.append(nombre + "_bucket{" + etiquetas + "le=\"" + str(limite) + "\"} " + str(acumulado))
+        etiquetas = "{" + etiquetas.rstrip(",") + "}" if etiquetas != "" else ""
+        lineas.append(nombre + "_sum" + etiquetas + " " + repr(h.suma))
+        lineas.append(nombre + "_count" + etiquetas + " " + str(h.n))
+
+    # Sirve las metricas en http://<host>:<puerto>/metrics en un hilo aparte, para que Prometheus las lea
+    # obtenercomponentes: funcion que regresa los componentes a incluir (ver prometheus)
+    def servir(self,puerto,obtenercomponentes=None,host=""):
+        metricas = self
+
+        class manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                componentes = obtenercomponentes() if obtenercomponentes is not None else None
+                cuerpo = metricas.prometheus(componentes).encode()
+                self.send_response(200)
+                self.send_header("Content-Type","text/plain; version=0.0.4")
+                self.send_header("Content-Length",str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self,formato,*args): # Sin una linea impresa por cada lectura
+                pass
+
+        self.servidor = ThreadingHTTPServer((host,puerto),manejador)
+        threading.Thread(target=self.servidor.serve_forever,name="metricas",daemon=True).start()
+
+    # Detiene el servidor de metricas, si se inicio
+    def cerrar(self):
+        if self.servidor is not None:
+            self.servidor.shutdown()
+            self.servidor = None
+
+if __name__ == '__main__': # Un ejemplo del funcionamiento de esta clase
+    m = metricas(umbral_lento=0.01)
+    t = m.traza("DIFF")
+    with t.medir("sql"):
+        time.sleep(0.01)
+        with t.medir("decodificacion"):
+            time.sleep(0.005)
+    t.contarfilas(360)
+    t.terminar()
+    print(m.prometheus())
+    print(json.dumps(m.estadisticas()))
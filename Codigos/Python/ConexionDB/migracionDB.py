@@ -0,0 +1,157 @@
+# Clase: migracionDB
+# Esta clase se encarga de agregar un indice de tiempo (y opcionalmente particiones por mes) a las tablas de los ordenadores
+# Uso: python migracionDB.py [--particionar] [--solo-validar] [TABLA ...]
+# Solo aplica a MariaDB: las tablas de SQLite (backendsqlite) ya se crean ordenadas por fecha
+# Por Fernando Daniel Ramirez
+
+from conexionDB import conexionDB
+from extraerdatosDB import DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, crearbackend
+from datetime import datetime
+import argparse
+
+
+class migracionDB():
+
+    # El constructor recibe el conector a la base de datos (conexionDB) sobre el que se hacen las migraciones
+    def __init__(self,connDB):
+        self.connDB = connDB
+
+    # Obtiene el estado de una tabla: numero de registros, fechas nulas, fechas repetidas, indices sobre fecha y si esta particionada
+    def validar(self,table):
+        cur = self.connDB.conn.cursor()
+
+        cur.execute("SELECT COUNT(*),COUNT(*) - COUNT(fecha),COUNT(fecha) - COUNT(DISTINCT fecha),MIN(fecha),MAX(fecha) FROM " + table)
+        (registros,nulas,repetidas,primera,ultima) = cur.fetchone()
+
+        cur.execute("SELECT index_name FROM information_schema.statistics" +
+                    " WHERE table_schema = ? AND table_name = ? AND column_name = 'fecha' AND seq_in_index = 1",(self.connDB.database,table))
+        indices = [nombre for (nombre,) in cur]
+
+        cur.execute("SELECT COUNT(*) FROM information_schema.partitions" +
+                    " WHERE table_schema = ? AND table_name = ? AND partition_name IS NOT NULL",(self.connDB.database,table))
+        (particiones,) = cur.fetchone()
+
+        # Se verifica que la query de la ultima fecha use el indice
+        cur.execute("EXPLAIN SELECT fecha FROM " + table + " ORDER BY fecha DESC LIMIT 1")
+        columnas = [columna[0] for columna in cur.description]
+        plan = cur.fetchone()
+        indice_usado = plan[columnas.index("key")] if plan is not None else None
+
+        return {
+            "registros": registros,
+            "nulas": nulas,
+            "repetidas": repetidas,
+            "primera": primera,
+            "ultima": ultima,
+            "indices": indices,
+            "particiones": particiones,
+            "indice_usado": indice_usado,
+        }
+
+    # Agrega el indice de tiempo a una tabla
+    # Si las fechas no tienen nulos ni repetidos, fecha se vuelve la llave primaria: InnoDB guarda los registros ordenados
+    # por la llave primaria (indice agrupado), asi que las ventanas de tiempo se leen de forma contigua.
+    # En otro caso se agrega un indice secundario sobre fecha
+    def migrar(self,table,particionar=False):
+        estado = self.validar(table)
+        cur = self.connDB.conn.cursor()
+
+        if len(estado["indices"]) > 0:
+            print(table + ": ya tiene indice sobre fecha " + str(estado["indices"]))
+        elif estado["nulas"] == 0 and estado["repetidas"] == 0:
+            print(table + ": agregando llave primaria (fecha)")
+            cur.execute("ALTER TABLE " + table + " MODIFY fecha datetime NOT NULL, ADD PRIMARY KEY (fecha)")
+        else:
+            print(table + ": " + str(estado["nulas"]) + " fecha(s) nula(s) y " + str(estado["repetidas"]) + " fecha(s) repetida(s), agregando indice secundario idx_fecha")
+            cur.execute("ALTER TABLE " + table + " ADD INDEX idx_fecha (fecha)")
+
+        if particionar:
+            self.particionar(table)
+
+        # Se valida que la migracion no haya perdido registros y que las querys usen el indice
+        nuevo_estado = self.validar(table)
+        if nuevo_estado["registros"] != estado["registros"]:
+            raise RuntimeError(table + ": el numero de registros cambio de " + str(estado["registros"]) + " a " + str(nuevo_estado["registros"]))
+        if nuevo_estado["indice_usado"] is None:
+            print(table + ": advertencia, la query de la ultima fecha no usa el indice")
+
+        return nuevo_estado
+
+    # Particiona una tabla por mes, desde el mes de su primer registro hasta el mes siguiente al actual
+    # Los registros posteriores caen en la particion "pfuturo"; volver a ejecutar la migracion la divide en los meses que falten.
+    # Requiere que fecha sea la llave primaria
+    def particionar(self,table):
+        estado = self.validar(table)
+        cur = self.connDB.conn.cursor()
+
+        if "PRIMARY" not in estado["indices"]:
+            print(table + ": no se puede particionar, fecha no es la llave primaria")
+            return
+
+        hoy = datetime.now()
+        inicio = estado["primera"] if estado["primera"] is not None else hoy
+        fin = self.mesiguiente(datetime(hoy.year,hoy.month,1))
+
+        # Meses para los que se crea una particion
+        meses = []
+        mes = datetime(inicio.year,inicio.month,1)
+        while mes <= fin:
+            meses.append(mes)
+            mes = self.mesiguiente(mes)
+
+        if estado["particiones"] == 0:
+            print(table + ": particionando por mes (" + str(len(meses)) + " particiones)")
+            cur.execute("ALTER TABLE " + table + " PARTITION BY RANGE (TO_DAYS(fecha)) (" + self.definirparticiones(meses) + ")")
+            return
+
+        # La tabla ya esta particionada, se agregan los meses que falten dividiendo la particion "pfuturo"
+        cur.execute("SELECT partition_name FROM information_schema.partitions WHERE table_schema = ? AND table_name = ?",(self.connDB.database,table))
+        existentes = [nombre for (nombre,) in cur]
+        faltantes = [mes for mes in meses if self.nombreparticion(mes) not in existentes]
+        if len(faltantes) == 0:
+            print(table + ": particiones al dia")
+            return
+
+        print(table + ": agregando " + str(len(faltantes)) + " particion(es)")
+        cur.execute("ALTER TABLE " + table + " REORGANIZE PARTITION pfuturo INTO (" + self.definirparticiones(faltantes) + ")")
+
+    # Define las particiones de los meses dados, mas la particion "pfuturo" para fechas posteriores
+    def definirparticiones(self,meses):
+        particiones = []
+        for mes in meses:
+            particiones.append("PARTITION " + self.nombreparticion(mes) + " VALUES LESS THAN (TO_DAYS('" + str(self.mesiguiente(mes).date()) + "'))")
+        particiones.append("PARTITION pfuturo VALUES LESS THAN MAXVALUE")
+        return ",".join(particiones)
+
+    # Nombre de la particion de un mes, por ejemplo p202202
+    def nombreparticion(self,mes):
+        return "p" + mes.strftime("%Y%m")
+
+    # Primer dia del mes siguiente
+    def mesiguiente(self,mes):
+        if mes.month == 12:
+            return datetime(mes.year+1,1,1)
+        return datetime(mes.year,mes.month+1,1)
+
+if __name__ == '__main__': # Migra las tablas indicadas, o todas las tablas de los ordenadores
+    parser = argparse.ArgumentParser(description="Agrega un indice de tiempo a las tablas de los ordenadores")
+    parser.add_argument("tablas",nargs="*",help="tablas a migrar (por defecto todas)")
+    parser.add_argument("--particionar",action="store_true",help="particiona las tablas por mes")
+    parser.add_argument("--solo-validar",action="store_true",help="solo muestra el estado de las tablas")
+    args = parser.parse_args()
+
+    connDB = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,backend=crearbackend("MARIADB"))
+    migracion = migracionDB(connDB)
+
+    existentes = connDB.extraernombrestablas()
+    tablas = args.tablas if len(args.tablas) > 0 else existentes
+    for table in tablas:
+        if table not in existentes:
+            print(table + ": no existe")
+            continue
+        if args.solo_validar:
+            print(table + ": " + str(migracion.validar(table)))
+        else:
+            print(table + ": " + str(migracion.migrar(table,args.particionar)))
+
+    connDB.cerrar()
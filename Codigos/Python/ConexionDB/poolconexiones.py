@@ -0,0 +1,190 @@
+# Clase: poolconexiones
+# Esta clase se encarga de mantener un conjunto acotado de conexiones persistentes a la base de datos que se comparten entre peticiones
+# Por Fernando Daniel Ramirez
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class poolconexiones():
+
+    # El constructor recibe los datos para conectarse a la base de datos y los limites del pool
+    # tamano_max: numero maximo de conexiones abiertas al mismo tiempo
+    # tiempo_max_inactiva: segundos que una conexion libre puede permanecer abierta antes de cerrarse
+    # intervalo_verificacion: segundos de inactividad a partir de los cuales se verifica la conexion (ping) antes de reutilizarla
+    # tiempo_espera: segundos maximos que se espera por una conexion libre cuando el pool esta lleno
+    # backend: motor de base de datos (backendmariadb o backendsqlite); si no se da, se usa MariaDB con los datos de conexion recibidos
+    def __init__(self,usr,passw,host,port,database,tamano_max=4,tiempo_max_inactiva=300,intervalo_verificacion=30,tiempo_espera=10,backend=None):
+        if backend is None:
+            from backendmariadb import backendmariadb
+            backend = backendmariadb(usr,passw,host,port,database)
+        self.backend = backend
+        self.usr = usr
+        self.passw = passw
+        self.host = host
+        self.port = port
+        self.database = database
+
+        self.tamano_max = tamano_max
+        self.tiempo_max_inactiva = tiempo_max_inactiva
+        self.intervalo_verificacion = intervalo_verificacion
+        self.tiempo_espera = tiempo_espera
+
+        self.libres = [] # Conexiones libres como pares (conexion, instante en que se liberaron)
+        self.preparadas = {} # id de la conexion -> cursores preparados de esa conexion por query (ver conexionDB.ejecutar)
+        self.abiertas = 0 # Conexiones abiertas, libres o en uso
+        self.cerrado = False
+        self.condicion = threading.Condition()
+
+        # Contadores para dimensionar el pool
+        self.aciertos = 0 # Peticiones atendidas con una conexion ya abierta
+        self.creadas = 0 # Conexiones nuevas
+        self.esperas = 0 # Peticiones que tuvieron que esperar una conexion libre
+        self.reconexiones = 0 # Conexiones caidas que se reemplazaron por una nueva
+        self.desalojadas = 0 # Conexiones cerradas por exceder el tiempo maximo de inactividad
+
+    # Abre una nueva conexion con la base de datos
+    # Las conexiones viven mucho tiempo, el backend las abre con autocommit para que no queden leyendo siempre la misma instantanea de los datos
+    def crearconexion(self):
+        return self.backend.conectar()
+
+    # Cierra las conexiones libres que exceden el tiempo maximo de inactividad (se llama con el candado adquirido)
+    def desalojarinactivas(self):
+        ahora = time.monotonic()
+        vigentes = []
+
+        for (conn,liberada) in self.libres:
+            if ahora - liberada > self.tiempo_max_inactiva:
+                self.cerrarconexion(conn)
+                self.abiertas -= 1
+                self.desalojadas += 1
+            else:
+                vigentes.append((conn,liberada))
+
+        self.libres = vigentes
+
+    # Entrega una conexion del pool, reutilizando una libre o abriendo una nueva si no se ha llegado al limite
+    def obtener(self):
+        conn = None
+        liberada = 0
+
+        with self.condicion:
+            if self.cerrado:
+                raise self.backend.ErrorPool("El pool de conexiones esta cerrado")
+
+            self.desalojarinactivas()
+
+            # Si no hay conexiones libres ni espacio para abrir otra, se espera a que se devuelva alguna
+            if not self.libres and self.abiertas >= self.tamano_max:
+                self.esperas += 1
+                limite = time.monotonic() + self.tiempo_espera
+                while not self.libres and self.abiertas >= self.tamano_max:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise self.backend.ErrorPool("No hay conexiones libres despues de " + str(self.tiempo_espera) + " s")
+                    self.condicion.wait(restante)
+
+            if self.libres:
+                conn,liberada = self.libres.pop() # La conexion usada mas recientemente es la que tiene menos probabilidad de haber caducado
+                self.aciertos += 1
+            else:
+                self.abiertas += 1 # Se reserva el lugar antes de conectar para no rebasar el limite
+
+        if conn is None:
+            try:
+                conn = self.crearconexion()
+            except self.backend.Error:
+                self.liberarlugar()
+                raise
+            with self.condicion:
+                self.creadas += 1
+            return conn
+
+        # Las conexiones que estuvieron inactivas un rato se verifican antes de entregarse
+        if time.monotonic() - liberada > self.intervalo_verificacion:
+            try:
+                self.backend.verificar(conn)
+            except self.backend.Error:
+                self.cerrarconexion(conn)
+                try:
+                    conn = self.crearconexion()
+                except self.backend.Error:
+                    self.liberarlugar()
+                    raise
+                with self.condicion:
+                    self.reconexiones += 1
+
+        return conn
+
+    # Regresa una conexion al pool para que otra peticion la reutilice
+    def devolver(self,conn):
+        with self.condicion:
+            if self.cerrado:
+                self.cerrarconexion(conn)
+                self.abiertas -= 1
+            else:
+                self.libres.append((conn,time.monotonic()))
+            self.condicion.notify()
+
+    # Descarta una conexion que ya no es valida y libera su lugar en el pool
+    def descartar(self,conn):
+        self.cerrarconexion(conn)
+        self.liberarlugar()
+
+    # Libera el lugar de una conexion que no se pudo abrir o que se descarto
+    def liberarlugar(self):
+        with self.condicion:
+            self.abiertas -= 1
+            self.condicion.notify()
+
+    # Regresa los cursores preparados de una conexion del pool, que duran lo mismo que la conexion
+    # Solo los usa la peticion que tiene la conexion, asi que no necesitan candado
+    def sentencias(self,conn):
+        sentencias = self.preparadas.get(id(conn))
+        if sentencias is None:
+            sentencias = OrderedDict()
+            self.preparadas[id(conn)] = sentencias
+        return sentencias
+
+    # Cierra una conexion ignorando los errores de una conexion ya caida
+    # Sus cursores preparados se descartan junto con ella
+    def cerrarconexion(self,conn):
+        self.preparadas.pop(id(conn),None)
+        try:
+            conn.close()
+        except self.backend.Error:
+            pass
+
+    # Cierra todas las conexiones libres; las que esten en uso se cierran al devolverse
+    def cerrar(self):
+        with self.condicion:
+            self.cerrado = True
+            for (conn,liberada) in self.libres:
+                self.cerrarconexion(conn)
+                self.abiertas -= 1
+            self.libres = []
+            self.condicion.notify_all()
+
+    # Regresa los contadores del pool
+    def estadisticas(self):
+        with self.condicion:
+            return {
+                "abiertas": self.abiertas,
+                "libres": len(self.libres),
+                "tamano_max": self.tamano_max,
+                "aciertos": self.aciertos,
+                "creadas": self.creadas,
+                "esperas": self.esperas,
+                "reconexiones": self.reconexiones,
+                "desalojadas": self.desalojadas,
+            }
+
+if __name__ == '__main__': # Un ejemplo del funcionamiento de esta clase
+    pool = poolconexiones("fernando","pass1234","localhost",3306,"potencia")
+    conn = pool.obtener()
+    pool.devolver(conn)
+    conn = pool.obtener()
+    pool.devolver(conn)
+    print(pool.estadisticas())
+    pool.cerrar()
@@ -0,0 +1,64 @@
+# Clase: reducciondatos
+# Esta clase se encarga de reducir el numero de puntos de una serie de tiempo sin perder su forma (picos y caidas)
+# Por Fernando Daniel Ramirez
+
+
+class reducciondatos():
+
+    def __init__(self):
+        pass
+
+    # Selecciona "umbral" puntos de la serie (xs,ys) con el algoritmo Largest-Triangle-Three-Buckets (LTTB)
+    # La serie se divide en cubetas y de cada una se conserva el punto que forma el triangulo de mayor area con el punto
+    # elegido en la cubeta anterior y el promedio de la cubeta siguiente, por lo que los picos se conservan
+    # xs debe ser numerico y creciente. Regresa la lista de indices de los puntos seleccionados
+    def lttb(self,xs,ys,umbral):
+        n = len(xs)
+        if umbral >= n or umbral < 3: # No hay nada que reducir
+            return list(range(n))
+
+        cada = (n - 2) / (umbral - 2) # Tamano de cada cubeta, sin contar el primer y el ultimo punto
+        indices = [0] # El primer punto siempre se conserva
+        a = 0 # Indice del punto elegido en la cubeta anterior
+
+        for i in range(umbral - 2):
+            # Promedio de la cubeta siguiente
+            inicio_sig = int((i + 1) * cada) + 1
+            fin_sig = min(int((i + 2) * cada) + 1,n)
+            prom_x = 0.0
+            prom_y = 0.0
+            for j in range(inicio_sig,fin_sig):
+                prom_x += xs[j]
+                prom_y += ys[j]
+            prom_x /= (fin_sig - inicio_sig)
+            prom_y /= (fin_sig - inicio_sig)
+
+            # Punto de la cubeta actual con el triangulo de mayor area
+            inicio = int(i * cada) + 1
+            fin = int((i + 1) * cada) + 1
+            xa = xs[a]
+            ya = ys[a]
+            area_max = -1.0
+            elegido = inicio
+            for j in range(inicio,fin):
+                area = abs((xa - prom_x) * (ys[j] - ya) - (xa - xs[j]) * (prom_y - ya))
+                if area > area_max:
+                    area_max = area
+                    elegido = j
+
+            indices.append(elegido)
+            a = elegido
+
+        indices.append(n - 1) # El ultimo punto siempre se conserva
+
+        return indices
+
+if __name__ == '__main__': # Un ejemplo del funcionamiento de esta clase
+    red = reducciondatos()
+    xs = list(range(100))
+    ys = [24.0] * 100
+    ys[37] = 41.0 # Pico que debe conservarse
+    ys[71] = 11.0 # Caida que debe conservarse
+    indices = red.lttb(xs,ys,10)
+    print(indices)
+    print([ys[i] for i in indices])
@@ -0,0 +1,113 @@
+# Clase: reportes
+# Esta clase se encarga de generar, sin pantalla, los reportes de los patrones de consumo de los ordenadores a partir de la base de datos
+# Recorre las mediciones de cada ordenador en orden con el mismo analisis que se usa con las mediciones en linea (analisispatrones)
+# y por cada dia guarda una imagen PNG con la potencia, su linea base, los periodos en uso, los picos y caidas, y la energia por hora
+# Los eventos y los perfiles diarios se guardan ademas en eventos.jsonl y perfiles.jsonl, con el mismo formato que se publica por MQTT
+# Solo se tiene en memoria un dia de mediciones de un ordenador a la vez
+# Uso: python reportes.py [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD] [--directorio DIR] [TABLA ...]
+# Por Fernando Daniel Ramirez
+
+import matplotlib
+matplotlib.use("Agg") # Sin pantalla; se debe elegir antes de importar pyplot (graficador)
+
+from graficador import graficador
+from analisispatrones import analisispatrones
+from conexionDB import conexionDB
+from extraerdatosDB import DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO, DB_NOMBRE, crearbackend
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+
+
+class reportes():
+
+    # El constructor recibe el conector (conexionDB) de la base de datos y el directorio donde se guardan los reportes
+    def __init__(self,connDB,directorio="reportes",analisis=None):
+        if analisis is None:
+            analisis = analisispatrones()
+        self.connDB = connDB
+        self.directorio = directorio
+        self.analisis = analisis
+        self.graficador = graficador()
+
+        os.makedirs(directorio,exist_ok=True)
+        self.archivo_eventos = open(os.path.join(directorio,"eventos.jsonl"),"w")
+        self.archivo_perfiles = open(os.path.join(directorio,"perfiles.jsonl"),"w")
+
+    # Genera los reportes de los dias de "desde" a "hasta" (incluidos) de un ordenador
+    # Sin fechas se usan la primera y la ultima registradas en la tabla
+    # Regresa el numero de imagenes guardadas
+    def generar(self,table,desde=None,hasta=None):
+        primera,ultima = self.connDB.obtenerlimites(table)
+        dia = self.truncardia(desde if desde is not None else primera)
+        fin = self.truncardia(hasta if hasta is not None else ultima)
+
+        imagenes = 0
+        while dia <= fin:
+            siguiente = dia + timedelta(days=1)
+            columnas = self.connDB.obtenercolumnasentre(table,dia,siguiente)
+            if len(columnas) > 0:
+                self.generardia(table,dia,columnas)
+                imagenes += 1
+            dia = siguiente
+        return imagenes
+
+    # Analiza las mediciones de un dia de un ordenador y guarda su imagen
+    def generardia(self,table,dia,columnas):
+        bases = []
+        en_uso = []
+        picos = []
+        caidas = []
+        for (segundos,potencia,energia) in zip(columnas.segundos,columnas.potencias,columnas.energias):
+            eventos,perfiles = self.analisis.agregar(table,segundos,potencia,energia)
+            self.guardareventos(eventos,perfiles)
+            for evento in eventos:
+                if evento["tipo"] == "pico":
+                    picos.append((datetime.strptime(evento["fecha"],'%Y-%m-%d %H:%M:%S'),evento["potencia"]))
+                elif evento["tipo"] == "caida":
+                    caidas.append((datetime.strptime(evento["fecha"],'%Y-%m-%d %H:%M:%S'),evento["potencia"]))
+            base,desviacion,estado = self.analisis.resumen(table)
+            bases.append(base)
+            en_uso.append(estado == "uso")
+
+        perfil = self.analisis.perfil(table) # Hasta la ultima medicion del dia: el dia completo
+        energias_horas = [hora["energia"] if hora is not None else 0 for hora in perfil["horas"]]
+        titulo = f"{table} {dia:%Y-%m-%d}: {perfil['energia']:.3f} kWh, {perfil['picos']} pico(s), {perfil['caidas']} caida(s)"
+        archivo = os.path.join(self.directorio,f"{table}_{dia:%Y-%m-%d}.png")
+        self.graficador.guardar_reporte(archivo,titulo,columnas.fechas(),columnas.potencias,bases,en_uso,picos,caidas,energias_horas)
+
+    # Guarda los eventos y perfiles en sus archivos, uno por linea
+    def guardareventos(self,eventos,perfiles):
+        for evento in eventos:
+            self.archivo_eventos.write(json.dumps(evento) + "\n")
+        for perfil in perfiles:
+            self.archivo_perfiles.write(json.dumps(perfil) + "\n")
+
+    # Termina los periodos y perfiles abiertos y cierra los archivos
+    def cerrar(self):
+        eventos,perfiles = self.analisis.cerrar()
+        self.guardareventos(eventos,perfiles)
+        self.archivo_eventos.close()
+        self.archivo_perfiles.close()
+
+    # Trunca una fecha al inicio de su dia
+    def truncardia(self,date):
+        return datetime(date.year,date.month,date.day,0,0,0)
+
+if __name__ == '__main__': # Genera los reportes de las tablas de la base de datos configurada en extraerdatosDB
+    parser = argparse.ArgumentParser(description="Genera los reportes diarios de consumo de los ordenadores en imagenes PNG")
+    parser.add_argument("tablas",nargs="*",help="tablas de los ordenadores (por defecto todas)")
+    parser.add_argument("--desde",type=lambda texto: datetime.strptime(texto,'%Y-%m-%d'),help="primer dia, AAAA-MM-DD (por defecto el primero de cada tabla)")
+    parser.add_argument("--hasta",type=lambda texto: datetime.strptime(texto,'%Y-%m-%d'),help="ultimo dia, AAAA-MM-DD (por defecto el ultimo de cada tabla)")
+    parser.add_argument("--directorio",default="reportes",help="directorio donde se guardan los reportes")
+    args = parser.parse_args()
+
+    connDB = conexionDB(DB_USUARIO,DB_PASSWORD,DB_HOST,DB_PUERTO,DB_NOMBRE,backend=crearbackend())
+    tablas = args.tablas if len(args.tablas) > 0 else connDB.extraernombrestablas()
+
+    reporte = reportes(connDB,args.directorio)
+    for table in tablas:
+        print(f"{table}: {reporte.generar(table,args.desde,args.hasta)} reporte(s)")
+    reporte.cerrar()
+    connDB.cerrar()
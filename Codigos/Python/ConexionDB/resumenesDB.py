@@ -0,0 +1,227 @@
+# Clase: resumenesDB
+# Esta clase se encarga de mantener resumenes por hora y por dia de la potencia y energia de cada tabla,
+# y de consultarlos para no recorrer todos los registros de ventanas largas
+# Por Fernando Daniel Ramirez
+
+from conexionDB import SEGUNDOS_2000
+from datetime import datetime, timedelta
+
+# Columnas que se reemplazan cuando se vuelve a resumir un periodo que ya existe
+COLUMNAS_RESUMEN = ["muestras","potencia_min","potencia_suma","potencia_max","energia"]
+
+
+class resumenesDB():
+
+    # El constructor recibe el conector a la base de datos (conexionDB) con el que se leen y escriben los resumenes
+    # Las partes de las querys propias del motor de base de datos se toman del backend del conector
+    def __init__(self,connDB):
+        self.connDB = connDB
+        self.backend = connDB.backend
+
+    # Crea las tablas de resumenes si no existen
+    def creartablas(self):
+        cur = self.connDB.conn.cursor()
+        try:
+            cur.execute(self.backend.sqlcrearresumen("resumen_hora"))
+            cur.execute(self.backend.sqlcrearresumen("resumen_dia"))
+            # Energia acumulada de la tabla desde su primer registro hasta el final de cada hora (punto de control)
+            # Con ella la energia acumulada en cualquier fecha es la de la hora anterior mas la suma de los registros de la hora en curso
+            self.backend.agregarcolumna(cur,"resumen_hora","energia_acumulada","double DEFAULT NULL")
+        finally:
+            cur.close()
+
+    # Pone al dia los resumenes de todas las tablas de la base de datos (al iniciar el servicio)
+    def actualizartodas(self):
+        self.creartablas()
+        for table in self.connDB.extraernombrestablas():
+            self.actualizar(table)
+
+    # Pone al dia los resumenes de una tabla
+    # Solo se vuelven a calcular la ultima hora y el ultimo dia resumidos (que pudieron estar incompletos) y los posteriores,
+    # por lo que el costo depende de los registros nuevos y no del tamano de la tabla
+    # desde: opcional, fecha del registro mas antiguo escrito desde la ultima actualizacion; si cae en horas ya resumidas
+    # (registros del archivo de respaldo o que llegaron tarde) se vuelven a calcular desde su hora, incluida la energia acumulada
+    # Regresa True si se volvieron a calcular horas anteriores a la ultima resumida (los resultados ya calculados de la tabla cambiaron)
+    def actualizar(self,table,desde=None):
+        with self.connDB.traza.medir("sql"): # Las querys de los resumenes se miden en la traza de la peticion
+            nombre = self.connDB.nombretabla(table)
+
+            cur = self.connDB.ejecutar("SELECT MAX(inicio) FROM resumen_hora WHERE tabla = ?",(table,))
+            ultima_hora = None
+            for (inicio,) in cur:
+                ultima_hora = self.backend.afecha(inicio)
+            if ultima_hora is None: # La tabla nunca se ha resumido
+                ultima_hora = datetime(1000,1,1,0,0,0)
+            atrasados = desde is not None and self.truncarhora(desde) < ultima_hora
+            if atrasados:
+                ultima_hora = self.truncarhora(desde)
+
+            # Resumen por hora a partir de los registros de la tabla
+            actualizar_resumen = self.backend.sqlactualizarresumen(COLUMNAS_RESUMEN)
+            self.connDB.ejecutar("INSERT INTO resumen_hora (tabla,inicio,muestras,potencia_min,potencia_suma,potencia_max,energia)" +
+                                 " SELECT ?," + self.backend.hora("fecha") + " AS hora,COUNT(*),MIN(potencia),SUM(potencia),MAX(potencia),SUM(energia)" +
+                                 " FROM " + nombre + " WHERE fecha >= ? GROUP BY hora" + actualizar_resumen,(table,ultima_hora))
+
+            # Resumen por dia a partir del resumen por hora
+            ultimo_dia = self.truncardia(ultima_hora)
+            self.connDB.ejecutar("INSERT INTO resumen_dia (tabla,inicio,muestras,potencia_min,potencia_suma,potencia_max,energia)" +
+                                 " SELECT tabla," + self.backend.dia("inicio") + " AS dia,SUM(muestras),MIN(potencia_min),SUM(potencia_suma),MAX(potencia_max),SUM(energia)" +
+                                 " FROM resumen_hora WHERE tabla = ? AND inicio >= ? GROUP BY tabla,dia" + actualizar_resumen,(table,ultimo_dia))
+
+            self.actualizaracumulada(table,ultima_hora)
+        return atrasados
+
+    # Calcula la energia acumulada de las horas resumidas desde "ultima_hora", continuando la de la hora anterior
+    # Las horas que aun no tienen energia acumulada (resumenes creados antes de existir la columna) tambien se calculan
+    def actualizaracumulada(self,table,ultima_hora):
+        cur = self.connDB.ejecutar("SELECT MIN(inicio) FROM resumen_hora WHERE tabla = ? AND energia_acumulada IS NULL",(table,))
+        for (inicio,) in cur:
+            inicio = self.backend.afecha(inicio)
+            if inicio is not None and inicio < ultima_hora:
+                ultima_hora = inicio
+
+        acumulada = 0.0
+        cur = self.connDB.ejecutar("SELECT energia_acumulada FROM resumen_hora WHERE tabla = ? AND inicio < ? ORDER BY inicio DESC LIMIT 1",(table,ultima_hora))
+        for (energia,) in cur:
+            acumulada = float(energia)
+
+        cur = self.connDB.ejecutar("SELECT inicio,energia FROM resumen_hora WHERE tabla = ? AND inicio >= ? ORDER BY inicio",(table,ultima_hora))
+        filas = []
+        for (inicio,energia) in cur.fetchall():
+            acumulada += float(energia)
+            filas.append((acumulada,table,inicio))
+
+        if len(filas) > 0:
+            cur = self.connDB.conn.cursor()
+            try:
+                cur.executemany("UPDATE resumen_hora SET energia_acumulada = ? WHERE tabla = ? AND inicio = ?",filas)
+            finally:
+                cur.close()
+
+    # Regresa la hora desde la que los resumenes de una tabla pueden estar incompletos: la ultima hora resumida
+    # (que pudo resumirse antes de terminar) o None si la tabla no se ha resumido
+    # Los resumenes se ponen al dia al escribir los registros (ingestaMQTT) y periodicamente (conexionMQTT), no en las peticiones
+    def ultimahora(self,table):
+        with self.connDB.traza.medir("sql"):
+            cur = self.connDB.ejecutar("SELECT MAX(inicio) FROM resumen_hora WHERE tabla = ?",(table,))
+            filas = cur.fetchall()
+        for (inicio,) in filas:
+            return self.backend.afecha(inicio)
+        return None
+
+    # Divide la ventana [date1,date2] en segmentos que se leen de la fuente mas gruesa posible:
+    # registros de la tabla en los extremos, horas completas del resumen por hora y dias completos del resumen por dia
+    # limite: hora desde la que los resumenes pueden estar incompletos (ultimahora); de ahi en adelante se leen los registros
+    # Regresa una lista de (fuente, inicio, fin, incluir_fin)
+    def segmentos(self,date1,date2,usar_dias=True,limite=None):
+        if limite is None: # Sin resumenes se leen todos los registros
+            return [("crudo",date1,date2,True)]
+        hora1 = self.truncarhora(date1)
+        if hora1 < date1:
+            hora1 += timedelta(hours=1)
+        hora2 = min(self.truncarhora(date2),limite)
+
+        if hora1 >= hora2: # La ventana no contiene ninguna hora completa
+            return [("crudo",date1,date2,True)]
+
+        segmentos = []
+        if date1 < hora1:
+            segmentos.append(("crudo",date1,hora1,False))
+
+        dia1 = self.truncardia(hora1)
+        if dia1 < hora1:
+            dia1 += timedelta(days=1)
+        dia2 = self.truncardia(hora2)
+
+        if usar_dias and dia1 < dia2:
+            if hora1 < dia1:
+                segmentos.append(("hora",hora1,dia1,False))
+            segmentos.append(("dia",dia1,dia2,False))
+            if dia2 < hora2:
+                segmentos.append(("hora",dia2,hora2,False))
+        else:
+            segmentos.append(("hora",hora1,hora2,False))
+
+        segmentos.append(("crudo",hora2,date2,True))
+
+        return segmentos
+
+    # Trunca una fecha al inicio de su hora
+    def truncarhora(self,date):
+        return datetime(date.year,date.month,date.day,date.hour,0,0)
+
+    # Trunca una fecha al inicio de su dia
+    def truncardia(self,date):
+        return datetime(date.year,date.month,date.day,0,0,0)
+
+    # Construye una query que une los segmentos de la ventana con las mismas columnas:
+    # fecha, numero de muestras, potencia minima, suma de potencias, potencia maxima y energia
+    def queryunion(self,table,segmentos):
+        partes = []
+        parametros = []
+
+        for (fuente,inicio,fin,incluir_fin) in segmentos:
+            comparacion_fin = " <= ?" if incluir_fin else " < ?"
+            if fuente == "crudo":
+                partes.append("SELECT fecha AS t,1 AS muestras,potencia AS pmin,potencia AS psuma,potencia AS pmax,energia AS e FROM " + self.connDB.nombretabla(table) +
+                              " WHERE fecha >= ? AND fecha" + comparacion_fin)
+                parametros += [inicio,fin]
+            else:
+                partes.append("SELECT inicio AS t,muestras,potencia_min AS pmin,potencia_suma AS psuma,potencia_max AS pmax,energia AS e FROM resumen_" + fuente +
+                              " WHERE tabla = ? AND inicio >= ? AND inicio" + comparacion_fin)
+                parametros += [table,inicio,fin]
+
+        return " UNION ALL ".join(partes),parametros
+
+    # Extrae datos agrupados en cubetas de "ancho" segundos entre date1 y date2, leyendo los resumenes donde es posible
+    # El ancho debe ser multiplo de una hora para que ninguna hora resumida quede repartida entre dos cubetas
+    # Regresa las mismas listas que conexionDB.obtenerdatosagrupados
+    def obtenerdatosagrupados(self,table,date1,date2,ancho):
+        segmentos = self.segmentos(date1,date2,ancho % 86400 == 0,self.ultimahora(table))
+        union,parametros = self.queryunion(table,segmentos)
+
+        with self.connDB.traza.medir("sql"):
+            cur = self.connDB.ejecutar("SELECT MIN(t),MAX(t),MIN(pmin),SUM(psuma)/SUM(muestras),MAX(pmax),SUM(e) FROM (" + union + ") AS s" +
+                                       " GROUP BY " + self.backend.divisionentera(self.backend.segundos("t") + " - " + str(SEGUNDOS_2000),ancho) +
+                                       " ORDER BY 1",parametros) # Se ejecuta la query
+
+        return self.connDB.extraerdatosagrupados(cur)
+
+    # Obtiene la energia acumulada (en J) de todos los registros de la tabla anteriores a la fecha recibida
+    # Se toma la energia acumulada de la ultima hora resumida antes de la hora de la fecha y se suman solo los registros de esa hora
+    # Si los resumenes aun no llegan a la hora de la fecha, se suman los registros desde la ultima hora resumida
+    def energiaacumulada(self,table,date):
+        hora = self.truncarhora(date)
+        limite = self.ultimahora(table)
+        if limite is None:
+            hora = datetime(1000,1,1,0,0,0) # Sin resumenes se suman todos los registros
+        elif limite < hora:
+            hora = limite
+
+        with self.connDB.traza.medir("sql"):
+            cur = self.connDB.ejecutar("SELECT (SELECT energia_acumulada FROM resumen_hora WHERE tabla = ? AND inicio < ? ORDER BY inicio DESC LIMIT 1)," +
+                                       " (SELECT SUM(energia) FROM " + self.connDB.nombretabla(table) + " WHERE fecha >= ? AND fecha < ?)",(table,hora,hora,date))
+            filas = cur.fetchall()
+
+        energia = 0.0
+        for (acumulada,resto) in filas:
+            if acumulada is not None:
+                energia += float(acumulada)
+            if resto is not None:
+                energia += float(resto)
+
+        return energia
+
+    # Obtiene la suma de la energia (en J) registrada entre date1 y date2, leyendo los resumenes donde es posible
+    def energiaentre(self,table,date1,date2):
+        union,parametros = self.queryunion(table,self.segmentos(date1,date2,True,self.ultimahora(table)))
+        with self.connDB.traza.medir("sql"):
+            cur = self.connDB.ejecutar("SELECT SUM(e) FROM (" + union + ") AS s",parametros) # Se ejecuta la query
+            filas = cur.fetchall()
+
+        energia = 0.0
+        for (suma,) in filas:
+            if suma is not None:
+                energia = float(suma)
+
+        return energia